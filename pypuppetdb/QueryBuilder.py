@@ -298,6 +298,9 @@ class InOperator:
     def add_array(self, values):
         if self.query is not None:
             raise APIError("Only one array is supported by the InOperator")
+        elif isinstance(values, Placeholder):
+            self.query = True
+            self.arr.append(["array", values])
         elif isinstance(values, list):
 
             def depth(a_list):
@@ -357,6 +360,7 @@ class FromOperator:
             "fact_contents",
             "fact_names",
             "fact_paths",
+            "inventory",
             "nodes",
             "producers",
             "reports",
@@ -733,3 +737,106 @@ class NotOperator(BooleanOperator):
         elif isinstance(query, list) and len(query) > 1:
             raise APIError("This operator only accept one query string")
         super().add(query)
+
+
+class Placeholder:
+    """
+    A named placeholder for a value in a query that is prepared once with
+    :class:`~pypuppetdb.QueryBuilder.PreparedQuery` and then run many
+    times with different values.
+
+    Placeholders can be used as the value of any binary operator and as
+    the array of an :class:`~pypuppetdb.QueryBuilder.InOperator`.
+
+    :param name: The name of the placeholder, used when binding values.
+    :type name: :obj:`str`
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"Placeholder: {self.name}"
+
+
+class PreparedQuery:
+    """
+    A query with named placeholders that is serialized only once. Binding
+    values to the placeholders then only has to serialize the values
+    themselves and paste them in between the pre-serialized parts of the
+    query, instead of rebuilding the operator tree and serializing it all
+    over again.
+
+    In order to run the following query for many nodes:
+
+    ["and", ["=", "certname", <node>], ["=", "latest_report?", true]]
+
+    The following code can be used.
+
+    op = AndOperator()
+    op.add(EqualsOperator("certname", Placeholder("certname")))
+    op.add(EqualsOperator("latest_report?", True))
+    prepared = PreparedQuery(op)
+    db.reports(query=prepared.bind(certname="node1.example.com"))
+
+    :param query: The query, containing one or more placeholders.
+    :type query: any operator object
+    """
+
+    # placeholders are serialized as this marker, wrapped in NUL characters
+    # which don't show up in real queries
+    _MARKER = "\x00pypuppetdb-placeholder-{}\x00"
+
+    def __init__(self, query):
+        names = []
+
+        def placeholder(value):
+            if isinstance(value, Placeholder):
+                names.append(value.name)
+                return self._MARKER.format(len(names) - 1)
+            raise TypeError(
+                f"Object of type {type(value).__name__} is not JSON serializable"
+            )
+
+        serialized = json.dumps(query.json_data(), default=placeholder)
+
+        self.names = names
+        self.parts = []
+        rest = serialized
+        for i in range(len(names)):
+            before, rest = rest.split(json.dumps(self._MARKER.format(i)), 1)
+            self.parts.append(before)
+        self.parts.append(rest)
+
+        self._unique_names = frozenset(names)
+        self._slots = list(zip(names, self.parts[1:]))
+        self._encode = json.JSONEncoder(default=str).encode
+
+    def __repr__(self):
+        return f"Query: {self}"
+
+    def __str__(self):
+        return "?".join(self.parts)
+
+    def bind(self, **values):
+        """Get the serialized query with the values filled in.
+
+        :param values: A value for every placeholder, by name.
+
+        :returns: The serialized query, usable as the `query` of any\
+            PuppetDB call.
+        :rtype: :obj:`str`
+        """
+        if values.keys() != self._unique_names:
+            missing = self._unique_names - values.keys()
+            if missing:
+                raise APIError(f"No value given for placeholders {sorted(missing)}")
+            unknown = values.keys() - self._unique_names
+            raise APIError(f"Unknown placeholders: {sorted(unknown)}")
+
+        encode = self._encode
+        result = [self.parts[0]]
+        for name, part in self._slots:
+            result.append(encode(values[name]))
+            result.append(part)
+        return "".join(result)
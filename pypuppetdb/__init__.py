@@ -73,6 +73,15 @@ def connect(
     username=None,
     password=None,
     token=None,
+    object_cache=None,
+    max_in_values=1000,
+    query_workers=4,
+    query_guard=None,
+    response_cache=None,
+    compress_commands=False,
+    facts_suppressor=None,
+    request_metrics=None,
+    request_hooks=None,
 ):
     """Connect with PuppetDB. This will return an object allowing you
     to query the API through its methods.
@@ -116,6 +125,52 @@ def connect(
 
     :param token: (optional) The x-auth token to use for X-Authentication
     :type token: :obj:`None` or :obj:`string`
+
+    :param object_cache: (optional) A cache for objects that never change\
+            once stored in PuppetDB, such as reports, their events and\
+            catalogs.
+    :type object_cache: :obj:`None` or\
+            :class:`pypuppetdb.cache.ImmutableCache`
+
+    :param max_in_values: (Default: 1000) Queries with an `in` array of\
+            more values than this are split into several queries with at\
+            most this many values each, whose results are merged. `None`\
+            disables splitting.
+    :type max_in_values: :obj:`None` or :obj:`int`
+
+    :param query_workers: (Default: 4) Number of split queries to run\
+            concurrently.
+    :type query_workers: :obj:`int`
+
+    :param query_guard: (optional) A guard that rejects, warns about or\
+            pages queries that may return huge result sets.
+    :type query_guard: :obj:`None` or :class:`pypuppetdb.guard.QueryGuard`
+
+    :param response_cache: (optional) A persistent cache for the results\
+            of the queries to some endpoints, that can be shared between\
+            processes.
+    :type response_cache: :obj:`None` or\
+            :class:`pypuppetdb.cache.ResponseCache`
+
+    :param compress_commands: (Default: `False`) Gzip the bodies of\
+            commands, which makes big catalogs and reports much smaller\
+            on the wire.
+    :type compress_commands: :obj:`bool`
+
+    :param facts_suppressor: (optional) Skips `replace facts` commands\
+            whose facts didn't change since they were last submitted.
+    :type facts_suppressor: :obj:`None` or\
+            :class:`pypuppetdb.suppression.FactsSuppressor`
+
+    :param request_metrics: (optional) Collects the latency and outcome\
+            of every request to PuppetDB.
+    :type request_metrics: :obj:`None` or\
+            :class:`pypuppetdb.exporter.RequestMetrics`
+
+    :param request_hooks: (optional) Callables that are called with a\
+            :class:`~pypuppetdb.hooks.RequestEvent` for every finished\
+            request, with the timings of its phases.
+    :type request_hooks: :obj:`None` or :obj:`list`
     """
     return API(
         host=host,
@@ -129,4 +184,13 @@ def connect(
         username=username,
         password=password,
         token=token,
+        object_cache=object_cache,
+        max_in_values=max_in_values,
+        query_workers=query_workers,
+        query_guard=query_guard,
+        response_cache=response_cache,
+        compress_commands=compress_commands,
+        facts_suppressor=facts_suppressor,
+        request_metrics=request_metrics,
+        request_hooks=request_hooks,
     )
@@ -1,10 +1,21 @@
+import contextlib
+import functools
+import heapq
+import itertools
 import json
 import logging
-from urllib.parse import quote
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote, urlsplit
 
 import requests
 
-from pypuppetdb.errors import APIError, EmptyResponseError
+from pypuppetdb.errors import APIError, EmptyResponseError, UnboundedQueryError
+from pypuppetdb.hooks import RequestEvent, TimingAdapter, dispatch
+from pypuppetdb.interning import get_pool
+from pypuppetdb.optimizer import split_in_ast
+from pypuppetdb.shape import query_shape
 
 log = logging.getLogger(__name__)
 
@@ -62,6 +73,138 @@ ERROR_STRINGS = {
     "refused": "Could not reach PuppetDB on",
 }
 
+# the fields that together identify a result of an endpoint, paged
+# queries are ordered by them so that no result is skipped or repeated
+UNIQUE_FIELDS = {
+    "catalogs": ["certname"],
+    "edges": [
+        "certname",
+        "relationship",
+        "source_type",
+        "source_title",
+        "target_type",
+        "target_title",
+    ],
+    "environments": ["name"],
+    "events": [
+        "report",
+        "resource_type",
+        "resource_title",
+        "property",
+        "timestamp",
+    ],
+    "fact-contents": ["certname", "path"],
+    "fact-paths": ["path"],
+    "facts": ["certname", "name"],
+    "factsets": ["certname"],
+    "inventory": ["certname"],
+    "nodes": ["certname"],
+    "reports": ["hash"],
+    "resources": ["certname", "type", "title"],
+}
+
+
+# marks the end of the results in _construct
+_DONE = object()
+
+# the endpoints by their paths, longest first so that eg. `nodes` is
+# matched before `pql`, whose path is a prefix of it
+_ENDPOINT_PATHS = sorted(
+    ((path, endpoint) for endpoint, path in ENDPOINTS.items()),
+    key=lambda item: len(item[0]),
+    reverse=True,
+)
+
+
+@functools.lru_cache(maxsize=1024)
+def _endpoint_of_path(path):
+    for prefix, endpoint in _ENDPOINT_PATHS:
+        index = path.find("/" + prefix)
+        if index == -1:
+            continue
+        end = index + len(prefix) + 1
+        if end == len(path) or path[end] == "/":
+            return endpoint
+    return "other"
+
+
+def endpoint_name(url):
+    """Get the endpoint a URL is for, eg. ``nodes`` for
+    ``http://localhost:8080/pdb/query/v4/nodes/node1/facts``, or ``other``.
+
+    :rtype: :obj:`string`
+    """
+    return _endpoint_of_path(urlsplit(url).path)
+
+
+def _order_key(value):
+    # PuppetDB sorts nulls last
+    return (value is None, value)
+
+
+class _Descending:
+    """Inverts the order of a sort key, for fields ordered descending."""
+
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+
+def _order_fields(order_by):
+    """Get the (field, descending) tuples of an `order_by`, or `None` if
+    it can't be understood."""
+    if isinstance(order_by, str):
+        try:
+            order_by = json.loads(order_by)
+        except ValueError:
+            return None
+    if isinstance(order_by, dict):
+        order_by = [order_by]
+    try:
+        return [
+            (order["field"], str(order.get("order", "asc")).lower() == "desc")
+            for order in order_by
+        ]
+    except (KeyError, TypeError, AttributeError):
+        return None
+
+
+def _order_function(order_by):
+    """Get a key function that orders results the way PuppetDB would with
+    `order_by`, or `None` if it can't be understood."""
+    fields = _order_fields(order_by)
+    if fields is None:
+        log.warning(f"Could not order merged results by {order_by}")
+        return None
+
+    def key(result):
+        return tuple(
+            (
+                _Descending(_order_key(result.get(field)))
+                if descending
+                else _order_key(result.get(field))
+            )
+            for field, descending in fields
+        )
+
+    return key
+
+
+def _merge_ordered(chunks, order_by):
+    """Merges results that are each ordered by `order_by` into one ordered
+    stream, without sorting them again."""
+    key = _order_function(order_by)
+    if key is None:
+        return itertools.chain.from_iterable(chunks)
+    return heapq.merge(*chunks, key=key)
+
 
 class BaseAPI:
     """This is a Base or Abstract class and is not meant to be instantiated
@@ -119,6 +262,52 @@ class BaseAPI:
     :param metric_api_version: (Default 'v2') Version of the metric API we're initialising.
     :type metric_api_version: :obj:`None` or :obj:`string`
 
+    :param object_cache: (optional) A cache for objects that never change\
+            once stored in PuppetDB, such as reports, their events and\
+            catalogs.
+    :type object_cache: :obj:`None` or\
+            :class:`pypuppetdb.cache.ImmutableCache`
+
+    :param max_in_values: (Default: 1000) Queries with an `in` array of\
+            more values than this are split into several queries with at\
+            most this many values each, whose results are merged. `None`\
+            disables splitting.
+    :type max_in_values: :obj:`None` or :obj:`int`
+
+    :param query_workers: (Default: 4) Number of split queries to run\
+            concurrently.
+    :type query_workers: :obj:`int`
+
+    :param query_guard: (optional) A guard that rejects, warns about or\
+            pages queries that may return huge result sets.
+    :type query_guard: :obj:`None` or :class:`pypuppetdb.guard.QueryGuard`
+
+    :param response_cache: (optional) A persistent cache for the results\
+            of the queries to some endpoints, that can be shared between\
+            processes.
+    :type response_cache: :obj:`None` or\
+            :class:`pypuppetdb.cache.ResponseCache`
+
+    :param compress_commands: (Default: `False`) Gzip the bodies of\
+            commands, which makes big catalogs and reports much smaller\
+            on the wire.
+    :type compress_commands: :obj:`bool`
+
+    :param facts_suppressor: (optional) Skips `replace facts` commands\
+            whose facts didn't change since they were last submitted.
+    :type facts_suppressor: :obj:`None` or\
+            :class:`pypuppetdb.suppression.FactsSuppressor`
+
+    :param request_metrics: (optional) Collects the latency and outcome\
+            of every request to PuppetDB.
+    :type request_metrics: :obj:`None` or\
+            :class:`pypuppetdb.exporter.RequestMetrics`
+
+    :param request_hooks: (optional) Callables that are called with a\
+            :class:`~pypuppetdb.hooks.RequestEvent` for every finished\
+            request, see :meth:`add_request_hook`.
+    :type request_hooks: :obj:`None` or :obj:`list`
+
     :raises: :class:`~pypuppetdb.errors.ImproperlyConfiguredError`
     """
 
@@ -136,6 +325,15 @@ class BaseAPI:
         password=None,
         token=None,
         metric_api_version=None,
+        object_cache=None,
+        max_in_values=1000,
+        query_workers=4,
+        query_guard=None,
+        response_cache=None,
+        compress_commands=False,
+        facts_suppressor=None,
+        request_metrics=None,
+        request_hooks=None,
     ):
         """Initialises our BaseAPI object passing the parameters needed in
         order to be able to create the connection strings, set up SSL and
@@ -155,6 +353,17 @@ class BaseAPI:
         self.ssl_cert = ssl_cert
         self.timeout = timeout
         self.token = token
+        self.object_cache = object_cache
+        self.max_in_values = max_in_values
+        self.query_workers = query_workers
+        self.query_guard = query_guard
+        self.response_cache = response_cache
+        self.compress_commands = compress_commands
+        self.facts_suppressor = facts_suppressor
+        self.request_metrics = request_metrics
+        self.request_hooks = []
+        # per-thread state of the last request, for concurrent queries
+        self._local = threading.local()
 
         # Standardise the URL path to a format similar to /puppetdb
         if url_path:
@@ -181,6 +390,9 @@ class BaseAPI:
         if self.token:
             self.session.headers["X-Authentication"] = self.token
 
+        for hook in request_hooks or ():
+            self.add_request_hook(hook)
+
         if protocol is not None:
             protocol = protocol.lower()
             if protocol not in ["http", "https"]:
@@ -193,6 +405,106 @@ class BaseAPI:
         else:
             self.protocol = "http"
 
+    def add_request_hook(self, hook):
+        """Adds a hook that is called with a
+        :class:`~pypuppetdb.hooks.RequestEvent`, with the timings of every
+        phase of the request, once a request is finished.
+
+        Requests are only timed while there are hooks, without any they
+        cost nothing. Responses taken from the `response_cache` are not
+        requests, hooks never see them.
+
+        :param hook: The hook.
+        :type hook: :obj:`callable`
+        """
+        if not self.request_hooks:
+            # time connecting, which requests doesn't
+            self.session.mount("http://", TimingAdapter())
+            self.session.mount("https://", TimingAdapter())
+        self.request_hooks.append(hook)
+
+    def remove_request_hook(self, hook):
+        """Removes a hook added with :meth:`add_request_hook`."""
+        self.request_hooks.remove(hook)
+
+    def _request_event(self, url, request_method, payload):
+        """Get a new :class:`~pypuppetdb.hooks.RequestEvent` for a request."""
+        endpoint = endpoint_name(url)
+        shape = None
+        if isinstance(payload, dict):
+            shape = query_shape(payload.get("query"), pql=endpoint == "pql")
+        return RequestEvent(request_method.upper(), url, endpoint, shape)
+
+    def _emit(self, event):
+        """Passes an event to the hooks, or holds it until the objects built
+        from its results are, see :meth:`_held_events`."""
+        held = getattr(self._local, "held", None)
+        if held is not None:
+            held.append(event)
+        else:
+            dispatch(self.request_hooks, event)
+
+    @contextlib.contextmanager
+    def _held_events(self):
+        """Holds the events of the requests made in the block, so that the
+        time spent building objects from their results can be added to them
+        by :meth:`_construct`. Yields `None` if there are no hooks."""
+        if not self.request_hooks:
+            yield None
+            return
+        outer = getattr(self._local, "held", None)
+        held = self._local.held = []
+        try:
+            yield held
+        except Exception:
+            # there are no objects to build, the events are done
+            self._local.held = outer
+            for event in held:
+                self._emit(event)
+            raise
+        finally:
+            self._local.held = outer
+
+    def _construct(self, events, results, build):
+        """Yields the objects built with `build` from every result.
+
+        The held `events` are passed to the hooks once the objects are built
+        from their results, with the time it took. Results that are fetched
+        while they are iterated over, eg. page by page, have the events of
+        their requests held the same way: the events of a page are passed
+        on when the next one comes in, or the generator is exhausted or
+        closed."""
+        if events is None:
+            for result in results:
+                yield build(result)
+            return
+
+        results = iter(results)
+        elapsed = 0.0
+        try:
+            while True:
+                with self._held_events() as fetched:
+                    result = next(results, _DONE)
+                if fetched:
+                    # a new page, the results of the previous one are built
+                    self._constructed(events, elapsed)
+                    events, elapsed = fetched, 0.0
+                if result is _DONE:
+                    break
+                start = time.perf_counter()
+                built = build(result)
+                elapsed += time.perf_counter() - start
+                yield built
+        finally:
+            self._constructed(events, elapsed)
+
+    def _constructed(self, events, elapsed):
+        """Passes events to the hooks, with the `elapsed` seconds it took
+        to build the objects from their results split between them."""
+        for event in events:
+            event.construct = elapsed / len(events)
+            dispatch(self.request_hooks, event)
+
     def disconnect(self):
         """Close all connections that this class opened up."""
         # If we don't explicitly close connections, we might cause other
@@ -305,6 +617,9 @@ class BaseAPI:
         count_filter=None,
         payload=None,
         request_method="GET",
+        stream=False,
+        cache=True,
+        split=True,
     ):
         """This method prepares a non-PQL query to PuppetDB. Actual making
         the HTTP request is done by _make_request().
@@ -338,11 +653,23 @@ class BaseAPI:
         :type count_filter: :obj:`string`
         :param payload: (optional) Arbitrary payload to send as part of the request.
         :type payload: :obj:`dict`
+        :param stream: (Default: `False`) Whether the results of a query\
+                split in several requests or pages may be given as they\
+                come in, instead of as a list.
+        :type stream: :obj:`bool`
+        :param cache: (Default: `True`) Whether the response may come from\
+                the `response_cache`, `False` for queries that must see\
+                the latest data.
+        :type cache: :obj:`bool`
+        :param split: (Default: `True`) Whether a query with more than\
+                `max_in_values` values in an `in` array may be split.
+        :type split: :obj:`bool`
 
         :raises: :class:`~pypuppetdb.errors.EmptyResponseError`
 
         :returns: The decoded response from PuppetDB
-        :rtype: :obj:`dict` or :obj:`list`
+        :rtype: :obj:`dict` or :obj:`list`, or a :obj:`generator` if `stream`\
+                is set
         """
 
         # inside the list comprehension the locals()'s value changes
@@ -368,6 +695,53 @@ class BaseAPI:
         if payload is None:
             payload = {}
 
+        if (
+            self.query_guard is not None
+            and path is None
+            and summarize_by is None
+            and count_by is None
+        ):
+            page_size = self.query_guard.check(endpoint, query=query, limit=limit)
+            if page_size is not None:
+                if endpoint not in UNIQUE_FIELDS:
+                    message = (
+                        f"Query to {endpoint} can not be paged, its results "
+                        "have no unique fields to order them by"
+                    )
+                    log.error(message)
+                    raise UnboundedQueryError(message)
+                results = self._query_paged(
+                    endpoint,
+                    page_size,
+                    order_by=order_by,
+                    query=query,
+                    offset=offset,
+                    include_total=include_total,
+                    payload=payload,
+                    request_method=request_method,
+                    split=split,
+                )
+                if limit is not None:
+                    results = itertools.islice(results, limit)
+                return results if stream else list(results)
+
+        queries = None
+        if split:
+            queries = self._split_query(endpoint, path, query, summarize_by, count_by)
+        if queries is not None:
+            results = self._query_split(
+                endpoint,
+                queries,
+                query=query,
+                order_by=order_by,
+                limit=limit,
+                offset=offset,
+                include_total=include_total,
+                payload=payload,
+                request_method=request_method,
+            )
+            return results if stream else list(results)
+
         url = self._url(endpoint, path=path)
         if query is not None:
             payload["query"] = query
@@ -386,7 +760,288 @@ class BaseAPI:
         if count_filter is not None:
             payload[PARAMETERS["counts_filter"]] = count_filter
 
-        return self._make_request(url, request_method, payload)
+        ttl = 0
+        if self.response_cache is not None and cache and not include_total:
+            ttl = self.response_cache.ttl_for(endpoint)
+        if ttl <= 0:
+            return self._make_request(url, request_method, payload)
+
+        key = self.response_cache.key(url, request_method, payload)
+        result = self.response_cache.get(key)
+        if result is None:
+            result = self._make_request(url, request_method, payload)
+            self.response_cache.set(key, result, ttl=ttl)
+        else:
+            self.last_total = None
+        return result
+
+    def _split_query(self, endpoint, path, query, summarize_by, count_by):
+        """Splits a query with an `in` array of more than `max_in_values`
+        values, which PuppetDB plans badly, into several smaller queries.
+
+        :returns: The queries, or `None` if the query should be sent as is.
+        :rtype: :obj:`list` of :obj:`string`
+        """
+        if (
+            not self.max_in_values
+            or query is None
+            or path is not None
+            # the results of counting queries can't be merged
+            or summarize_by is not None
+            or count_by is not None
+            or not ENDPOINTS.get(endpoint, "").startswith("pdb/query/")
+        ):
+            return None
+
+        if hasattr(query, "json_data"):
+            ast = query.json_data()
+        else:
+            try:
+                ast = json.loads(query)
+            except (TypeError, ValueError):
+                return None
+
+        queries = split_in_ast(ast, self.max_in_values)
+        if queries is None:
+            return None
+        log.debug(f"Splitting {endpoint} query into {len(queries)} queries")
+        return [json.dumps(q) for q in queries]
+
+    def _query_split(
+        self,
+        endpoint,
+        queries,
+        query=None,
+        order_by=None,
+        limit=None,
+        offset=None,
+        include_total=False,
+        payload=None,
+        request_method="GET",
+    ):
+        """Runs the queries from :meth:`_split_query` concurrently and
+        streams their merged results as if they came from a single query.
+
+        With `order_by` the results of the queries, which PuppetDB returns
+        each in that order, are merged with a heap instead of sorted again.
+        If they can't be compared, eg. as a field holds strings in some
+        results and numbers in others, the rest of the results comes from
+        the original `query`, run unsplit. Otherwise the results of every
+        query are yielded as soon as it is done.
+
+        :returns: The merged results.
+        :rtype: :obj:`generator`
+        """
+        # every query has to return enough results to fill the page on its own
+        chunk_limit = None
+        if limit is not None:
+            chunk_limit = limit + (offset or 0)
+
+        def run(query):
+            results = self._query(
+                endpoint,
+                query=query,
+                order_by=order_by,
+                limit=chunk_limit,
+                include_total=include_total,
+                payload=dict(payload),
+                request_method=request_method,
+            )
+            if isinstance(results, dict):
+                results = [results]
+            return results, self._local.last_total
+
+        def chunks():
+            workers = min(self.query_workers or 1, len(queries))
+            if workers == 1:
+                for query in queries:
+                    yield run(query)
+                return
+            executor = ThreadPoolExecutor(max_workers=workers)
+            futures = [executor.submit(run, query) for query in queries]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                # stopped early, don't run the queries that haven't started
+                for future in futures:
+                    future.cancel()
+                executor.shutdown()
+
+        def merged():
+            # the first result can only be known once all queries are done,
+            # only iterators are kept so that the results of every query are
+            # freed as soon as they are merged
+            done = [(iter(chunk), total) for chunk, total in chunks()]
+            if include_total:
+                self.last_total = str(sum(int(total or 0) for _, total in done))
+            else:
+                self.last_total = None
+            iterators = [iterator for iterator, _ in done]
+            del done
+            if order_by is None:
+                yield from itertools.chain.from_iterable(iterators)
+                return
+
+            count = 0
+            try:
+                for result in _merge_ordered(iterators, order_by):
+                    yield result
+                    count += 1
+            except TypeError as err:
+                if query is None:
+                    raise
+                log.warning(
+                    f"Could not merge the {endpoint} results by {order_by}, "
+                    f"running the query unsplit: {err}"
+                )
+                results = self._query(
+                    endpoint,
+                    query=query,
+                    order_by=order_by,
+                    limit=chunk_limit,
+                    payload=dict(payload),
+                    request_method=request_method,
+                    stream=True,
+                    split=False,
+                )
+                yield from itertools.islice(results, count, None)
+
+        if order_by is not None or include_total:
+            results = merged()
+        else:
+            self.last_total = None
+            results = itertools.chain.from_iterable(chunk for chunk, _ in chunks())
+
+        if offset or limit is not None:
+            start = offset or 0
+            results = itertools.islice(
+                results, start, None if limit is None else start + limit
+            )
+        return results
+
+    def _query_immutable(self, key, endpoint, final=None, **kwargs):
+        r"""Like :meth:`_query` but for results that can never change,
+        such as the events of a report. If an `object_cache` is configured
+        the result is only ever fetched from PuppetDB once, unless it is
+        empty, as the object may not have been stored yet.
+
+        :param key: The identity of the object, eg. ``events/<hash>``.
+        :type key: :obj:`string`
+        :param endpoint: The PuppetDB API endpoint we want to query.
+        :type endpoint: :obj:`string`
+        :param final: (optional) Called for an empty result, returns\
+            whether it is final and can be cached too.
+        :type final: :obj:`callable`
+        :param \**kwargs: The rest of the keyword arguments are passed
+                           to the _query function
+
+        :returns: The decoded response from PuppetDB
+        :rtype: :obj:`dict` or :obj:`list`
+        """
+        if self.object_cache is None:
+            return self._query(endpoint, **kwargs)
+
+        key = "{}?{}".format(key, json.dumps(kwargs, sort_keys=True, default=str))
+        return self.object_cache.get_or_set(
+            key, lambda: self._query(endpoint, **kwargs), final
+        )
+
+    def _query_paged(self, endpoint, page_size, order_by=None, **kwargs):
+        r"""Runs a query in pages of `page_size` results using `limit` and
+        `offset`, so that only one page at a time has to be held in memory.
+
+        PuppetDB needs a unique order for paging to be consistent, so the
+        results are ordered by the `UNIQUE_FIELDS` of the endpoint after
+        `order_by`. A query that is split as for :meth:`_query_split` is
+        paged per query, and the pages are merged.
+
+        :param endpoint: The PuppetDB API endpoint we want to query.
+        :type endpoint: :obj:`string`
+        :param page_size: The number of results per request.
+        :type page_size: :obj:`int`
+        :param order_by: (optional) Set the order parameters for the resultset.
+        :type order_by: :obj:`string`
+        :param \**kwargs: The rest of the keyword arguments are passed
+                           to the _query function
+
+        :raises: :class:`~pypuppetdb.errors.APIError` if there is no\
+            `order_by` and the endpoint has no `UNIQUE_FIELDS`.
+
+        :returns: A generator yielding the results one by one.
+        :rtype: :obj:`dict`
+        """
+        order_by = self._unique_order(endpoint, order_by)
+        offset = kwargs.pop("offset", None) or 0
+        payload = kwargs.pop("payload", None) or {}
+
+        queries = None
+        if kwargs.get("split", True):
+            queries = self._split_query(endpoint, None, kwargs.get("query"), None, None)
+        if queries is not None:
+            # paging the query as a whole would have every page re-read all
+            # the previous ones, see _query_split
+            chunks = [
+                self._query_paged(
+                    endpoint,
+                    page_size,
+                    order_by=order_by,
+                    payload=payload,
+                    **dict(kwargs, query=query),
+                )
+                for query in queries
+            ]
+            yield from itertools.islice(_merge_ordered(chunks, order_by), offset, None)
+            return
+
+        while True:
+            page = self._query(
+                endpoint,
+                order_by=order_by,
+                limit=page_size,
+                offset=offset,
+                payload=dict(payload),
+                cache=False,
+                **kwargs,
+            )
+            if isinstance(page, dict):
+                page = [page]
+            yield from page
+            if len(page) < page_size:
+                break
+            offset += page_size
+
+    @staticmethod
+    def _unique_order(endpoint, order_by=None):
+        """Completes `order_by` with the `UNIQUE_FIELDS` of the endpoint
+        that it doesn't order by yet.
+
+        :rtype: :obj:`string`
+        """
+        fields = _order_fields(order_by) if order_by is not None else []
+        if fields is None:
+            # can't be understood, leave it to PuppetDB
+            return order_by
+        unique = UNIQUE_FIELDS.get(endpoint)
+        if unique is None:
+            if order_by is None:
+                raise APIError(
+                    f"Can not page through {endpoint} without an order_by, "
+                    "its results have no unique fields"
+                )
+            return order_by
+        ordered = {field for field, _ in fields}
+        return json.dumps(
+            [
+                {"field": field, "order": "desc" if descending else "asc"}
+                for field, descending in fields
+            ]
+            + [
+                {"field": field, "order": "asc"}
+                for field in unique
+                if field not in ordered
+            ]
+        )
 
     def _make_request(self, url, request_method, payload):
         """
@@ -400,12 +1055,43 @@ class BaseAPI:
         :return: response body as JSON
                  or raises an EmptyResponseError exception if it's empty
         """
+        event = None
+        if self.request_hooks:
+            event = self._request_event(url, request_method, payload)
+        elif self.request_metrics is None:
+            return self._send_request(url, request_method, payload)
+
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = self._send_request(url, request_method, payload, event)
+            outcome = "success"
+            return result
+        except Exception as err:
+            if event is not None:
+                event.error = err
+            raise
+        finally:
+            if self.request_metrics is not None:
+                self.request_metrics.observe(
+                    url, request_method, outcome, time.perf_counter() - start
+                )
+            if event is not None:
+                self._emit(event)
+
+    def _send_request(self, url, request_method, payload, event=None):
+        """Makes the request for :meth:`_make_request`, timing its phases
+        into `event` if given."""
 
         if request_method.upper() not in ["GET", "POST"]:
             log.error(f"Only GET or POST supported, {request_method} unsupported")
             raise APIError
 
+        if event is not None:
+            event.started()
+
         try:
+            # with hooks the body is read separately to time its download
             if request_method.upper() == "GET":
                 r = self.session.get(
                     url,
@@ -413,6 +1099,7 @@ class BaseAPI:
                     verify=self.ssl_verify,
                     cert=(self.ssl_cert, self.ssl_key),
                     timeout=self.timeout,
+                    stream=event is not None,
                 )
             else:
                 r = self.session.post(
@@ -421,18 +1108,27 @@ class BaseAPI:
                     verify=self.ssl_verify,
                     cert=(self.ssl_cert, self.ssl_key),
                     timeout=self.timeout,
+                    stream=event is not None,
                 )
 
+            if event is not None:
+                event.received(r)
+                event.downloaded(r.content)
+
             r.raise_for_status()
 
             # get total number of results if requested with include-total
             # just a quick hack - needs improvement
-            if "X-Records" in r.headers:
-                self.last_total = r.headers["X-Records"]
-            else:
-                self.last_total = None
+            last_total = r.headers.get("X-Records")
+            self.last_total = self._local.last_total = last_total
 
-            json_body = r.json()
+            pool = get_pool()
+            if pool is not None:
+                json_body = r.json(object_pairs_hook=pool.object_pairs_hook)
+            else:
+                json_body = r.json()
+            if event is not None:
+                event.decoded(json_body)
             if json_body is not None:
                 return json_body
             else:
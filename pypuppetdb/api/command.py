@@ -1,14 +1,164 @@
+import contextlib
+import gzip
 import hashlib
 import json
 import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import requests
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
 
 from pypuppetdb.api.base import BaseAPI, COMMAND_VERSION, ERROR_STRINGS
 from pypuppetdb.errors import APIError, EmptyResponseError
+from pypuppetdb.suppression import facts_body
 
 log = logging.getLogger(__name__)
 
+# bodies smaller than this aren't worth compressing
+COMPRESS_MIN_SIZE = 1024
+
+
+class EncodedCommand:
+    """A command with its payload serialized to JSON once, so that its
+    checksum is computed over the exact bytes that are sent and a retry
+    doesn't serialize it again.
+
+    :param command: The command, one of `COMMAND_VERSION`.
+    :type command: :obj:`string`
+    :param payload: The payload, in wire format, specific to the command.
+    :type payload: :obj:`dict`
+    :param compress: (Default: `False`) Gzip the body if it is at least\
+        `COMPRESS_MIN_SIZE` bytes.
+    :type compress: :obj:`bool`
+    :param body: (optional) The payload already serialized to JSON.
+    :type body: :obj:`bytes`
+
+    :raises: :class:`~pypuppetdb.errors.APIError` if the command isn't\
+        supported.
+
+    :ivar body: The body to send.
+    :ivar checksum: The SHA-1 of the uncompressed body.
+    :ivar content_encoding: ``gzip`` if the body is compressed, else `None`.
+    """
+
+    def __init__(self, command, payload, compress=False, body=None):
+        if command not in COMMAND_VERSION:
+            log.error(
+                "Only {} supported, {} unsupported".format(
+                    list(COMMAND_VERSION.keys()), command
+                )
+            )
+            raise APIError
+        self.command = command
+        self.version = COMMAND_VERSION[command]
+        self.certname = payload["certname"]
+
+        if body is None:
+            body = json.dumps(payload, default=str).encode("utf-8")
+        self.checksum = hashlib.sha1(body).hexdigest()  # nosec
+        self.content_encoding = None
+        if compress and len(body) >= COMPRESS_MIN_SIZE:
+            body = gzip.compress(body, compresslevel=6)
+            self.content_encoding = "gzip"
+        self.body = body
+
+    def __repr__(self):
+        return f"<EncodedCommand: {self.command} {self.certname}>"
+
+    @classmethod
+    def restore(cls, params, body, content_encoding=None):
+        """Recreates an encoded command from its :attr:`params` and body,
+        eg. read back from a :class:`~pypuppetdb.spool.CommandSpool`,
+        without encoding the payload again."""
+        encoded = cls.__new__(cls)
+        encoded.command = params["command"]
+        encoded.version = params["version"]
+        encoded.certname = params["certname"]
+        encoded.checksum = params["checksum"]
+        encoded.content_encoding = content_encoding
+        encoded.body = body
+        return encoded
+
+    @property
+    def params(self):
+        """The query string parameters of the command."""
+        return {
+            "command": self.command,
+            "version": self.version,
+            "certname": self.certname,
+            "checksum": self.checksum,
+        }
+
+
+class CommandResult:
+    """The outcome of one of the commands sent with
+    :meth:`~pypuppetdb.api.CommandAPI.submit_many`.
+
+    :ivar index: The position of the command in the input.
+    :ivar command: The command.
+    :ivar certname: The certname from the payload.
+    :ivar response: The response from PuppetDB, with the UUID of the\
+        queued command, or `None` if it failed.
+    :ivar error: The exception the command failed with, or `None`.
+    :ivar elapsed: The number of seconds the request took.
+    """
+
+    def __init__(self, index, command, certname, response, error, elapsed):
+        self.index = index
+        self.command = command
+        self.certname = certname
+        self.response = response
+        self.error = error
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        state = "ok" if self.ok else f"failed: {self.error!r}"
+        return f"<CommandResult: {self.command} {self.certname} {state}>"
+
+    @property
+    def ok(self):
+        """Whether PuppetDB accepted the command."""
+        return self.error is None
+
+
+class SubmitStats:
+    """The results and throughput of
+    :meth:`~pypuppetdb.api.CommandAPI.submit_many`.
+
+    :ivar results: A :class:`CommandResult` per command, in input order.
+    :ivar submitted: The number of commands sent.
+    :ivar succeeded: The number of commands PuppetDB accepted.
+    :ivar failed: The number of commands that failed.
+    :ivar elapsed: The number of seconds it took to send them all.
+    """
+
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.submitted = len(results)
+        self.succeeded = sum(1 for r in results if r.ok)
+        self.failed = self.submitted - self.succeeded
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return "<SubmitStats: {} submitted, {} failed, {:.1f}/s>".format(
+            self.submitted, self.failed, self.rate
+        )
+
+    @property
+    def rate(self):
+        """The number of commands sent per second."""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.submitted / self.elapsed
+
+    @property
+    def mean_latency(self):
+        """The mean number of seconds a request took."""
+        if not self.results:
+            return 0.0
+        return sum(r.elapsed for r in self.results) / self.submitted
+
 
 class CommandAPI(BaseAPI):
     """This class provides methods that interact with the `pdb/cmd/*`
@@ -18,6 +168,109 @@ class CommandAPI(BaseAPI):
     def command(self, command, payload):
         return self._cmd(command, payload)
 
+    def submit_many(self, commands, concurrency=4, callback=None):
+        """Sends many commands at once, such as `replace facts` for a whole
+        fleet, over `concurrency` connections in parallel.
+
+        `commands` is consumed lazily: a new command is only taken from it
+        when one of the requests in flight has finished, so a generator
+        that reads from a file or another system is never read ahead of
+        what PuppetDB can take.
+
+        A command that fails doesn't stop the others, its error is kept in
+        its :class:`CommandResult`.
+
+        :param commands: The commands to send.
+        :type commands: An iterable of (:obj:`string`, :obj:`dict`) tuples\
+            of the command and its payload.
+        :param concurrency: (Default: 4) The most requests in flight.
+        :type concurrency: :obj:`int`
+        :param callback: (optional) Called with every :class:`CommandResult`\
+            as soon as its request has finished, eg. to report progress.
+        :type callback: :obj:`callable`
+
+        :returns: The results and throughput.
+        :rtype: :class:`SubmitStats`
+        """
+        if concurrency < 1:
+            raise ValueError(
+                f"concurrency must be at least 1, was given: {concurrency}"
+            )
+
+        def send(index, command, payload):
+            start = time.monotonic()
+            response = error = None
+            try:
+                response = self._cmd(command, payload)
+            except (APIError, requests.exceptions.RequestException, ValueError) as err:
+                error = err
+            return CommandResult(
+                index,
+                command,
+                payload.get("certname"),
+                response,
+                error,
+                time.monotonic() - start,
+            )
+
+        results = []
+
+        def collect(futures):
+            for future in futures:
+                result = future.result()
+                results.append(result)
+                if callback is not None:
+                    callback(result)
+
+        start = time.monotonic()
+        with self._command_pool(concurrency), ThreadPoolExecutor(
+            max_workers=concurrency
+        ) as executor:
+            pending = set()
+            for index, (command, payload) in enumerate(commands):
+                if len(pending) >= concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.add(executor.submit(send, index, command, payload))
+            collect(wait(pending).done)
+
+        results.sort(key=lambda r: r.index)
+        stats = SubmitStats(results, time.monotonic() - start)
+        log.debug(f"Submitted commands: {stats}")
+        return stats
+
+    @contextlib.contextmanager
+    def _command_pool(self, size):
+        """Keeps up to `size` connections to the command endpoint around in
+        the block, as requests keeps at most `DEFAULT_POOLSIZE` per host.
+
+        The adapter of the session is replaced by one of the same kind, so a
+        :class:`~pypuppetdb.hooks.TimingAdapter` keeps timing connections,
+        and put back afterwards."""
+        if size <= DEFAULT_POOLSIZE:
+            yield
+            return
+        url = self._url("cmd")
+        mounted = self.session.adapters.get(url)
+        current = self.session.get_adapter(url)
+        if isinstance(current, HTTPAdapter):
+            adapter = type(current)(
+                pool_connections=1,
+                pool_maxsize=size,
+                max_retries=current.max_retries,
+            )
+        else:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+        self.session.mount(url, adapter)
+        try:
+            yield
+        finally:
+            if mounted is None:
+                del self.session.adapters[url]
+            else:
+                self.session.mount(url, mounted)
+            adapter.close()
+
     def _cmd(self, command, payload):
         """This method posts commands to PuppetDB. Provided a command and payload
         it will fire a request at PuppetDB. If PuppetDB can be reached and
@@ -27,46 +280,99 @@ class CommandAPI(BaseAPI):
         :param command: The PuppetDB Command we want to execute.
         :type command: :obj:`string`
 
-        :param command: The payload, in wire format, specific to the command.
-        :type command: :obj:`dict`
+        :param payload: The payload, in wire format, specific to the command,\
+            or the payload already encoded with the command.
+        :type payload: :obj:`dict` or :class:`EncodedCommand`
 
         :raises: :class:`~pypuppetdb.errors.EmptyResponseError`
 
-        :returns: The decoded response from PuppetDB
-        :rtype: :obj:`dict` or :obj:`list`
+        :returns: The decoded response from PuppetDB, or `None` if the\
+            command was skipped by the `facts_suppressor`.
+        :rtype: :obj:`None`, :obj:`dict` or :obj:`list`
         """
-        log.debug("_cmd called with command: {}, data: {}".format(command, payload))
+        if isinstance(payload, EncodedCommand):
+            return self._send_command(payload)
+
+        # formatted lazily, the payload may be a multi-megabyte catalog
+        log.debug("_cmd called with command: %s, data: %s", command, payload)
+
+        suppressor = self.facts_suppressor
+        if suppressor is not None and command == "replace facts":
+            # checked before encoding, unchanged facts are never encoded
+            body, digest = facts_body(payload)
+            if not suppressor.should_send(payload["certname"], digest):
+                return None
+            encoded = EncodedCommand(
+                command, payload, self.compress_commands, body=body
+            )
+            result = self._send_command(encoded)
+            suppressor.record(encoded.certname, digest)
+            return result
+
+        encoded = EncodedCommand(command, payload, self.compress_commands)
+        result = self._send_command(encoded)
+        if suppressor is not None and command == "deactivate node":
+            # the next facts reactivate the node, so they must be sent
+            suppressor.forget(encoded.certname)
+        return result
 
+    def _send_command(self, encoded):
+        """Posts an :class:`EncodedCommand` to PuppetDB, see :meth:`_cmd`."""
         url = self._url("cmd")
+        event = None
+        if self.request_hooks:
+            event = self._request_event(url, "POST", None)
+        elif self.request_metrics is None:
+            return self._post_command(url, encoded)
 
-        if command not in COMMAND_VERSION:
-            log.error(
-                "Only {} supported, {} unsupported".format(
-                    list(COMMAND_VERSION.keys()), command
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = self._post_command(url, encoded, event)
+            outcome = "success"
+            return result
+        except Exception as err:
+            if event is not None:
+                event.error = err
+            raise
+        finally:
+            if self.request_metrics is not None:
+                self.request_metrics.observe(
+                    url, "POST", outcome, time.perf_counter() - start
                 )
-            )
-            raise APIError
+            if event is not None:
+                self._emit(event)
 
-        params = {
-            "command": command,
-            "version": COMMAND_VERSION[command],
-            "certname": payload["certname"],
-            "checksum": hashlib.sha1(str(payload).encode("utf-8")).hexdigest(),  # nosec
-        }
+    def _post_command(self, url, encoded, event=None):
+
+        if event is not None:
+            event.started()
+
+        headers = None
+        if encoded.content_encoding is not None:
+            headers = {"Content-Encoding": encoded.content_encoding}
 
         try:
             r = self.session.post(
                 url,
-                params=params,
-                data=json.dumps(payload, default=str),
+                params=encoded.params,
+                data=encoded.body,
+                headers=headers,
                 verify=self.ssl_verify,
                 cert=(self.ssl_cert, self.ssl_key),
                 timeout=self.timeout,
+                stream=event is not None,
             )
 
+            if event is not None:
+                event.received(r)
+                event.downloaded(r.content)
+
             r.raise_for_status()
 
             json_body = r.json()
+            if event is not None:
+                event.decoded(json_body)
             if json_body is not None:
                 return json_body
             else:
@@ -1,7 +1,10 @@
+import functools
 import logging
 
+import requests
+
 from pypuppetdb.api.base import BaseAPI
-from pypuppetdb.errors import DoesNotComputeError
+from pypuppetdb.errors import DoesNotComputeError, MetricReadError
 
 log = logging.getLogger(__name__)
 
@@ -42,13 +45,112 @@ class MetricsAPI(BaseAPI):
                 )
             )
 
+    def metrics(self, metrics, version=None):
+        """Query for many metrics at once.
+
+        With the v2 metrics API all of them are read with a single Jolokia
+        bulk request, instead of one request per metric.
+
+        Metrics that can't be read don't fail the others, their value in
+        the result is a :class:`~pypuppetdb.errors.MetricReadError` instead:
+
+        .. code-block:: python
+
+           >>> values = db.metrics(["puppetlabs.puppetdb.mq:name=global.depth"])
+           >>> for mbean, value in values.items():
+           ...     if isinstance(value, MetricReadError):
+           ...         log.warning(value)
+
+        :param metrics: The metrics we want, either the name of an mbean to\
+            get all its attributes or a (name, attribute) tuple to get only\
+            that attribute. Asking for several attributes of the same mbean\
+            reads them together.
+        :type metrics: :obj:`list`
+        :param version: The version of the metric API to query. Valid\
+            values: 'v1', 'v2'. If not specified, then the value of\
+            self.metric_api_version will be used.
+        :type version: :obj:`string`
+
+        :returns: The attributes and their values per mbean, or the error\
+            the mbean could not be read with.
+        :rtype: :obj:`dict`
+        """
+        version = version if version else self.metric_api_version
+        if version not in ("v1", "v2"):
+            raise ValueError(
+                "Version specified must be 'v1' or 'v2', was given: '{}'".format(
+                    version
+                )
+            )
+
+        # the attributes per mbean, None for all of them
+        wanted = {}
+        for metric in metrics:
+            if isinstance(metric, str):
+                mbean, attribute = metric, None
+            else:
+                mbean, attribute = metric
+            if attribute is None:
+                wanted[mbean] = None
+            elif mbean not in wanted:
+                wanted[mbean] = [attribute]
+            elif wanted[mbean] is not None and attribute not in wanted[mbean]:
+                wanted[mbean].append(attribute)
+
+        if not wanted:
+            return {}
+        if version == "v1":
+            return self._metrics_v1(wanted)
+
+        bulk = []
+        for mbean, attributes in wanted.items():
+            read = {"type": "read", "mbean": mbean}
+            if attributes is not None:
+                read["attribute"] = attributes
+            bulk.append(read)
+
+        responses = self._make_request(self._url("metrics-base"), "POST", bulk)
+        if isinstance(responses, dict):
+            responses = [responses]
+
+        results = {}
+        for read, response in zip(bulk, responses):
+            mbean = read["mbean"]
+            if "error" in response:
+                log.warning(f"Could not read metric {mbean}: {response['error']}")
+                results[mbean] = MetricReadError(
+                    response["error"], mbean=mbean, status=response.get("status")
+                )
+            else:
+                results[mbean] = response["value"]
+        return results
+
+    def _metrics_v1(self, wanted):
+        """Reads metrics one by one from the v1 API, see :meth:`metrics`."""
+        results = {}
+        for mbean, attributes in wanted.items():
+            try:
+                value = self._query("mbean", path=mbean)
+            except requests.exceptions.HTTPError as err:
+                results[mbean] = MetricReadError(
+                    err.response.text, mbean=mbean, status=err.response.status_code
+                )
+                continue
+            if attributes is not None and isinstance(value, dict):
+                value = {a: value[a] for a in attributes if a in value}
+            results[mbean] = value
+        return results
+
     @staticmethod
+    @functools.lru_cache(maxsize=1024)
     def _escape_metric_name(metric):
         """Escapes metric names so they can be used in GET requests as part of the URL.
         The new (as of v2) metrics API is backed by the Jolokia library.
         The escpaing rules for Jolokia GET requests can be found here:
         https://jolokia.org/reference/html/protocol.html#escape-rules
 
+        The results are memoized, as the same metrics are read over and over.
+
         :param metric: The name of the metric we want to escape.
         :type metric: :obj:`string`
 
@@ -5,7 +5,8 @@ from datetime import datetime
 import pypuppetdb
 from pypuppetdb.QueryBuilder import EqualsOperator
 from pypuppetdb.api.base import BaseAPI
-from pypuppetdb.errors import APIError
+from pypuppetdb.errors import APIError, PqlSyntaxError
+from pypuppetdb.pql import parse_ast, to_pql
 from pypuppetdb.types import Node, Report
 
 log = logging.getLogger(__name__)
@@ -47,12 +48,21 @@ class PqlAPI(BaseAPI):
         return self._make_request(url, request_method, payload)
 
     # TODO: deduplicate this - see QueryAPI.nodes()
-    def pql(self, pql, with_status=False, unreported=2, with_event_numbers=True):
+    def pql(
+        self,
+        pql,
+        with_status=False,
+        unreported=2,
+        with_event_numbers=True,
+        validate=False,
+    ):
         """Makes a PQL (Puppet Query Language) and tries to cast results
         to a rich type. If it won't work, returns plain dicts.
 
-        :param pql: PQL query
-        :type pql: :obj:`string`
+        :param pql: PQL query, or a `from` query that is converted to PQL\
+                           with :func:`~pypuppetdb.pql.to_pql`
+        :type pql: :obj:`string` or\
+                           :class:`~pypuppetdb.QueryBuilder.FromOperator`
 
         :param with_status: (optional, only for queries for nodes) include
                            the node status in the returned nodes
@@ -69,10 +79,22 @@ class PqlAPI(BaseAPI):
                            This provides performance benefits as potentially
                            slow event-counts query is omitted completely.
         :type with_event_numbers: :bool:
+        :param validate: (optional) parse the query locally first, so that\
+                           syntax errors are raised without a round trip\
+                           to PuppetDB
+        :type validate: :bool:
+
+        :raises: :class:`~pypuppetdb.errors.PqlSyntaxError` if `validate`\
+                           is set and the query is not valid PQL
 
         :returns: A generator yielding elements of a rich type or plain dicts
         """
 
+        if not isinstance(pql, str):
+            pql = to_pql(pql)
+        if validate:
+            parse_ast(pql)
+
         type_class = self._get_type_from_query(pql)
 
         if type_class == Node and (
@@ -134,12 +156,20 @@ class PqlAPI(BaseAPI):
 
         # in PQL the beginning of the query is the type of returned entities
         # but only if the projection is empty ([]) or there is no projection
-        pattern = re.compile(r"([a-z]*?)\s*(\[])?\s*{")
-        match = pattern.match(pql)
-
-        if match:
-            type_name_lowercase = match.group(1)
+        try:
+            ast = parse_ast(pql)
+        except PqlSyntaxError:
+            # leave reporting the error to PuppetDB
+            pattern = re.compile(r"([a-z]*?)\s*(\[])?\s*{")
+            match = pattern.match(pql)
+            type_name_lowercase = match.group(1) if match else None
+        else:
+            if len(ast) > 2 and ast[2][0] == "extract":
+                type_name_lowercase = None
+            else:
+                type_name_lowercase = ast[1]
 
+        if type_name_lowercase:
             # class name is capitalized
             type_name = type_name_lowercase.capitalize()
 
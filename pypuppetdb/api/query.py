@@ -1,8 +1,20 @@
+import asyncio
+import itertools
+import json
 import logging
+import threading
 from datetime import datetime
 
-from pypuppetdb.QueryBuilder import EqualsOperator
+from pypuppetdb.QueryBuilder import (
+    AndOperator,
+    EqualsOperator,
+    ExtractOperator,
+    OrOperator,
+)
 from pypuppetdb.api.base import BaseAPI
+from pypuppetdb.errors import APIError
+from pypuppetdb.follow import Follower
+from pypuppetdb.matrix import FactMatrix
 from pypuppetdb.types import (
     Catalog,
     Edge,
@@ -48,7 +60,8 @@ class QueryAPI(BaseAPI):
         :returns: A generator yieling Nodes.
         :rtype: :class:`pypuppetdb.types.Node`
         """
-        nodes = self._query("nodes", **kwargs)
+        with self._held_events() as events:
+            nodes = self._query("nodes", stream=True, **kwargs)
         now = datetime.utcnow()
 
         # If we happen to only get one node back it
@@ -67,8 +80,8 @@ class QueryAPI(BaseAPI):
                 summarize_by="certname",
             )
 
-        for node in nodes:
-            yield Node.create_from_dict(
+        def build(node):
+            return Node.create_from_dict(
                 self,
                 node,
                 with_status,
@@ -78,6 +91,8 @@ class QueryAPI(BaseAPI):
                 unreported,
             )
 
+        yield from self._construct(events, nodes, build)
+
     def node(self, name):
         """Gets a single node from PuppetDB.
 
@@ -99,7 +114,7 @@ class QueryAPI(BaseAPI):
         :returns: A generating yielding Edges.
         :rtype: :class:`pypuppetdb.types.Edge`
         """
-        edges = self._query("edges", **kwargs)
+        edges = self._query("edges", stream=True, **kwargs)
 
         for edge in edges:
             yield Edge.create_from_dict(edge)
@@ -137,9 +152,9 @@ class QueryAPI(BaseAPI):
         else:
             path = None
 
-        facts = self._query("facts", path=path, **kwargs)
-        for fact in facts:
-            yield Fact.create_from_dict(fact)
+        with self._held_events() as events:
+            facts = self._query("facts", path=path, stream=True, **kwargs)
+        yield from self._construct(events, facts, Fact.create_from_dict)
 
     def factsets(self, **kwargs):
         r"""Returns a set of all facts or for a single certname.
@@ -208,19 +223,38 @@ class QueryAPI(BaseAPI):
             elif title is None:
                 path = type_
 
-        resources = self._query("resources", path=path, **kwargs)
-        for resource in resources:
-            yield Resource.create_from_dict(resource)
+        with self._held_events() as events:
+            resources = self._query("resources", path=path, stream=True, **kwargs)
+        yield from self._construct(events, resources, Resource.create_from_dict)
 
     def catalog(self, node):
         """Get the available catalog for a given node.
 
+        If an `object_cache` is configured only the UUID of the node's
+        current catalog is fetched, and the catalog itself is only
+        fetched if it's not cached yet.
+
         :param node: (Required) The name of the PuppetDB node.
         :type: :obj:`string`
 
         :returns: An instance of Catalog
         :rtype: :class:`pypuppetdb.types.Catalog`
         """
+        if self.object_cache is not None:
+            query = ExtractOperator()
+            query.add_field("catalog_uuid")
+            query.add_query(EqualsOperator("certname", node))
+            current = self._query("catalogs", query=query, cache=False)
+            if current and current[0].get("catalog_uuid"):
+                catalog_uuid = current[0]["catalog_uuid"]
+                catalogs = self._query_immutable(
+                    f"catalog/{catalog_uuid}",
+                    "catalogs",
+                    query=EqualsOperator("catalog_uuid", catalog_uuid),
+                )
+                if catalogs:
+                    return Catalog.create_from_dict(catalogs[0])
+
         catalogs = self.catalogs(path=node)
         return next(catalog for catalog in catalogs)
 
@@ -237,7 +271,7 @@ class QueryAPI(BaseAPI):
         :rtype: :class:`pypuppetdb.types.Catalog`
         """
 
-        catalogs = self._query("catalogs", **kwargs)
+        catalogs = self._query("catalogs", stream=True, **kwargs)
 
         if isinstance(catalogs, dict):
             catalogs = [
@@ -260,10 +294,42 @@ class QueryAPI(BaseAPI):
         :returns: A generator yielding Events
         :rtype: :class:`pypuppetdb.types.Event`
         """
-        events = self._query("events", **kwargs)
+        events = self._query("events", stream=True, **kwargs)
         for event in events:
             yield Event.create_from_dict(event)
 
+    def report_events(self, hash_, **kwargs):
+        r"""Get the events of a single report. As a stored report never
+        changes, these are cached if an `object_cache` is configured.
+
+        PuppetDB stores the events of a report together with it, so no
+        events for a report that exists is final and cached as well.
+
+        :param hash_: The hash of the report.
+        :type hash_: :obj:`string`
+        :param \**kwargs: The rest of the keyword arguments are passed
+                           to the _query function
+
+        :returns: A generator yielding Events
+        :rtype: :class:`pypuppetdb.types.Event`
+        """
+        events = self._query_immutable(
+            f"events/{hash_}",
+            "events",
+            final=lambda: self._report_exists(hash_),
+            query=EqualsOperator("report", hash_),
+            **kwargs,
+        )
+        for event in events:
+            yield Event.create_from_dict(event)
+
+    def _report_exists(self, hash_):
+        """Whether PuppetDB has stored the report with this hash."""
+        query = ExtractOperator()
+        query.add_field("hash")
+        query.add_query(EqualsOperator("hash", hash_))
+        return bool(self._query("reports", query=query, cache=False))
+
     def event_counts(self, summarize_by, **kwargs):
         r"""Get event counts from puppetdb.
 
@@ -342,9 +408,81 @@ class QueryAPI(BaseAPI):
         :returns: A generating yielding Reports
         :rtype: :class:`pypuppetdb.types.Report`
         """
-        reports = self._query("reports", **kwargs)
-        for report in reports:
-            yield Report.create_from_dict(self, report)
+        with self._held_events() as events:
+            reports = self._query("reports", stream=True, **kwargs)
+        yield from self._construct(
+            events, reports, lambda report: Report.create_from_dict(self, report)
+        )
+
+    def report(self, hash_):
+        """Get a single report by its hash. As a stored report never
+        changes, it is cached if an `object_cache` is configured.
+
+        :param hash_: The hash of the report.
+        :type hash_: :obj:`string`
+
+        :returns: An instance of Report
+        :rtype: :class:`pypuppetdb.types.Report`
+        """
+        reports = self._query_immutable(
+            f"report/{hash_}", "reports", query=EqualsOperator("hash", hash_)
+        )
+        return next(Report.create_from_dict(self, report) for report in reports)
+
+    def _followed(self, endpoint, row):
+        if endpoint == "reports":
+            return Report.create_from_dict(self, row)
+        if endpoint == "events":
+            return Event.create_from_dict(row)
+        return row
+
+    def follow(self, endpoint="reports", stop=None, **kwargs):
+        r"""Follows an endpoint and yields new objects as they arrive in
+        PuppetDB, polling it at an interval that adapts to how often new
+        objects arrive. Every object is yielded once, see
+        :class:`~pypuppetdb.follow.Follower` for how.
+
+        This blocks between polls, so run it in its own thread or use
+        :meth:`afollow` with asyncio.
+
+        :param endpoint: (Default: ``reports``) One of ``reports``,\
+                           ``events`` or ``factsets``.
+        :type endpoint: :obj:`string`
+        :param stop: (optional) Stop following once this is set.
+        :type stop: :obj:`None` or :class:`threading.Event`
+        :param \**kwargs: The rest of the keyword arguments are passed
+                           to :class:`~pypuppetdb.follow.Follower`, eg.\
+                           `query` and `since`.
+
+        :returns: A generator yielding Reports, Events or factsets (dicts).
+        """
+        follower = Follower(self, endpoint, **kwargs)
+        if stop is None:
+            stop = threading.Event()
+        while not stop.is_set():
+            for row in follower.poll():
+                yield self._followed(endpoint, row)
+            stop.wait(follower.interval)
+
+    async def afollow(self, endpoint="reports", **kwargs):
+        r"""Like :meth:`follow` but for asyncio, polls run in the default
+        executor so they don't block the event loop.
+
+        :param endpoint: (Default: ``reports``) One of ``reports``,\
+                           ``events`` or ``factsets``.
+        :type endpoint: :obj:`string`
+        :param \**kwargs: The rest of the keyword arguments are passed
+                           to :class:`~pypuppetdb.follow.Follower`.
+
+        :returns: An asynchronous generator yielding Reports, Events or\
+                           factsets (dicts).
+        """
+        follower = Follower(self, endpoint, **kwargs)
+        loop = asyncio.get_running_loop()
+        while True:
+            for row in await loop.run_in_executor(None, follower.poll):
+                yield self._followed(endpoint, row)
+            await asyncio.sleep(follower.interval)
 
     def inventory(self, **kwargs):
         r"""Get Node and Fact information with an alternative query syntax
@@ -357,6 +495,93 @@ class QueryAPI(BaseAPI):
         :returns: A generator yielding Inventory
         :rtype: :class:`pypuppetdb.types.Inventory`
         """
-        inventory = self._query("inventory", **kwargs)
+        inventory = self._query("inventory", stream=True, **kwargs)
         for inv in inventory:
             yield Inventory.create_from_dict(inv)
+
+    def fact_matrix(self, fact_paths, endpoint="inventory", page_size=None, **kwargs):
+        r"""Get a node by fact table for the given fact paths, stored in
+        columnar form with dictionary encoded values. Rows are decoded
+        straight into the columns without creating any intermediate
+        objects, and the result can be turned into NumPy arrays or a
+        pandas DataFrame for vectorised analysis.
+
+        :param fact_paths: The facts to get, with structured facts written\
+            with dots, eg. ``["os.family", "kernelversion"]``.
+        :type fact_paths: :obj:`list` of :obj:`string`
+        :param endpoint: (Default: 'inventory') The endpoint to read the\
+            facts from, either 'inventory' or 'fact-contents'.
+        :type endpoint: :obj:`string`
+        :param page_size: (optional) Fetch the results in pages of this\
+            many rows to keep memory use bounded. A `limit` then applies to\
+            all the pages together.
+        :type page_size: :obj:`None` or :obj:`int`
+        :param \**kwargs: The rest of the keyword arguments are passed
+                           to the _query function. A `query` is combined
+                           with the fact path selection.
+
+        :returns: An instance of FactMatrix
+        :rtype: :class:`pypuppetdb.matrix.FactMatrix`
+        """
+        matrix = FactMatrix(fact_paths)
+        user_query = kwargs.pop("query", None)
+
+        if endpoint == "inventory":
+            query = ExtractOperator()
+            query.add_field(["certname"] + [f"facts.{p}" for p in fact_paths])
+            if user_query is not None:
+                query.add_query(user_query)
+        elif endpoint == "fact-contents":
+            paths = OrOperator()
+            for path in fact_paths:
+                paths.add(
+                    EqualsOperator(
+                        "path",
+                        [int(p) if p.isdigit() else p for p in path.split(".")],
+                    )
+                )
+            query = ExtractOperator()
+            query.add_field(["certname", "path", "value"])
+            if user_query is not None:
+                op = AndOperator()
+                op.add(paths)
+                op.add(user_query)
+                query.add_query(op)
+            else:
+                query.add_query(paths)
+        else:
+            log.error(f"fact_matrix does not support the {endpoint} endpoint")
+            raise APIError
+
+        if page_size is not None:
+            limit = kwargs.pop("limit", None)
+            if endpoint == "fact-contents" and "order_by" not in kwargs:
+                # a node has a row per path, so certname alone isn't a
+                # stable order to page in
+                kwargs["order_by"] = json.dumps(
+                    [
+                        {"field": "certname", "order": "asc"},
+                        {"field": "path", "order": "asc"},
+                    ]
+                )
+            rows = self._query_paged(endpoint, page_size, query=query, **kwargs)
+            if limit is not None:
+                rows = itertools.islice(rows, limit)
+        else:
+            rows = self._query(endpoint, query=query, **kwargs)
+
+        if endpoint == "inventory":
+            columns = [(path, f"facts.{path}") for path in fact_paths]
+            for row in rows:
+                matrix.add_row(
+                    row["certname"], {path: row.get(key) for path, key in columns}
+                )
+        else:
+            for row in rows:
+                matrix.add_value(
+                    row["certname"],
+                    ".".join(str(p) for p in row["path"]),
+                    row["value"],
+                )
+
+        return matrix.finalize()
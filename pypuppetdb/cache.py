@@ -0,0 +1,397 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+class ImmutableCache:
+    """A cache for PuppetDB objects that can never change once they are
+    stored, such as a report and its events (identified by the report
+    hash) or a catalog (identified by its catalog UUID). As these never
+    have to be invalidated, they can be kept for as long as there is room.
+
+    Entries are stored as their encoded JSON so that the cache is bounded
+    by the actual number of bytes it holds and every lookup hands out a
+    fresh copy that can't corrupt the cache if it's modified. When the
+    in-memory part is full the least recently used entries are evicted
+    and, if a `spill_dir` is given, written to disk from where they are
+    read back on the next lookup. The spill directory is reused across
+    restarts.
+
+    :param max_bytes: (Default: 64 MiB) Maximum size of the in-memory part.
+    :type max_bytes: :obj:`int`
+    :param spill_dir: (optional) Directory to spill evicted entries to.
+    :type spill_dir: :obj:`None` or :obj:`string`
+    :param spill_max_bytes: (Default: 1 GiB) Maximum size of the spill\
+        directory.
+    :type spill_max_bytes: :obj:`int`
+
+    :ivar hits: Number of lookups answered from memory or disk.
+    :ivar misses: Number of lookups not in the cache.
+    """
+
+    def __init__(self, max_bytes=64 * 1024**2, spill_dir=None, spill_max_bytes=1024**3):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self.spill_size = 0
+        self._entries = OrderedDict()
+        self._spilled = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.spill_dir is not None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self._load_spilled()
+
+    def __repr__(self):
+        return "<ImmutableCache: {} entries, {} bytes, {} spilled>".format(
+            len(self._entries), self.size, len(self._spilled)
+        )
+
+    def __len__(self):
+        return len(self._entries) + len(self._spilled)
+
+    def __contains__(self, key):
+        return key in self._entries or self._file_name(key) in self._spilled
+
+    @staticmethod
+    def _file_name(key):
+        return hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json"
+
+    def _load_spilled(self):
+        files = []
+        for name in os.listdir(self.spill_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.spill_dir, name)
+            stat = os.stat(path)
+            files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._spilled[name] = size
+            self.spill_size += size
+
+    def get(self, key, default=None):
+        """Get a cached value.
+
+        :param key: The key, eg. ``report/<hash>``.
+        :type key: :obj:`string`
+
+        :returns: A freshly decoded copy of the value, or `default`.
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            elif self.spill_dir is not None:
+                data = self._read_spilled(key)
+                if data is not None:
+                    self._store(key, data)
+
+            if data is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+
+        return json.loads(data)
+
+    def set(self, key, value):
+        """Caches a value. Only use this for values that can't change.
+
+        :param key: The key, eg. ``report/<hash>``.
+        :type key: :obj:`string`
+        :param value: Any JSON serializable value.
+        """
+        data = json.dumps(value, separators=(",", ":"), default=str).encode("utf-8")
+        with self._lock:
+            self._store(key, data)
+
+    def get_or_set(self, key, function, final=None):
+        """Get a cached value or, if it's not cached, call `function` to
+        get it and cache it.
+
+        Empty values, such as the events of a report PuppetDB hasn't
+        finished storing yet, are only cached if `final` is given and
+        returns true, eg. as the report does exist, otherwise they may
+        still turn up."""
+        value = self.get(key)
+        if value is None:
+            value = function()
+            if value or (final is not None and final()):
+                self.set(key, value)
+        return value
+
+    def flush(self):
+        """Writes all in-memory entries to the spill directory, eg. before
+        the process exits, so that they survive a restart."""
+        if self.spill_dir is None:
+            return
+        with self._lock:
+            while self._entries:
+                key, data = self._entries.popitem(last=False)
+                self.size -= len(data)
+                self._spill(key, data)
+
+    def clear(self):
+        """Drops all entries, including those spilled to disk."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            for name in list(self._spilled):
+                self._remove_spilled(name)
+
+    def _store(self, key, data):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        if len(data) > self.max_bytes:
+            self._spill(key, data)
+            return
+        self._entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            old_key, old_data = self._entries.popitem(last=False)
+            self.size -= len(old_data)
+            self._spill(old_key, old_data)
+
+    def _spill(self, key, data):
+        if self.spill_dir is None or len(data) > self.spill_max_bytes:
+            return
+        name = self._file_name(key)
+        if name in self._spilled:
+            self._spilled.move_to_end(name)
+            return
+
+        # write to a temporary file first so that a crash never leaves a
+        # partially written entry behind
+        fd, tmp = tempfile.mkstemp(dir=self.spill_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, os.path.join(self.spill_dir, name))
+        except OSError as err:
+            log.warning(f"Could not spill cache entry to {self.spill_dir}: {err}")
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            return
+
+        self._spilled[name] = len(data)
+        self.spill_size += len(data)
+        while self.spill_size > self.spill_max_bytes:
+            self._remove_spilled(next(iter(self._spilled)))
+
+    def _read_spilled(self, key):
+        name = self._file_name(key)
+        if name not in self._spilled:
+            return None
+        try:
+            with open(os.path.join(self.spill_dir, name), "rb") as f:
+                data = f.read()
+        except OSError:
+            self._remove_spilled(name)
+            return None
+        self._remove_spilled(name)
+        return data
+
+    def _remove_spilled(self, name):
+        self.spill_size -= self._spilled.pop(name)
+        try:
+            os.unlink(os.path.join(self.spill_dir, name))
+        except OSError:
+            pass
+
+
+class ResponseCache:
+    """A persistent cache for PuppetDB responses that can be shared by all
+    processes on a host, such as cron jobs and web server workers, so that
+    a freshly started process gets answers without asking PuppetDB.
+
+    Responses are stored in an SQLite database, so every write is atomic
+    and several processes can read and write it at the same time. Entries
+    expire after the TTL of their endpoint in `ttls` and the oldest ones
+    are evicted when the cache grows beyond `max_bytes`. Reads never write
+    to the database.
+
+    Pass it as `response_cache` to :func:`~pypuppetdb.connect` to cache the
+    results of the queries to the endpoints in `ttls`, eg. ``fact-names``
+    or ``environments``: other endpoints are never cached, as results that
+    may be minutes old break anything that polls for new objects. Queries
+    with `include_total` and the queries made to page through results,
+    follow new objects or look up the latest catalog are not cached either.
+
+    :param path: The database file.
+    :type path: :obj:`string`
+    :param ttl: (Default: 300) Number of seconds a response stays valid if\
+        its endpoint has a TTL of `None`, or :meth:`set` is not given one.
+    :type ttl: :obj:`int`
+    :param ttls: (optional) The endpoints to cache with their TTL, eg.\
+        ``{"fact-names": 3600, "environments": None}``.
+    :type ttls: :obj:`dict`
+    :param max_bytes: (Default: 256 MiB) Maximum size of the responses.
+    :type max_bytes: :obj:`int`
+    :param timeout: (Default: 10) Number of seconds to wait for another\
+        process that is writing to the cache.
+    :type timeout: :obj:`float`
+
+    :ivar hits: Number of lookups answered from the cache by this process.
+    :ivar misses: Number of lookups not in the cache.
+    """
+
+    def __init__(self, path, ttl=300, ttls=None, max_bytes=256 * 1024**2, timeout=10):
+        self.path = path
+        self.ttl = ttl
+        self.ttls = ttls or {}
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, "
+                "expires REAL, stored REAL, size INTEGER, data BLOB)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_stored ON responses (stored)"
+            )
+            # the total size of the responses, kept up to date by every
+            # write so that it never has to be summed up
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS usage "
+                "(id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER)"
+            )
+            connection.execute(
+                "INSERT OR IGNORE INTO usage "
+                "SELECT 0, COALESCE(SUM(size), 0) FROM responses"
+            )
+
+    def __repr__(self):
+        return f"<ResponseCache: {self.path}>"
+
+    def _connection(self):
+        # sqlite connections can't be shared with threads or forked processes
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def key(url, request_method, payload):
+        """Get the key of a request."""
+        return "{} {} {}".format(
+            request_method.upper(),
+            url,
+            json.dumps(payload, sort_keys=True, default=str),
+        )
+
+    def ttl_for(self, endpoint):
+        """Get the TTL of the responses of an endpoint, 0 if they are not
+        cached."""
+        if endpoint not in self.ttls:
+            return 0
+        ttl = self.ttls[endpoint]
+        return self.ttl if ttl is None else ttl
+
+    def get(self, key, default=None):
+        """Get a cached response.
+
+        :returns: The decoded response, or `default` if it isn't cached or\
+            has expired.
+        """
+        try:
+            row = (
+                self._connection()
+                .execute(
+                    "SELECT data FROM responses WHERE key = ? AND expires > ?",
+                    (key, time.time()),
+                )
+                .fetchone()
+            )
+        except sqlite3.Error as err:
+            log.warning(f"Could not read from response cache {self.path}: {err}")
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        """Caches a response.
+
+        :param key: The key, see :meth:`key`.
+        :type key: :obj:`string`
+        :param value: The decoded response.
+        :param ttl: (optional) Number of seconds the response stays valid,\
+            defaults to `ttl`.
+        :type ttl: :obj:`None` or :obj:`int`
+        """
+        if ttl is None:
+            ttl = self.ttl
+        if ttl <= 0:
+            return
+        data = json.dumps(value, separators=(",", ":"), default=str).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+
+        now = time.time()
+        try:
+            with self._connection() as connection:
+                # take the write lock first, so that the size of the
+                # replaced response can't change before it is replaced
+                connection.execute("BEGIN IMMEDIATE")
+                row = connection.execute(
+                    "SELECT size FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (key, now + ttl, now, len(data), data),
+                )
+                size = self._grow(connection, len(data) - (row[0] if row else 0))
+                if size > self.max_bytes:
+                    self._evict(connection, now, size)
+        except sqlite3.Error as err:
+            log.warning(f"Could not write to response cache {self.path}: {err}")
+
+    @staticmethod
+    def _grow(connection, delta):
+        connection.execute("UPDATE usage SET size = size + ? WHERE id = 0", (delta,))
+        return connection.execute("SELECT size FROM usage WHERE id = 0").fetchone()[0]
+
+    def _evict(self, connection, now, size):
+        (expired,) = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses WHERE expires <= ?", (now,)
+        ).fetchone()
+        connection.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+        freed = expired
+        evict = []
+        if size - freed > self.max_bytes:
+            rows = connection.execute("SELECT key, size FROM responses ORDER BY stored")
+            for key, entry_size in rows:
+                evict.append((key,))
+                freed += entry_size
+                if size - freed <= self.max_bytes:
+                    break
+            rows.close()
+            connection.executemany("DELETE FROM responses WHERE key = ?", evict)
+        self._grow(connection, -freed)
+
+    def clear(self):
+        """Drops all responses, for all processes."""
+        with self._connection() as connection:
+            connection.execute("DELETE FROM responses")
+            connection.execute("UPDATE usage SET size = 0")
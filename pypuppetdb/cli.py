@@ -0,0 +1,44 @@
+import pypuppetdb
+
+
+def add_connection_arguments(parser):
+    """Adds the options to connect to PuppetDB to the
+    :class:`argparse.ArgumentParser` of a command."""
+    group = parser.add_argument_group("connection")
+    group.add_argument("--host", default="localhost")
+    group.add_argument("--port", type=int, default=8080)
+    group.add_argument("--url-path", default="/")
+    group.add_argument("--ssl-key")
+    group.add_argument("--ssl-cert")
+    group.add_argument(
+        "--ssl-verify",
+        default=True,
+        help="a CA bundle, or 'false' to not verify the server certificate",
+    )
+    group.add_argument("--token")
+    group.add_argument("--timeout", type=int, default=60)
+
+
+def connect_from_arguments(args, **kwargs):
+    r"""Connects to PuppetDB with the options added by
+    :func:`add_connection_arguments`.
+
+    :param \**kwargs: Passed on to :func:`~pypuppetdb.connect`.
+
+    :rtype: :class:`pypuppetdb.api.API`
+    """
+    ssl_verify = args.ssl_verify
+    if isinstance(ssl_verify, str) and ssl_verify.lower() in ("false", "no", "0"):
+        ssl_verify = False
+
+    return pypuppetdb.connect(
+        host=args.host,
+        port=args.port,
+        url_path=args.url_path,
+        ssl_key=args.ssl_key,
+        ssl_cert=args.ssl_cert,
+        ssl_verify=ssl_verify,
+        token=args.token,
+        timeout=args.timeout,
+        **kwargs,
+    )
@@ -0,0 +1,292 @@
+import collections
+import hashlib
+import itertools
+import json
+import logging
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
+from pypuppetdb.types import Catalog
+
+log = logging.getLogger(__name__)
+
+# fingerprints of catalogs that have already been seen, so that diffing a
+# single baseline catalog against many others only hashes it once
+_fingerprint_cache: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def fingerprint(value):
+    """Computes a stable fingerprint of any JSON serializable value. Dicts
+    are serialized with sorted keys so the fingerprint does not depend on
+    the order in which PuppetDB returned the keys.
+
+    :param value: The value to fingerprint.
+    :type value: any
+
+    :returns: A hex digest.
+    :rtype: :obj:`string`
+    """
+    encoded = json.dumps(
+        value, sort_keys=True, separators=(",", ":"), default=str
+    ).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+class CatalogFingerprint:
+    """This object holds the fingerprints of all the resources and edges of
+    a catalog plus a fingerprint of the catalog as a whole, so that two
+    catalogs can be compared without looking at the resource parameters
+    of anything that did not change.
+
+    Only the parts of a resource that end up on the node are fingerprinted:
+    its type, title, tags, whether it's exported and its parameters. The
+    source file and line are ignored.
+
+    :param catalog: The catalog to fingerprint.
+    :type catalog: :class:`pypuppetdb.types.Catalog`
+
+    :ivar resources: A :obj:`dict` of resource identifiers to fingerprints.
+    :ivar edges: A :obj:`set` of ``(source, relationship, target)`` tuples.
+    :ivar digest: A fingerprint of the whole catalog.
+    """
+
+    def __init__(self, catalog):
+        self.node = catalog.node
+        # keep the resources, not the catalog, so the cache can drop it
+        self.catalog_resources = catalog.resources
+        self.resources = {
+            identifier: fingerprint(
+                [
+                    resource.type_,
+                    resource.name,
+                    sorted(resource.tags),
+                    resource.exported,
+                    resource.parameters,
+                ]
+            )
+            for identifier, resource in catalog.resources.items()
+        }
+        self.edges = {
+            (str(edge.source), edge.relationship, str(edge.target))
+            for edge in catalog.edges
+        }
+        self.digest = fingerprint([sorted(self.resources.items()), sorted(self.edges)])
+
+    def __repr__(self):
+        return "<CatalogFingerprint: {}/{}>".format(self.node, self.digest)
+
+    @staticmethod
+    def of(catalog):
+        """Get the (cached) fingerprint of a catalog.
+
+        :param catalog: The catalog, or an already computed fingerprint.
+        :type catalog: :class:`pypuppetdb.types.Catalog` or\
+            :class:`pypuppetdb.diff.CatalogFingerprint`
+
+        :rtype: :class:`pypuppetdb.diff.CatalogFingerprint`
+        """
+        if isinstance(catalog, CatalogFingerprint):
+            return catalog
+        try:
+            return _fingerprint_cache[catalog]
+        except KeyError:
+            result = CatalogFingerprint(catalog)
+            _fingerprint_cache[catalog] = result
+            return result
+
+
+class CatalogDiff:
+    """This object represents the differences between two catalogs.
+
+    :ivar old: The node the old catalog belongs to.
+    :ivar new: The node the new catalog belongs to.
+    :ivar added_resources: A sorted :obj:`list` of identifiers of resources\
+        only in the new catalog.
+    :ivar removed_resources: A sorted :obj:`list` of identifiers of resources\
+        only in the old catalog.
+    :ivar changed_resources: A :obj:`dict` of identifiers to a :obj:`dict`\
+        describing what changed. Changed parameters are listed under\
+        ``parameters`` as ``name: (old, new)``, with `None` for a missing\
+        parameter. Changed tags or exported flags are listed under ``tags``\
+        and ``exported`` as ``(old, new)``.
+    :ivar added_edges: A sorted :obj:`list` of\
+        ``(source, relationship, target)`` tuples only in the new catalog.
+    :ivar removed_edges: A sorted :obj:`list` of\
+        ``(source, relationship, target)`` tuples only in the old catalog.
+    """
+
+    def __init__(
+        self,
+        old,
+        new,
+        added_resources=None,
+        removed_resources=None,
+        changed_resources=None,
+        added_edges=None,
+        removed_edges=None,
+    ):
+        self.old = old
+        self.new = new
+        self.added_resources = added_resources or []
+        self.removed_resources = removed_resources or []
+        self.changed_resources = changed_resources or {}
+        self.added_edges = added_edges or []
+        self.removed_edges = removed_edges or []
+
+    def __repr__(self):
+        return "<CatalogDiff: {} -> {} (+{} -{} ~{})>".format(
+            self.old,
+            self.new,
+            len(self.added_resources),
+            len(self.removed_resources),
+            len(self.changed_resources),
+        )
+
+    def __bool__(self):
+        return bool(
+            self.added_resources
+            or self.removed_resources
+            or self.changed_resources
+            or self.added_edges
+            or self.removed_edges
+        )
+
+    def to_dict(self):
+        return {
+            "old": self.old,
+            "new": self.new,
+            "added_resources": self.added_resources,
+            "removed_resources": self.removed_resources,
+            "changed_resources": self.changed_resources,
+            "added_edges": self.added_edges,
+            "removed_edges": self.removed_edges,
+        }
+
+
+def _diff_resource(old, new):
+    changes = {}
+
+    parameters = {}
+    for name in old.parameters.keys() | new.parameters.keys():
+        old_value = old.parameters.get(name)
+        new_value = new.parameters.get(name)
+        if old_value != new_value:
+            parameters[name] = (old_value, new_value)
+    if parameters:
+        changes["parameters"] = parameters
+
+    if sorted(old.tags) != sorted(new.tags):
+        changes["tags"] = (old.tags, new.tags)
+    if old.exported != new.exported:
+        changes["exported"] = (old.exported, new.exported)
+
+    return changes
+
+
+def diff_catalogs(old, new):
+    """Compares two catalogs, eg. the catalog of a node before and after a
+    code deploy or the catalogs of two different nodes.
+
+    Every resource and edge is fingerprinted once (and cached for as long as
+    the catalog is alive), so if the catalogs are identical this is a single
+    comparison and otherwise only the parameters of resources with different
+    fingerprints are compared.
+
+    :param old: The catalog to compare against.
+    :type old: :class:`pypuppetdb.types.Catalog` or\
+        :class:`pypuppetdb.diff.CatalogFingerprint`
+    :param new: The catalog to compare.
+    :type new: :class:`pypuppetdb.types.Catalog` or\
+        :class:`pypuppetdb.diff.CatalogFingerprint`
+
+    :returns: The differences between the catalogs.
+    :rtype: :class:`pypuppetdb.diff.CatalogDiff`
+    """
+    old = CatalogFingerprint.of(old)
+    new = CatalogFingerprint.of(new)
+
+    if old.digest == new.digest:
+        return CatalogDiff(old.node, new.node)
+
+    old_resources = old.resources
+    new_resources = new.resources
+
+    changed = {}
+    for identifier in old_resources.keys() & new_resources.keys():
+        if old_resources[identifier] != new_resources[identifier]:
+            changed[identifier] = _diff_resource(
+                old.catalog_resources[identifier], new.catalog_resources[identifier]
+            )
+
+    return CatalogDiff(
+        old.node,
+        new.node,
+        added_resources=sorted(new_resources.keys() - old_resources.keys()),
+        removed_resources=sorted(old_resources.keys() - new_resources.keys()),
+        changed_resources=changed,
+        added_edges=sorted(new.edges - old.edges),
+        removed_edges=sorted(old.edges - new.edges),
+    )
+
+
+def _diff_pair(pair):
+    old, new = pair
+    if isinstance(old, dict):
+        old = Catalog.create_from_dict(old)
+    if isinstance(new, dict):
+        new = Catalog.create_from_dict(new)
+    return diff_catalogs(old, new)
+
+
+def _diff_chunk(chunk):
+    return [_diff_pair(pair) for pair in chunk]
+
+
+def diff_many(pairs, max_workers=None, chunksize=8):
+    """Compares many pairs of catalogs in parallel worker processes.
+
+    Catalogs are sent to the workers by pickling, so passing the raw
+    catalog dicts as returned by PuppetDB is cheaper than passing
+    :class:`pypuppetdb.types.Catalog` objects. Both are accepted.
+
+    `pairs` is consumed lazily: at most two chunks per worker are in
+    flight, so a generator that fetches the catalogs from PuppetDB is
+    never read far ahead of the workers, and the diffs are yielded as
+    soon as they are done.
+
+    :param pairs: An iterable of ``(old, new)`` catalogs.
+    :type pairs: iterable of :obj:`tuple`
+    :param max_workers: (optional) The number of worker processes, if\
+        `None` one per CPU is used. With `1` the catalogs are compared in\
+        the current process.
+    :type max_workers: :obj:`None` or :obj:`int`
+    :param chunksize: (Default: 8) How many pairs to send to a worker at a\
+        time.
+    :type chunksize: :obj:`int`
+
+    :returns: A generator yielding a CatalogDiff per pair, in order.
+    :rtype: :class:`pypuppetdb.diff.CatalogDiff`
+    """
+    if max_workers == 1:
+        for pair in pairs:
+            yield _diff_pair(pair)
+        return
+
+    window = 2 * (max_workers or os.cpu_count() or 1)
+    pairs = iter(pairs)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = collections.deque()
+        try:
+            while True:
+                chunk = list(itertools.islice(pairs, chunksize))
+                if chunk:
+                    pending.append(executor.submit(_diff_chunk, chunk))
+                if pending and (len(pending) >= window or not chunk):
+                    yield from pending.popleft().result()
+                elif not chunk:
+                    return
+        finally:
+            # stopped early, don't diff the chunks that haven't started
+            for future in pending:
+                future.cancel()
@@ -26,3 +26,33 @@ class DoesNotComputeError(APIError):
     """
 
     pass
+
+
+class UnboundedQueryError(APIError):
+    """This exception is thrown by a
+    :class:`~pypuppetdb.guard.QueryGuard` that rejects a query which may
+    return more results than PuppetDB should produce at once."""
+
+    pass
+
+
+class PqlSyntaxError(APIError):
+    """This exception is thrown when a PQL query is parsed locally and
+    turns out not to be valid PQL, before it is ever sent to PuppetDB."""
+
+    pass
+
+
+class MetricReadError(DoesNotComputeError):
+    """This error is returned (not thrown) by
+    :meth:`~pypuppetdb.api.MetricsAPI.metrics` for every metric in a bulk
+    read that could not be read, eg. because the mbean doesn't exist.
+
+    :ivar mbean: The mbean that could not be read.
+    :ivar status: The status Jolokia answered with for it.
+    """
+
+    def __init__(self, message, mbean=None, status=None):
+        super().__init__(message)
+        self.mbean = mbean
+        self.status = status
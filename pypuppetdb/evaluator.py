@@ -0,0 +1,245 @@
+import json
+import logging
+import operator
+import re
+
+from pypuppetdb.errors import APIError
+
+log = logging.getLogger(__name__)
+
+_MISSING = object()
+
+COMPARISONS = {
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+}
+
+
+def _getter(field):
+    """Builds a function that gets the value of a field from a row. Dotted
+    fields, eg. ``facts.os.family``, descend into structured values unless
+    the row has a key with the dotted name itself, like the results of an
+    extract query have."""
+    if not isinstance(field, str):
+        raise APIError(f"Only string fields can be evaluated locally, got {field}")
+
+    parts = field.split(".")
+    if len(parts) == 1:
+
+        def get(row):
+            return row.get(field, _MISSING)
+
+        return get
+
+    steps = [int(p) if p.isdigit() else p for p in parts]
+
+    def get_path(row):
+        value = row.get(field, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = row
+        for step in steps:
+            if isinstance(value, dict):
+                value = value.get(str(step), _MISSING)
+            elif isinstance(value, list) and isinstance(step, int):
+                value = value[step] if step < len(value) else _MISSING
+            else:
+                return _MISSING
+            if value is _MISSING:
+                return value
+        return value
+
+    return get_path
+
+
+def _compile_equals(field, expected):
+    get = _getter(field)
+    # True == 1 in Python but not in PuppetDB
+    if isinstance(expected, bool):
+        return lambda row: get(row) is expected
+    if isinstance(expected, (int, float)):
+
+        def predicate(row):
+            value = get(row)
+            return not isinstance(value, bool) and value == expected
+
+        return predicate
+    return lambda row: get(row) == expected
+
+
+def _compile_comparison(operator_, field, expected):
+    get = _getter(field)
+    compare = COMPARISONS[operator_]
+
+    def predicate(row):
+        value = get(row)
+        if value is _MISSING or value is None:
+            return False
+        try:
+            return compare(value, expected)
+        except TypeError:
+            return False
+
+    return predicate
+
+
+def _compile_regex(field, pattern):
+    get = _getter(field)
+    search = re.compile(pattern).search
+
+    def predicate(row):
+        value = get(row)
+        return isinstance(value, str) and search(value) is not None
+
+    return predicate
+
+
+def _compile_regex_array(field, patterns):
+    get = _getter(field)
+    searches = [re.compile(p).search for p in patterns]
+
+    def predicate(row):
+        value = get(row)
+        if not isinstance(value, list) or len(value) != len(searches):
+            return False
+        return all(
+            search(str(element)) is not None for search, element in zip(searches, value)
+        )
+
+    return predicate
+
+
+def _compile_null(field, is_null):
+    get = _getter(field)
+
+    def predicate(row):
+        value = get(row)
+        return value is _MISSING or value is None
+
+    if is_null:
+        return predicate
+    return lambda row: not predicate(row)
+
+
+def _compile_in(field, values):
+    if not (isinstance(values, list) and len(values) == 2 and values[0] == "array"):
+        raise APIError("Only in operators with an array can be evaluated locally")
+    if not isinstance(field, str):
+        raise APIError("Only in operators on a single field can be evaluated locally")
+    get = _getter(field)
+    try:
+        # keep the type so that True and 1 don't match each other
+        members = {(type(v), v) for v in values[1]}
+    except TypeError:
+        keys = {json.dumps(v, sort_keys=True) for v in values[1]}
+
+        def predicate_slow(row):
+            value = get(row)
+            return value is not _MISSING and json.dumps(value, sort_keys=True) in keys
+
+        return predicate_slow
+
+    def predicate(row):
+        value = get(row)
+        try:
+            return (type(value), value) in members
+        except TypeError:
+            return False
+
+    return predicate
+
+
+def _compile(ast):
+    if not isinstance(ast, list) or len(ast) == 0:
+        raise APIError(f"Can not evaluate query {ast}")
+
+    operator_ = ast[0]
+
+    if operator_ == "and":
+        predicates = [_compile(op) for op in ast[1:]]
+        if len(predicates) == 2:
+            first, second = predicates
+            return lambda row: first(row) and second(row)
+        return lambda row: all(p(row) for p in predicates)
+
+    if operator_ == "or":
+        predicates = [_compile(op) for op in ast[1:]]
+        if len(predicates) == 2:
+            first, second = predicates
+            return lambda row: first(row) or second(row)
+        return lambda row: any(p(row) for p in predicates)
+
+    if operator_ == "not":
+        if len(ast) != 2:
+            raise APIError("The not operator takes exactly one query")
+        inner = _compile(ast[1])
+        return lambda row: not inner(row)
+
+    if len(ast) != 3:
+        raise APIError(f"Can not evaluate query {ast}")
+
+    _, field, value = ast
+    if operator_ == "=":
+        return _compile_equals(field, value)
+    if operator_ in COMPARISONS:
+        return _compile_comparison(operator_, field, value)
+    if operator_ == "~":
+        return _compile_regex(field, value)
+    if operator_ == "~>":
+        return _compile_regex_array(field, value)
+    if operator_ == "null?":
+        return _compile_null(field, value)
+    if operator_ == "in":
+        return _compile_in(field, value)
+
+    raise APIError(f"Operator {operator_} can not be evaluated locally")
+
+
+def compile_query(query):
+    """Compiles a query into a Python function that tells whether a row,
+    ie. a dict as returned by PuppetDB, matches the query. This makes it
+    possible to run the same queries that are sent to PuppetDB against
+    data that is already at hand, such as cached factsets or the results
+    of an earlier query.
+
+    Regular expressions are compiled once and `in` arrays are turned into
+    sets, so evaluating the function on a row is cheap.
+
+    The supported operators are `and`, `or`, `not`, `=`, `>`, `<`, `>=`,
+    `<=`, `~`, `~>`, `null?` and `in` with an array. Dotted fields such as
+    ``facts.os.family`` look up structured values. Subqueries and
+    functions can only be evaluated by PuppetDB.
+
+    :param query: The query.
+    :type query: :obj:`string` or any operator object
+
+    :raises: :class:`~pypuppetdb.errors.APIError` if the query uses an\
+        operator that can't be evaluated locally.
+
+    :returns: A function taking a row and returning a :obj:`bool`.
+    """
+    if isinstance(query, str):
+        ast = json.loads(query)
+    elif hasattr(query, "json_data"):
+        ast = query.json_data()
+    else:
+        ast = query
+    return _compile(ast)
+
+
+def filter_rows(query, rows):
+    """Filters rows with a query, see
+    :func:`~pypuppetdb.evaluator.compile_query`.
+
+    :param query: The query.
+    :type query: :obj:`string` or any operator object
+    :param rows: The rows to filter.
+    :type rows: iterable of :obj:`dict`
+
+    :returns: A generator yielding the matching rows.
+    :rtype: :obj:`dict`
+    """
+    predicate = compile_query(query)
+    return (row for row in rows if predicate(row))
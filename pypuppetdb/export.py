@@ -0,0 +1,271 @@
+import argparse
+import bz2
+import csv
+import gzip
+import io
+import json
+import logging
+import lzma
+import os
+import sys
+
+from pypuppetdb.cli import add_connection_arguments, connect_from_arguments
+from pypuppetdb.errors import APIError
+from pypuppetdb.pql import parse_ast
+
+log = logging.getLogger(__name__)
+
+COMPRESSION = {
+    "gzip": gzip.open,
+    "bz2": bz2.open,
+    "xz": lzma.open,
+}
+
+EXTENSIONS = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz"}
+
+
+def _open(path, mode, compression):
+    if compression is None:
+        return open(path, mode, encoding="utf-8", newline="")
+    return COMPRESSION[compression](path, mode, encoding="utf-8", newline="")
+
+
+def _guess(path, fmt, compression):
+    """Guess the format and compression from the name of the output."""
+    name = path
+    ext = os.path.splitext(name)[1]
+    if compression is None and ext in EXTENSIONS:
+        compression = EXTENSIONS[ext]
+        name = name[: -len(ext)]
+    if fmt is None:
+        fmt = "csv" if name.endswith(".csv") else "jsonl"
+    if fmt not in ("jsonl", "csv"):
+        raise APIError(f"Unsupported export format {fmt}")
+    if compression is not None and compression not in COMPRESSION:
+        raise APIError(f"Unsupported compression {compression}")
+    return fmt, compression
+
+
+def _resume_point(path, fmt, compression):
+    """Counts the complete rows of an earlier export, the offset to resume
+    it at, and reads its CSV header. Reading streams through the file, so
+    memory use stays constant."""
+    count = 0
+    header = None
+    try:
+        with _open(path, "rt", compression) as f:
+            if fmt == "csv":
+                reader = csv.reader(f)
+                header = next(reader, None)
+                for _ in reader:
+                    count += 1
+            else:
+                for line in f:
+                    if line.endswith("\n"):
+                        count += 1
+    except (EOFError, OSError, lzma.LZMAError) as err:
+        raise APIError(f"Can not resume the truncated export {path}: {err}")
+    return count, header
+
+
+def _truncate_partial_line(path):
+    """Cuts off a partially written last line of an uncompressed export."""
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        position = end
+        while position > 0:
+            step = min(4096, position)
+            f.seek(position - step)
+            chunk = f.read(step)
+            newline = chunk.rfind(b"\n")
+            if newline != -1:
+                position = position - step + newline + 1
+                break
+            position -= step
+        if position != end:
+            f.truncate(position)
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def export(
+    api,
+    output,
+    endpoint=None,
+    query=None,
+    pql=None,
+    fmt=None,
+    compression=None,
+    resume=False,
+    page_size=1000,
+    key=None,
+    fields=None,
+):
+    """Exports the results of a query to a JSON Lines or CSV file while
+    they are fetched, page by page, so memory use doesn't grow with the
+    number of results.
+
+    Results are ordered by the `key` fields, followed by the fields that
+    identify a result of the endpoint (see `UNIQUE_FIELDS` in
+    :mod:`pypuppetdb.api.base`), so that the pages are consistent. With
+    `resume` an existing export is continued at the offset of the number
+    of results it holds, eg. after an interruption.
+
+    :param api: The API to export from.
+    :type api: :class:`pypuppetdb.api.API`
+    :param output: The file to write to, or a text file object (without\
+        compression and resume support).
+    :type output: :obj:`string` or file object
+    :param endpoint: The endpoint, eg. ``resources``. Either this or `pql`\
+        is required.
+    :type endpoint: :obj:`string`
+    :param query: (optional) An AST query to narrow down the results.
+    :type query: :obj:`string` or any operator object
+    :param pql: A PQL query, eg. ``resources { type = "Class" }``.
+    :type pql: :obj:`string`
+    :param fmt: (optional) ``jsonl`` or ``csv``, guessed from the file\
+        name if not given.
+    :type fmt: :obj:`string`
+    :param compression: (optional) ``gzip``, ``bz2`` or ``xz``, guessed\
+        from the file name if not given.
+    :type compression: :obj:`string`
+    :param resume: (Default: `False`) Continue an earlier export.
+    :type resume: :obj:`bool`
+    :param page_size: (Default: 1000) The number of results per request.
+    :type page_size: :obj:`int`
+    :param key: (optional) The fields to order the results by, required\
+        for endpoints without `UNIQUE_FIELDS`.
+    :type key: :obj:`list`
+    :param fields: (optional) The CSV columns, defaults to the fields of\
+        the first result. Structured values are written as JSON.
+    :type fields: :obj:`list`
+
+    :raises: :class:`~pypuppetdb.errors.APIError`
+
+    :returns: The number of results written.
+    :rtype: :obj:`int`
+    """
+    if pql is not None:
+        ast = parse_ast(pql)
+        if any(clause[0] in ("order_by", "limit", "offset") for clause in ast[2:]):
+            raise APIError("PQL queries with paging can not be exported")
+        endpoint = ast[1].replace("_", "-")
+        query = ast[2] if len(ast) > 2 else None
+    if endpoint is None:
+        raise APIError("Either an endpoint or a PQL query is required")
+
+    if isinstance(query, list):
+        query = json.dumps(query)
+    order_by = None
+    if key is not None:
+        order_by = json.dumps([{"field": k, "order": "asc"} for k in key])
+    # fails before anything is written for endpoints that can't be paged
+    order_by = api._unique_order(endpoint, order_by)
+
+    path = output if isinstance(output, str) else None
+    if path is not None:
+        fmt, compression = _guess(path, fmt, compression)
+    elif fmt is None:
+        fmt = "jsonl"
+
+    mode = "wt"
+    offset = 0
+    if resume and path is not None and os.path.exists(path):
+        if compression is None:
+            _truncate_partial_line(path)
+        offset, header = _resume_point(path, fmt, compression)
+        if header is not None:
+            fields = header
+        log.info(f"Resuming export of {endpoint} at result {offset}")
+        mode = "at"
+
+    results = api._query_paged(
+        endpoint, page_size, order_by=order_by, query=query, offset=offset
+    )
+
+    if path is not None:
+        f = _open(path, mode, compression)
+    else:
+        f = output
+    try:
+        return _write(f, results, fmt, fields, page_size, write_header=mode == "wt")
+    finally:
+        if path is not None:
+            f.close()
+
+
+def _write(f, results, fmt, fields, page_size, write_header):
+    count = 0
+    buffer = io.StringIO()
+    writer = None
+
+    for result in results:
+        if fmt == "csv":
+            if writer is None:
+                if fields is None:
+                    fields = list(result)
+                writer = csv.DictWriter(
+                    buffer, fieldnames=fields, extrasaction="ignore"
+                )
+                if write_header:
+                    writer.writeheader()
+            writer.writerow({k: _csv_value(v) for k, v in result.items()})
+        else:
+            buffer.write(json.dumps(result, separators=(",", ":")))
+            buffer.write("\n")
+        count += 1
+
+        # write whole rows only, a page at a time
+        if count % page_size == 0:
+            f.write(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+
+    f.write(buffer.getvalue())
+    f.flush()
+    return count
+
+
+def main(argv=None):
+    """The ``pypuppetdb-export`` command."""
+    parser = argparse.ArgumentParser(
+        description="Export the results of a PuppetDB query to JSON Lines or CSV."
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--endpoint", help="the endpoint to export, eg. resources")
+    source.add_argument("--pql", help="a PQL query to export")
+    parser.add_argument("--query", help="an AST query to narrow down the endpoint")
+    parser.add_argument(
+        "-o", "--output", default="-", help="the file to write to (default: stdout)"
+    )
+    parser.add_argument("--format", choices=["jsonl", "csv"], dest="fmt")
+    parser.add_argument("--compression", choices=sorted(COMPRESSION))
+    parser.add_argument(
+        "--resume", action="store_true", help="continue an interrupted export"
+    )
+    parser.add_argument("--page-size", type=int, default=1000)
+    add_connection_arguments(parser)
+    args = parser.parse_args(argv)
+
+    api = connect_from_arguments(args)
+
+    output = sys.stdout if args.output == "-" else args.output
+    with api:
+        count = export(
+            api,
+            output,
+            endpoint=args.endpoint,
+            query=args.query,
+            pql=args.pql,
+            fmt=args.fmt,
+            compression=args.compression,
+            resume=args.resume,
+            page_size=args.page_size,
+        )
+    log.info(f"Exported {count} results")
+    return 0
@@ -0,0 +1,426 @@
+import argparse
+import bisect
+import logging
+import re
+import threading
+import time
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+
+from pypuppetdb.api.base import endpoint_name
+from pypuppetdb.cli import add_connection_arguments, connect_from_arguments
+from pypuppetdb.errors import APIError, MetricReadError
+
+log = logging.getLogger(__name__)
+
+# the mbeans exported by default, all their numeric attributes are exported
+DEFAULT_MBEANS = [
+    "puppetlabs.puppetdb.mq:name=global.depth",
+    "puppetlabs.puppetdb.mq:name=global.seen",
+    "puppetlabs.puppetdb.mq:name=global.processed",
+    "puppetlabs.puppetdb.mq:name=global.retried",
+    "puppetlabs.puppetdb.mq:name=global.discarded",
+    "puppetlabs.puppetdb.mq:name=global.fatal",
+    "puppetlabs.puppetdb.mq:name=global.processing-time",
+    "puppetlabs.puppetdb.mq:name=global.message-persistence-time",
+    "puppetlabs.puppetdb.storage:name=replace-catalog-time",
+    "puppetlabs.puppetdb.storage:name=replace-facts-time",
+    "puppetlabs.puppetdb.storage:name=store-report-time",
+    "puppetlabs.puppetdb.storage:name=gc-time",
+    "puppetlabs.puppetdb.storage:name=duplicate-pct",
+    "puppetlabs.puppetdb.population:name=num-nodes",
+    "puppetlabs.puppetdb.population:name=num-resources",
+    "puppetlabs.puppetdb.population:name=avg-resources-per-node",
+    "puppetlabs.puppetdb.population:name=pct-resource-dupes",
+]
+
+# the upper bounds of the request latency buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def metric_name(*parts):
+    """Turns the parts of a name, eg. an mbean and an attribute, into a
+    valid Prometheus metric name.
+
+    :rtype: :obj:`string`
+    """
+    name = "_".join(parts).replace("puppetlabs.puppetdb.", "puppetdb.")
+    name = re.sub(r"[^a-zA-Z0-9_]+", "_", name)
+    name = re.sub(r"([a-z0-9])([A-Z])", r"\1_\2", name).lower()
+    return name.strip("_")
+
+
+def _value(value):
+    if isinstance(value, bool):
+        return 1 if value else 0
+    if isinstance(value, (int, float)):
+        return value
+    return None
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        '{}="{}"'.format(
+            k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        )
+        for k, v in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Histogram:
+    """Counts observations, eg. request latencies, in buckets of an
+    :class:`array.array`, like a Prometheus histogram.
+
+    :param buckets: The upper bounds of the buckets, sorted.
+    :type buckets: :obj:`tuple`
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # the last count is for the +Inf bucket
+        self.counts = array("Q", [0]) * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Counts a value."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels=()):
+        """Get the histogram in the Prometheus text format, without the
+        ``# TYPE`` line.
+
+        :rtype: :obj:`list` of :obj:`string`
+        """
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            le = bound if isinstance(bound, str) else repr(float(bound))
+            lines.append(
+                f"{name}_bucket{_labels(tuple(labels) + (('le', le),))} {cumulative}"
+            )
+        lines.append(f"{name}_sum{_labels(labels)} {self.sum}")
+        lines.append(f"{name}_count{_labels(labels)} {self.count}")
+        return lines
+
+
+class RequestMetrics:
+    """Collects the latency of every request this library makes to
+    PuppetDB, per endpoint and method, and the number of requests that
+    succeeded or failed.
+
+    Pass it as `request_metrics` to :func:`~pypuppetdb.connect`.
+
+    :param buckets: (optional) The upper bounds of the latency buckets, in\
+        seconds.
+    :type buckets: :obj:`tuple`
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.latency = {}
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<RequestMetrics: {sum(self.requests.values())} requests>"
+
+    def observe(self, url, method, outcome, seconds):
+        """Counts a request.
+
+        :param url: The URL requested.
+        :type url: :obj:`string`
+        :param method: The HTTP method.
+        :type method: :obj:`string`
+        :param outcome: ``success`` or ``error``.
+        :type outcome: :obj:`string`
+        :param seconds: How long the request took.
+        :type seconds: :obj:`float`
+        """
+        key = (endpoint_name(url), method.upper())
+        with self._lock:
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+            counter = key + (outcome,)
+            self.requests[counter] = self.requests.get(counter, 0) + 1
+
+    def render(self):
+        """Get the metrics in the Prometheus text format.
+
+        :rtype: :obj:`list` of :obj:`string`
+        """
+        lines = [
+            "# HELP pypuppetdb_request_duration_seconds Latency of requests to PuppetDB.",
+            "# TYPE pypuppetdb_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            for (endpoint, method), histogram in sorted(self.latency.items()):
+                lines.extend(
+                    histogram.render(
+                        "pypuppetdb_request_duration_seconds",
+                        (("endpoint", endpoint), ("method", method)),
+                    )
+                )
+            lines.append("# HELP pypuppetdb_requests_total Requests to PuppetDB.")
+            lines.append("# TYPE pypuppetdb_requests_total counter")
+            for (endpoint, method, outcome), count in sorted(self.requests.items()):
+                labels = (
+                    ("endpoint", endpoint),
+                    ("method", method),
+                    ("outcome", outcome),
+                )
+                lines.append(f"pypuppetdb_requests_total{_labels(labels)} {count}")
+        return lines
+
+
+class Exporter:
+    """Exports the metrics and status of PuppetDB, and the latency of the
+    requests made to it, in the Prometheus text format.
+
+    The metrics are read with a single bulk read and the status with a
+    single request every `interval` seconds, in a background thread, and
+    the rendered text is cached. Scrapes are always answered from that
+    cache, so however often it is scraped, PuppetDB is asked once per
+    `interval`. The client latencies are kept in memory and rendered at
+    every scrape, so they are never stale.
+
+    :param api: The API to export, connected with `request_metrics` to\
+        export the client latencies too.
+    :type api: :class:`pypuppetdb.api.API`
+    :param mbeans: (Default: `DEFAULT_MBEANS`) The mbeans to export, with\
+        all their numeric attributes.
+    :type mbeans: :obj:`list`
+    :param interval: (Default: 15) Number of seconds between reads.
+    :type interval: :obj:`float`
+
+    :ivar refreshes: Number of times the metrics were read.
+    :ivar errors: Number of reads that failed.
+    """
+
+    def __init__(self, api, mbeans=None, interval=15):
+        self.api = api
+        self.mbeans = list(mbeans if mbeans is not None else DEFAULT_MBEANS)
+        self.interval = interval
+        self.refreshes = 0
+        self.errors = 0
+        self._metrics = {}
+        self._status = None
+        self._refreshed_at = None
+        self._duration = 0.0
+        self._text = b""
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker = None
+        self._server = None
+
+    def __repr__(self):
+        return f"<Exporter: {len(self.mbeans)} mbeans>"
+
+    def refresh(self):
+        """Reads the metrics and status from PuppetDB."""
+        start = time.perf_counter()
+        errors = 0
+        try:
+            metrics = self.api.metrics(self.mbeans)
+        except (APIError, requests.exceptions.RequestException, ValueError) as err:
+            log.warning(f"Could not read PuppetDB metrics: {err}")
+            metrics = {}
+            errors += 1
+        try:
+            status = self.api.status()
+        except (APIError, requests.exceptions.RequestException, ValueError) as err:
+            log.warning(f"Could not read PuppetDB status: {err}")
+            status = None
+            errors += 1
+
+        with self._lock:
+            self.errors += errors
+            self._metrics = metrics
+            self._status = status
+            self._refreshed_at = time.time()
+            self._duration = time.perf_counter() - start
+            self.refreshes += 1
+        self.render()
+
+    def _render_metrics(self):
+        lines = []
+        for mbean in self.mbeans:
+            value = self._metrics.get(mbean)
+            if value is None or isinstance(value, MetricReadError):
+                continue
+            if not isinstance(value, dict):
+                value = {"Value": value}
+            for attribute, attribute_value in sorted(value.items()):
+                number = _value(attribute_value)
+                if number is None:
+                    continue
+                name = metric_name(mbean, attribute)
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {number}")
+        return lines
+
+    def _render_status(self):
+        status = self._status or {}
+        lines = [
+            "# HELP puppetdb_up Whether PuppetDB reports itself as running.",
+            "# TYPE puppetdb_up gauge",
+            "puppetdb_up {}".format(1 if status.get("state") == "running" else 0),
+        ]
+        for key, value in sorted((status.get("status") or {}).items()):
+            number = _value(value)
+            if number is None:
+                continue
+            name = metric_name("puppetdb_status", key)
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {number}")
+        return lines
+
+    def render(self):
+        """Renders the cached metrics into the text served to scrapes.
+
+        :returns: The text a scrape gets.
+        :rtype: :obj:`bytes`
+        """
+        with self._lock:
+            lines = self._render_status()
+            lines.extend(self._render_metrics())
+            lines.extend(
+                [
+                    "# TYPE pypuppetdb_exporter_refresh_duration_seconds gauge",
+                    f"pypuppetdb_exporter_refresh_duration_seconds {self._duration}",
+                    "# TYPE pypuppetdb_exporter_last_refresh_timestamp_seconds gauge",
+                    "pypuppetdb_exporter_last_refresh_timestamp_seconds {}".format(
+                        self._refreshed_at or 0
+                    ),
+                    "# TYPE pypuppetdb_exporter_errors_total counter",
+                    f"pypuppetdb_exporter_errors_total {self.errors}",
+                ]
+            )
+        self._text = ("\n".join(lines) + "\n").encode("utf-8")
+        return self.scrape()
+
+    def scrape(self):
+        """Get the text to serve to a scrape, the PuppetDB metrics from the
+        cache and the client latencies as they are now.
+
+        :rtype: :obj:`bytes`
+        """
+        if self.api.request_metrics is None:
+            return self._text
+        lines = self.api.request_metrics.render()
+        return self._text + ("\n".join(lines) + "\n").encode("utf-8")
+
+    def _run(self, wait):
+        while not self._stop.wait(wait):
+            started = time.monotonic()
+            self.refresh()
+            wait = max(0, self.interval - (time.monotonic() - started))
+
+    def start(self):
+        """Starts reading the metrics in a background thread, the first
+        time right away unless they were read less than `interval` seconds
+        ago."""
+        if self._worker is not None:
+            return
+        wait = 0
+        if self._refreshed_at is not None:
+            wait = max(0, self.interval - (time.time() - self._refreshed_at))
+        self._stop.clear()
+        self._worker = threading.Thread(
+            target=self._run, args=(wait,), name="pypuppetdb-exporter", daemon=True
+        )
+        self._worker.start()
+
+    def stop(self, timeout=None):
+        """Stops the background thread and the HTTP server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._worker is None:
+            return
+        self._stop.set()
+        self._worker.join(timeout)
+        self._worker = None
+
+    def server(self, host="", port=9635):
+        """Creates the HTTP server that serves the metrics at ``/metrics``.
+
+        :rtype: :class:`http.server.ThreadingHTTPServer`
+        """
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if urlsplit(self.path).path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.scrape()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                log.debug(format % args)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        return self._server
+
+    def serve(self, host="", port=9635):
+        """Reads the metrics in the background and serves them at
+        ``/metrics`` until interrupted. They are read once before the
+        server starts, so that no scrape gets an empty answer."""
+        self.refresh()
+        self.start()
+        server = self.server(host, port)
+        log.info(f"Serving PuppetDB metrics on {host or '*'}:{port}")
+        try:
+            server.serve_forever()
+        finally:
+            self.stop()
+
+
+def main(argv=None):
+    """The ``pypuppetdb-exporter`` command."""
+    parser = argparse.ArgumentParser(
+        description="Export the metrics of PuppetDB to Prometheus."
+    )
+    parser.add_argument("--listen-address", default="")
+    parser.add_argument("--listen-port", type=int, default=9635)
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=15,
+        help="seconds between reads of the PuppetDB metrics",
+    )
+    parser.add_argument(
+        "--mbean",
+        action="append",
+        dest="mbeans",
+        help="an mbean to export, may be given more than once",
+    )
+    add_connection_arguments(parser)
+    args = parser.parse_args(argv)
+
+    api = connect_from_arguments(args, request_metrics=RequestMetrics())
+    exporter = Exporter(api, mbeans=args.mbeans, interval=args.interval)
+    try:
+        exporter.serve(args.listen_address, args.listen_port)
+    except KeyboardInterrupt:
+        pass
+    return 0
@@ -0,0 +1,140 @@
+import datetime
+import json
+import logging
+
+from pypuppetdb.QueryBuilder import AndOperator, GreaterEqualOperator
+from pypuppetdb.errors import APIError
+from pypuppetdb.utils import UTC, datetime_to_json, json_to_datetime
+
+log = logging.getLogger(__name__)
+
+# the timestamp that tells when an object arrived in PuppetDB, and the
+# fields that identify the object
+FOLLOW_FIELDS = {
+    "reports": ("receive_time", ("hash",)),
+    "events": (
+        "report_receive_time",
+        ("report", "resource_type", "resource_title", "property"),
+    ),
+    "factsets": ("producer_timestamp", ("hash",)),
+}
+
+
+class Follower:
+    """Polls an endpoint for new objects, see
+    :meth:`~pypuppetdb.api.QueryAPI.follow`.
+
+    Every poll asks for the objects that arrived since the newest one seen
+    so far (the watermark) minus an overlap window, which catches objects
+    that were stored late with an earlier timestamp. The objects seen in
+    the overlap window are remembered, so every object is returned once.
+
+    The interval between polls starts at `min_interval`, doubles every
+    time a poll finds nothing new, up to `max_interval`, and goes back to
+    `min_interval` when something new arrives.
+
+    :param api: The API to poll.
+    :type api: :class:`pypuppetdb.api.QueryAPI`
+    :param endpoint: One of ``reports``, ``events`` or ``factsets``.
+    :type endpoint: :obj:`string`
+    :param query: (optional) A query to narrow down the objects.
+    :type query: :obj:`string` or any operator object
+    :param since: (optional) Only return objects that arrived after this,\
+        defaults to now.
+    :type since: :obj:`None`, :obj:`string` or a timezone aware\
+        :class:`datetime.datetime`
+    :param overlap: (Default: 5) The overlap window, in seconds.
+    :type overlap: :obj:`float`
+    :param min_interval: (Default: 1) The shortest interval, in seconds.
+    :type min_interval: :obj:`float`
+    :param max_interval: (Default: 30) The longest interval, in seconds.
+    :type max_interval: :obj:`float`
+
+    :ivar interval: The number of seconds to wait before the next poll.
+    """
+
+    def __init__(
+        self,
+        api,
+        endpoint,
+        query=None,
+        since=None,
+        overlap=5,
+        min_interval=1,
+        max_interval=30,
+    ):
+        if endpoint not in FOLLOW_FIELDS:
+            raise APIError(f"Endpoint {endpoint} can not be followed")
+        self.api = api
+        self.endpoint = endpoint
+        self.field, self.keys = FOLLOW_FIELDS[endpoint]
+        self.query = query
+        self.overlap = datetime.timedelta(seconds=overlap)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+
+        if since is None:
+            since = datetime.datetime.now(UTC())
+        elif isinstance(since, str):
+            since = json_to_datetime(since)
+        self.since = since
+        self.watermark = since
+        self._seen = {}
+
+    def __repr__(self):
+        return "<Follower: {} since {}>".format(
+            self.endpoint, datetime_to_json(self.watermark)
+        )
+
+    def poll(self):
+        """Polls PuppetDB once.
+
+        :returns: The objects that arrived since the previous poll, oldest\
+            first.
+        :rtype: :obj:`list` of :obj:`dict`
+        """
+        query = AndOperator()
+        query.add(
+            GreaterEqualOperator(
+                self.field, datetime_to_json(self.watermark - self.overlap)
+            )
+        )
+        if self.query is not None:
+            query.add(self.query)
+
+        rows = self.api._query(
+            self.endpoint,
+            query=query,
+            order_by=json.dumps([{"field": self.field, "order": "asc"}]),
+            cache=False,
+        )
+
+        new = []
+        for row in rows:
+            key = tuple(row.get(k) for k in self.keys)
+            if key in self._seen:
+                continue
+            try:
+                timestamp = json_to_datetime(row[self.field])
+            except (KeyError, TypeError, ValueError):
+                timestamp = self.watermark
+            if timestamp < self.since:
+                continue
+            self._seen[key] = timestamp
+            if timestamp > self.watermark:
+                self.watermark = timestamp
+            new.append(row)
+
+        # only the objects in the overlap window can be returned again
+        horizon = self.watermark - self.overlap
+        self._seen = {k: t for k, t in self._seen.items() if t >= horizon}
+
+        if new:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+        log.debug(
+            f"Found {len(new)} new {self.endpoint}, next poll in {self.interval}s"
+        )
+        return new
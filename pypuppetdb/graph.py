@@ -0,0 +1,378 @@
+import logging
+
+from pypuppetdb.errors import APIError
+
+log = logging.getLogger(__name__)
+
+
+class CatalogGraph:
+    """This object represents the dependency graph of a catalog and answers
+    graph questions about it, such as the order in which resources are
+    applied, which resources are affected by a change to a given resource
+    and whether there are any dependency cycles.
+
+    Resources are identified the same way as in
+    :attr:`pypuppetdb.types.Catalog.resources`, ie. ``Type[title]``.
+    Internally every resource is mapped to an integer so that adjacency
+    lists, the strongly connected components and the transitive closure are
+    all kept as plain lists of ints and int bitsets, which keeps even
+    catalogs with tens of thousands of resources cheap to analyse.
+
+    Edges always point from the resource that is applied first to the
+    resource that is applied after it, which is how PuppetDB stores all of
+    the relationship types.
+
+    :param resources: The resource identifiers, or a dict of identifiers\
+        to :class:`pypuppetdb.types.Resource` objects.
+    :type resources: :obj:`dict` or :obj:`list`
+    :param edges: The edges between the resources. Sources and targets can\
+        be either Resource objects or identifiers.
+    :type edges: :obj:`list` of :class:`pypuppetdb.types.Edge`
+    :param relationships: (optional) Only use edges with these\
+        relationships, eg. ``["before", "required-by"]``.
+    :type relationships: :obj:`None` or :obj:`list` of :obj:`string`
+
+    :ivar nodes: A :obj:`list` of all resource identifiers in the graph.
+    :ivar resources: A :obj:`dict` of identifiers to Resource objects, if\
+        they were provided.
+    """
+
+    def __init__(self, resources, edges, relationships=None):
+        if isinstance(resources, dict):
+            self.resources = resources
+        else:
+            self.resources = {}
+        self.nodes = list(resources)
+        self._index = {node: i for i, node in enumerate(self.nodes)}
+
+        self._successors = [[] for _ in self.nodes]
+        self._predecessors = [[] for _ in self.nodes]
+        self.edges = []
+        for edge in edges:
+            if relationships is not None and edge.relationship not in relationships:
+                continue
+            source = self._add_node(str(edge.source))
+            target = self._add_node(str(edge.target))
+            self._successors[source].append(target)
+            self._predecessors[target].append(source)
+            self.edges.append(edge)
+
+        self._components = None
+        self._component_of = None
+        self._closure = {}
+
+    def __repr__(self):
+        return "<CatalogGraph: {} resources, {} edges>".format(
+            len(self.nodes), len(self.edges)
+        )
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, identifier):
+        return identifier in self._index
+
+    def _add_node(self, identifier):
+        try:
+            return self._index[identifier]
+        except KeyError:
+            index = len(self.nodes)
+            self.nodes.append(identifier)
+            self._index[identifier] = index
+            self._successors.append([])
+            self._predecessors.append([])
+            return index
+
+    def _lookup(self, identifier):
+        try:
+            return self._index[identifier]
+        except KeyError:
+            raise APIError(f"Resource {identifier} is not in this graph")
+
+    def _decode(self, bits):
+        """Turns an int bitset of node indexes into a list of identifiers."""
+        nodes = self.nodes
+        result = []
+        while bits:
+            low = bits & -bits
+            result.append(nodes[low.bit_length() - 1])
+            bits ^= low
+        return result
+
+    @staticmethod
+    def from_catalog(catalog, relationships=None):
+        """Builds the graph of a :class:`pypuppetdb.types.Catalog`.
+
+        :param catalog: The catalog to build the graph of.
+        :type catalog: :class:`pypuppetdb.types.Catalog`
+        :param relationships: (optional) Only use edges with these\
+            relationships.
+        :type relationships: :obj:`None` or :obj:`list` of :obj:`string`
+
+        :returns: An instance of CatalogGraph
+        :rtype: :class:`pypuppetdb.graph.CatalogGraph`
+        """
+        return CatalogGraph(catalog.resources, catalog.edges, relationships)
+
+    def successors(self, identifier):
+        """Get the resources directly applied after the given resource."""
+        return [self.nodes[i] for i in self._successors[self._lookup(identifier)]]
+
+    def predecessors(self, identifier):
+        """Get the resources directly applied before the given resource."""
+        return [self.nodes[i] for i in self._predecessors[self._lookup(identifier)]]
+
+    def strongly_connected_components(self):
+        """Computes the strongly connected components of the graph with an
+        iterative version of Tarjan's algorithm. The result is cached.
+
+        :returns: A list of components, each a list of node indexes. The\
+            components are in reverse topological order, ie. a component\
+            is always listed after all of the components it points to.
+        :rtype: :obj:`list` of :obj:`list` of :obj:`int`
+        """
+        if self._components is not None:
+            return self._components
+
+        successors = self._successors
+        count = len(self.nodes)
+        index = [-1] * count
+        lowlink = [0] * count
+        on_stack = [False] * count
+        stack = []
+        components = []
+        counter = 0
+
+        for root in range(count):
+            if index[root] != -1:
+                continue
+            work = [(root, 0)]
+            while work:
+                node, position = work.pop()
+                if position == 0:
+                    index[node] = lowlink[node] = counter
+                    counter += 1
+                    stack.append(node)
+                    on_stack[node] = True
+                children = successors[node]
+                while position < len(children):
+                    child = children[position]
+                    position += 1
+                    if index[child] == -1:
+                        work.append((node, position))
+                        work.append((child, 0))
+                        break
+                    elif on_stack[child]:
+                        lowlink[node] = min(lowlink[node], index[child])
+                else:
+                    if lowlink[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack[member] = False
+                            component.append(member)
+                            if member == node:
+                                break
+                        components.append(component)
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+        component_of = [0] * count
+        for number, component in enumerate(components):
+            for member in component:
+                component_of[member] = number
+
+        self._components = components
+        self._component_of = component_of
+        return components
+
+    def cycles(self):
+        """Get all dependency cycles in the graph. Every cycle is reported
+        as the set of resources in one strongly connected component, so
+        interlocking cycles are reported together.
+
+        :returns: A list of cycles, each a sorted list of identifiers.
+        :rtype: :obj:`list` of :obj:`list` of :obj:`string`
+        """
+        cycles = []
+        for component in self.strongly_connected_components():
+            if len(component) > 1 or component[0] in self._successors[component[0]]:
+                cycles.append(sorted(self.nodes[i] for i in component))
+        return cycles
+
+    def has_cycles(self):
+        """Whether there is at least one dependency cycle in the graph."""
+        return len(self.cycles()) > 0
+
+    def topological_order(self):
+        """Get the order in which the resources would be applied. Resources
+        without an ordering between them keep the order in which they
+        appear in the catalog.
+
+        :raises: :class:`~pypuppetdb.errors.APIError` if the graph has\
+            dependency cycles.
+
+        :returns: All resource identifiers in apply order.
+        :rtype: :obj:`list` of :obj:`string`
+        """
+        successors = self._successors
+        in_degree = [len(p) for p in self._predecessors]
+        ready = [i for i, degree in enumerate(in_degree) if degree == 0]
+        ready.reverse()
+        order = []
+        while ready:
+            node = ready.pop()
+            order.append(self.nodes[node])
+            released = []
+            for child in successors[node]:
+                in_degree[child] -= 1
+                if in_degree[child] == 0:
+                    released.append(child)
+            ready.extend(reversed(released))
+
+        if len(order) != len(self.nodes):
+            raise APIError(
+                "Catalog graph has dependency cycles: {}".format(self.cycles())
+            )
+        return order
+
+    def _descendant_bits(self, node):
+        """Returns the transitive closure of a node as an int bitset, using
+        the condensation of the graph so that every component is only
+        computed once. Results are cached per component."""
+        components = self.strongly_connected_components()
+        component_of = self._component_of
+        closure = self._closure
+        successors = self._successors
+
+        target = component_of[node]
+        if target in closure:
+            return closure[target]
+
+        # components are numbered in reverse topological order, so walking
+        # the needed components by ascending number visits children first
+        needed = set()
+        todo = [target]
+        while todo:
+            number = todo.pop()
+            if number in needed or number in closure:
+                continue
+            needed.add(number)
+            for member in components[number]:
+                for child in successors[member]:
+                    todo.append(component_of[child])
+
+        for number in sorted(needed):
+            bits = 0
+            for member in components[number]:
+                bits |= 1 << member
+            for member in components[number]:
+                for child in successors[member]:
+                    child_component = component_of[child]
+                    if child_component != number:
+                        bits |= closure[child_component]
+            closure[number] = bits
+
+        return closure[target]
+
+    def _in_cycle(self, node):
+        components = self.strongly_connected_components()
+        component = components[self._component_of[node]]
+        return len(component) > 1 or node in self._successors[node]
+
+    def descendants(self, identifier):
+        """Get all resources that are (transitively) applied after the
+        given resource, ie. everything that would be affected by a change
+        to it. The transitive closure is cached, so repeated calls are
+        cheap.
+
+        :param identifier: The resource, eg. ``File[/etc/ssh/sshd_config]``.
+        :type identifier: :obj:`string`
+
+        :returns: The identifiers of the affected resources.
+        :rtype: :obj:`list` of :obj:`string`
+        """
+        node = self._lookup(identifier)
+        bits = self._descendant_bits(node)
+        if not self._in_cycle(node):
+            bits &= ~(1 << node)
+        return self._decode(bits)
+
+    def ancestors(self, identifier):
+        """Get all resources that the given resource (transitively)
+        depends on.
+
+        :param identifier: The resource, eg. ``Service[sshd]``.
+        :type identifier: :obj:`string`
+
+        :returns: The identifiers of the resources it depends on.
+        :rtype: :obj:`list` of :obj:`string`
+        """
+        node = self._lookup(identifier)
+        predecessors = self._predecessors
+        seen = bytearray(len(self.nodes))
+        result = []
+        todo = [node]
+        while todo:
+            for parent in predecessors[todo.pop()]:
+                if not seen[parent]:
+                    seen[parent] = 1
+                    result.append(self.nodes[parent])
+                    todo.append(parent)
+        return result
+
+    def reaches(self, source, target):
+        """Whether the target is (transitively) applied after the source,
+        ie. whether a change to the source can affect the target.
+
+        :rtype: :obj:`bool`
+        """
+        source_node = self._lookup(source)
+        target_node = self._lookup(target)
+        if source_node == target_node:
+            return self._in_cycle(source_node)
+        return bool(self._descendant_bits(source_node) >> target_node & 1)
+
+    def subgraph(self, identifiers):
+        """Extracts the graph induced by the given resources, ie. only the
+        given resources and the edges between them.
+
+        :param identifiers: The resources to keep.
+        :type identifiers: :obj:`list` of :obj:`string`
+
+        :returns: A new CatalogGraph
+        :rtype: :class:`pypuppetdb.graph.CatalogGraph`
+        """
+        keep = set()
+        for identifier in identifiers:
+            keep.add(self._lookup(identifier))
+
+        if self.resources:
+            resources = {
+                self.nodes[i]: self.resources[self.nodes[i]]
+                for i in sorted(keep)
+                if self.nodes[i] in self.resources
+            }
+        else:
+            resources = [self.nodes[i] for i in sorted(keep)]
+
+        edges = [
+            edge
+            for edge in self.edges
+            if self._index[str(edge.source)] in keep
+            and self._index[str(edge.target)] in keep
+        ]
+        return CatalogGraph(resources, edges)
+
+    def impact_subgraph(self, identifier):
+        """Extracts the subgraph of the given resource and everything that
+        would be affected by a change to it.
+
+        :param identifier: The resource, eg. ``File[/etc/ssh/sshd_config]``.
+        :type identifier: :obj:`string`
+
+        :returns: A new CatalogGraph
+        :rtype: :class:`pypuppetdb.graph.CatalogGraph`
+        """
+        return self.subgraph([identifier] + self.descendants(identifier))
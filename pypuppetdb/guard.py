@@ -0,0 +1,189 @@
+import json
+import logging
+
+from pypuppetdb.errors import UnboundedQueryError
+
+log = logging.getLogger(__name__)
+
+# the most results a single request to these endpoints may be expected
+# to return, queries that may return more are guarded
+HEAVY_ENDPOINTS = {
+    "catalogs": 100,
+    "edges": 10000,
+    "events": 10000,
+    "fact-contents": 10000,
+    "factsets": 1000,
+    "reports": 1000,
+    "resources": 10000,
+}
+
+# fields that narrow the results of an endpoint down when matched on,
+# with the number of results expected for every matched value
+SELECTIVE_FIELDS = {
+    "catalogs": {"certname": 1, "catalog_uuid": 1, "transaction_uuid": 1},
+    "edges": {"certname": 1000},
+    "events": {"report": 100, "certname": 5000},
+    "fact-contents": {"certname": 1000},
+    "factsets": {"certname": 1, "hash": 1},
+    "reports": {"hash": 1, "transaction_uuid": 1, "catalog_uuid": 1, "certname": 100},
+    "resources": {"certname": 1000},
+}
+
+ACTIONS = ["reject", "warn", "page"]
+
+
+def estimate_ast(ast, fields):
+    """Estimates the number of results of a query from the fields it
+    matches on.
+
+    :param ast: The query.
+    :type ast: :obj:`list`
+    :param fields: The selective fields of the endpoint and the number\
+        of results for every value they match, see `SELECTIVE_FIELDS`.
+    :type fields: :obj:`dict`
+
+    :returns: The estimated number of results, or `None` if the query\
+        can return any number of them.
+    :rtype: :obj:`None` or :obj:`int`
+    """
+    if not isinstance(ast, list) or len(ast) == 0:
+        return None
+    operator = ast[0]
+
+    if operator == "=" and len(ast) == 3:
+        return fields.get(ast[1]) if isinstance(ast[1], str) else None
+
+    if operator == "in" and len(ast) == 3 and isinstance(ast[1], str):
+        values = ast[2]
+        if (
+            ast[1] in fields
+            and isinstance(values, list)
+            and len(values) == 2
+            and values[0] == "array"
+            and isinstance(values[1], list)
+        ):
+            return fields[ast[1]] * len(values[1])
+        return None
+
+    if operator == "and":
+        estimates = [estimate_ast(op, fields) for op in ast[1:]]
+        estimates = [e for e in estimates if e is not None]
+        return min(estimates) if estimates else None
+
+    if operator == "or":
+        estimates = [estimate_ast(op, fields) for op in ast[1:]]
+        if not estimates or None in estimates:
+            return None
+        return sum(estimates)
+
+    if operator == "extract" and len(ast) >= 3:
+        if isinstance(ast[2], list) and ast[2][:1] != ["group_by"]:
+            return estimate_ast(ast[2], fields)
+
+    return None
+
+
+class QueryGuard:
+    """Guards PuppetDB against queries that may return huge result sets,
+    such as an ``api.events()`` without a query or limit.
+
+    Before a query to one of the heavy endpoints (see `HEAVY_ENDPOINTS`)
+    is sent, the number of results is estimated from its `limit` and the
+    fields it matches on. If it may return more results than the limit for
+    the endpoint the guard, depending on `action`:
+
+    * ``reject``: raises an :class:`~pypuppetdb.errors.UnboundedQueryError`,
+    * ``warn``: logs a warning and sends the query anyway,
+    * ``page``: runs the query in pages of `page_size` results instead, so\
+      that PuppetDB never has to produce all of them at once. The pages\
+      are ordered by the fields that identify a result of the endpoint,\
+      see `UNIQUE_FIELDS` in :mod:`pypuppetdb.api.base`, and queries to\
+      endpoints without them are rejected.
+
+    Counting queries (`summarize_by`, `count_by`) and lookups by path are
+    never guarded.
+
+    :param action: (Default: ``warn``) What to do with guarded queries.
+    :type action: :obj:`string`
+    :param limits: (optional) Per-endpoint limits that override (and\
+        extend) `HEAVY_ENDPOINTS`, a limit of `None` disables the guard\
+        for that endpoint.
+    :type limits: :obj:`dict`
+    :param page_size: (optional) The size of the pages for the ``page``\
+        action, defaults to (and can't be more than) the limit of the\
+        endpoint.
+    :type page_size: :obj:`None` or :obj:`int`
+
+    :ivar guarded: Number of queries the guard acted on.
+    """
+
+    def __init__(self, action="warn", limits=None, page_size=None):
+        if action not in ACTIONS:
+            raise ValueError(f"action must be one of {ACTIONS}, was given: {action}")
+        self.action = action
+        self.limits = dict(HEAVY_ENDPOINTS)
+        if limits is not None:
+            self.limits.update(limits)
+        self.page_size = page_size
+        self.guarded = 0
+
+    def __repr__(self):
+        return f"<QueryGuard: {self.action}>"
+
+    def estimate(self, endpoint, query=None, limit=None):
+        """Estimates the number of results of a query.
+
+        :returns: The estimated number of results, or `None` if the query\
+            can return any number of them.
+        :rtype: :obj:`None` or :obj:`int`
+        """
+        estimate = None
+        if query is not None:
+            if hasattr(query, "json_data"):
+                ast = query.json_data()
+            else:
+                try:
+                    ast = json.loads(query)
+                except (TypeError, ValueError):
+                    ast = None
+            estimate = estimate_ast(ast, SELECTIVE_FIELDS.get(endpoint, {}))
+
+        if limit is not None and (estimate is None or limit < estimate):
+            return limit
+        return estimate
+
+    def check(self, endpoint, query=None, limit=None):
+        """Checks a query before it is sent.
+
+        :raises: :class:`~pypuppetdb.errors.UnboundedQueryError` if the\
+            action is ``reject`` and the query is guarded.
+
+        :returns: The page size to run the query with, or `None` if it\
+            can be sent as is.
+        :rtype: :obj:`None` or :obj:`int`
+        """
+        max_results = self.limits.get(endpoint)
+        if max_results is None:
+            return None
+
+        estimate = self.estimate(endpoint, query, limit)
+        if estimate is not None and estimate <= max_results:
+            return None
+
+        self.guarded += 1
+        if estimate is None:
+            message = f"Query to {endpoint} may return any number of results"
+        else:
+            message = "Query to {} may return {} results, more than {}".format(
+                endpoint, estimate, max_results
+            )
+
+        if self.action == "reject":
+            log.error(message)
+            raise UnboundedQueryError(message)
+        if self.action == "warn":
+            log.warning(f"{message}, add a query or limit")
+            return None
+        page_size = min(self.page_size or max_results, max_results)
+        log.info(f"{message}, running it in pages of {page_size}")
+        return page_size
@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+log = logging.getLogger(__name__)
+
+# the seconds spent connecting by the requests of each thread
+_connecting = threading.local()
+
+
+class _TimedConnect:
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            _connecting.seconds = (
+                getattr(_connecting, "seconds", 0.0) + time.perf_counter() - start
+            )
+
+
+class _TimedHTTPConnection(_TimedConnect, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnect, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimingAdapter(HTTPAdapter):
+    """An :class:`~requests.adapters.HTTPAdapter` whose connections record
+    how long connecting, including DNS and the TLS handshake, took.
+
+    It is mounted on the session of an API once a request hook is added.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+class RequestEvent:
+    """The timings and outcome of a request to PuppetDB, passed to the
+    request hooks of an API once it is finished.
+
+    The phases are consecutive, each in seconds, and `None` if the request
+    didn't get that far:
+
+    * `connect`: connecting to PuppetDB, including DNS and TLS, which is 0\
+        when a kept-alive connection was reused,
+    * `ttfb`: from sending the request to receiving the response headers,\
+        which is mostly the time PuppetDB takes to answer,
+    * `download`: receiving the body,
+    * `decode`: decoding the JSON body,
+    * `construct`: building objects, eg. :class:`~pypuppetdb.types.Node`,\
+        from the results. Only set by the query methods that do so, after\
+        all the results were built.
+
+    :ivar method: The HTTP method.
+    :ivar url: The URL requested.
+    :ivar endpoint: The endpoint, eg. ``nodes``, see\
+        :func:`~pypuppetdb.api.base.endpoint_name`.
+    :ivar shape: The shape of the query, see\
+        :func:`~pypuppetdb.shape.query_shape`, or `None`.
+    :ivar status: The HTTP status code, or `None` if there is no response.
+    :ivar bytes: The size of the response body.
+    :ivar results: The number of results, if it is a list.
+    :ivar error: The exception the request failed with, or `None`.
+    """
+
+    def __init__(self, method, url, endpoint, shape=None):
+        self.method = method
+        self.url = url
+        self.endpoint = endpoint
+        self.shape = shape
+        self.status = None
+        self.bytes = 0
+        self.results = None
+        self.error = None
+        self.connect = None
+        self.ttfb = None
+        self.download = None
+        self.decode = None
+        self.construct = None
+        self._mark = None
+
+    def __repr__(self):
+        return "<RequestEvent: {} {} {} {:.3f}s>".format(
+            self.method, self.endpoint, self.status, self.elapsed
+        )
+
+    @property
+    def elapsed(self):
+        """The total number of seconds of all the phases."""
+        return sum(
+            phase or 0.0
+            for phase in (
+                self.connect,
+                self.ttfb,
+                self.download,
+                self.decode,
+                self.construct,
+            )
+        )
+
+    def _lap(self):
+        now = time.perf_counter()
+        lap = now - self._mark
+        self._mark = now
+        return lap
+
+    def started(self):
+        _connecting.seconds = 0.0
+        self._mark = time.perf_counter()
+
+    def received(self, response):
+        self.status = response.status_code
+        self.connect = _connecting.seconds
+        self.ttfb = max(0.0, self._lap() - self.connect)
+
+    def downloaded(self, body):
+        self.bytes = len(body)
+        self.download = self._lap()
+
+    def decoded(self, result):
+        if isinstance(result, list):
+            self.results = len(result)
+        self.decode = self._lap()
+
+
+def dispatch(hooks, event):
+    """Calls every hook with an event. A hook that fails is logged, it
+    never fails the request."""
+    for hook in hooks:
+        try:
+            hook(event)
+        except Exception:
+            log.exception(f"Request hook {hook!r} failed")
@@ -0,0 +1,178 @@
+import json
+import logging
+import sys
+
+log = logging.getLogger(__name__)
+
+# the pool used by the types constructors and the JSON decoder, None
+# (the default) means interning is disabled
+_pool = None
+
+
+class InternedDict(dict):
+    """A dict decoded through :meth:`InternPool.object_pairs_hook`, whose
+    keys and values are already pooled."""
+
+
+class InternedList(list):
+    """A list decoded through :meth:`InternPool.object_pairs_hook`, whose
+    values are already pooled."""
+
+
+class InternPool:
+    """A pool used to share a single copy of repeated strings and values
+    between the objects created from PuppetDB responses.
+
+    Across a fleet the same fact names, resource types, environments and
+    low-cardinality fact values such as ``os.family`` repeat many times,
+    but every decoded response holds its own copy of them. With a pool
+    enabled (see :func:`~pypuppetdb.interning.enable`) every copy is
+    replaced with the one already in the pool.
+
+    Keys, such as fact names, are interned with :func:`sys.intern`. Values
+    are kept in the pool itself, so they can be dropped with
+    :meth:`clear`. Only strings up to `max_value_length` characters are
+    pooled and the pool stops growing once it holds `max_values` values,
+    so that high-cardinality values don't turn it into a copy of the data.
+
+    :param max_value_length: (Default: 64) Longest string value to pool.
+    :type max_value_length: :obj:`int`
+    :param max_values: (Default: 100000) Maximum number of values to pool.
+    :type max_values: :obj:`int`
+    :param structured: (Default: `False`) Also deduplicate whole structured\
+        values (dicts and lists). Deduplicated values are shared between\
+        objects so they must not be modified.
+    :type structured: :obj:`bool`
+
+    :ivar hits: Number of values that were replaced with a pooled copy.
+    :ivar misses: Number of values that were added to the pool.
+    """
+
+    def __init__(self, max_value_length=64, max_values=100000, structured=False):
+        self.max_value_length = max_value_length
+        self.max_values = max_values
+        self.structured = structured
+        self.hits = 0
+        self.misses = 0
+        self._values = {}
+        self._structures = {}
+
+    def __repr__(self):
+        return "<InternPool: {} values, {} structures>".format(
+            len(self._values), len(self._structures)
+        )
+
+    def __len__(self):
+        return len(self._values) + len(self._structures)
+
+    def clear(self):
+        """Drops all pooled values."""
+        self._values.clear()
+        self._structures.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(key):
+        """Interns a key, such as a fact name or resource type."""
+        if type(key) is str:
+            return sys.intern(key)
+        return key
+
+    def _string(self, value):
+        if len(value) > self.max_value_length:
+            return value
+        pooled = self._values.get(value)
+        if pooled is not None:
+            self.hits += 1
+            return pooled
+        if len(self._values) >= self.max_values:
+            return value
+        self.misses += 1
+        self._values[value] = value
+        return value
+
+    def value(self, value):
+        """Get the pooled copy of a value. Strings are pooled, dicts and
+        lists have their keys and values pooled and, if `structured` is
+        enabled, are themselves deduplicated.
+        """
+        kind = type(value)
+        if kind is str:
+            return self._string(value)
+        elif kind is InternedDict or kind is InternedList:
+            # pooled while it was decoded, there is nothing left to walk
+            if not self.structured:
+                return value
+            return self._structure(value)
+        elif kind is dict or kind is list:
+            if not self.structured:
+                return self._walk(value)
+            return self._structure(self._walk(value))
+        return value
+
+    def _structure(self, value):
+        fingerprint = json.dumps(value, sort_keys=True, default=str)
+        pooled = self._structures.get(fingerprint)
+        if pooled is not None:
+            self.hits += 1
+            return pooled
+        if len(self._structures) < self.max_values:
+            self.misses += 1
+            self._structures[fingerprint] = value
+        return value
+
+    def _walk(self, value):
+        if type(value) is dict:
+            return {self.key(k): self.value(v) for k, v in value.items()}
+        return [self.value(v) for v in value]
+
+    def _decoded(self, value):
+        kind = type(value)
+        if kind is str:
+            return self._string(value)
+        if kind is list:
+            return InternedList(self._decoded(v) for v in value)
+        return value
+
+    def object_pairs_hook(self, pairs):
+        """A :func:`json.loads` `object_pairs_hook` that interns all keys
+        and pools all string values, also those in arrays, while a response
+        is decoded.
+
+        The objects and arrays it returns are marked as
+        :class:`InternedDict` and :class:`InternedList`, so that the types
+        constructors don't pool them a second time."""
+        string = self._string
+        decoded = self._decoded
+        return InternedDict(
+            (sys.intern(k), string(v) if type(v) is str else decoded(v))
+            for k, v in pairs
+        )
+
+
+def enable(pool=None):
+    """Enables interning for all objects created from now on.
+
+    :param pool: (optional) The pool to use, if not given a new\
+        :class:`~pypuppetdb.interning.InternPool` with the default settings\
+        is created.
+    :type pool: :obj:`None` or :class:`pypuppetdb.interning.InternPool`
+
+    :returns: The pool that is now in use.
+    :rtype: :class:`pypuppetdb.interning.InternPool`
+    """
+    global _pool
+    _pool = pool if pool is not None else InternPool()
+    return _pool
+
+
+def disable():
+    """Disables interning. Already created objects keep their values."""
+    global _pool
+    _pool = None
+
+
+def get_pool():
+    """Get the pool currently in use, or `None` if interning is disabled."""
+    return _pool
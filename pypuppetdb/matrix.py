@@ -0,0 +1,232 @@
+import json
+import logging
+from array import array
+from collections import Counter
+from numbers import Number
+
+from pypuppetdb.errors import APIError
+
+log = logging.getLogger(__name__)
+
+
+class DictionaryColumn:
+    """A dictionary encoded column. Every distinct value is stored once in
+    :attr:`dictionary` and every row only holds a (4 byte) code pointing
+    into it, or -1 if the node doesn't have this fact.
+
+    Structured values (lists and dicts) are deduplicated by their JSON
+    representation.
+
+    :ivar codes: An :obj:`array.array` of codes, one per row.
+    :ivar dictionary: A :obj:`list` of the distinct values.
+    """
+
+    def __init__(self):
+        self.codes = array("i")
+        self.dictionary = []
+        self._lookup = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    @staticmethod
+    def _key(value):
+        if isinstance(value, (dict, list)):
+            return (type(value).__name__, json.dumps(value, sort_keys=True))
+        # True == 1 in Python, so keep the type as part of the key
+        return (type(value).__name__, value)
+
+    def encode(self, value):
+        """Get the code for a value, adding it to the dictionary if it's
+        not in there yet."""
+        if value is None:
+            return -1
+        key = self._key(value)
+        try:
+            return self._lookup[key]
+        except KeyError:
+            code = len(self.dictionary)
+            self.dictionary.append(value)
+            self._lookup[key] = code
+            return code
+
+    def append(self, value):
+        self.codes.append(self.encode(value))
+
+    def set(self, row, value):
+        while len(self.codes) <= row:
+            self.codes.append(-1)
+        self.codes[row] = self.encode(value)
+
+    def pad(self, length):
+        missing = length - len(self.codes)
+        if missing > 0:
+            self.codes.extend(array("i", [-1]) * missing)
+
+    def values(self):
+        """Decodes the column into a list of values, `None` if missing."""
+        dictionary = self.dictionary + [None]
+        return [dictionary[code] for code in self.codes]
+
+    @property
+    def is_numeric(self):
+        return len(self.dictionary) > 0 and all(
+            isinstance(v, Number) and not isinstance(v, bool) for v in self.dictionary
+        )
+
+    @property
+    def is_scalar(self):
+        return all(not isinstance(v, (dict, list)) for v in self.dictionary)
+
+    @property
+    def is_categorical(self):
+        """Whether the values can be the categories of a pandas
+        Categorical, which must be unique: `True` and ``1`` are kept apart
+        in the dictionary, but are equal to pandas."""
+        return (
+            self.is_scalar
+            and not self.is_numeric
+            and len(set(self.dictionary)) == len(self.dictionary)
+        )
+
+
+class FactMatrix:
+    """This object holds a node by fact table in columnar form. There is a
+    row per node, in :attr:`certnames`, and a
+    :class:`~pypuppetdb.matrix.DictionaryColumn` per fact path.
+
+    Fact paths are written with dots, eg. ``os.family``, the same way as
+    the inventory endpoint addresses structured facts.
+
+    :param fact_paths: The fact paths, one per column.
+    :type fact_paths: :obj:`list` of :obj:`string`
+
+    :ivar certnames: A :obj:`list` of the node names, one per row.
+    :ivar columns: A :obj:`dict` of fact paths to their columns.
+    """
+
+    def __init__(self, fact_paths):
+        if not fact_paths:
+            raise APIError("At least one fact path is required")
+        self.fact_paths = list(fact_paths)
+        self.certnames = []
+        self.columns = {path: DictionaryColumn() for path in self.fact_paths}
+        self._rows = {}
+
+    def __repr__(self):
+        return "<FactMatrix: {} nodes x {} facts>".format(
+            len(self.certnames), len(self.fact_paths)
+        )
+
+    def __len__(self):
+        return len(self.certnames)
+
+    def _row(self, certname):
+        try:
+            return self._rows[certname]
+        except KeyError:
+            row = len(self.certnames)
+            self.certnames.append(certname)
+            self._rows[certname] = row
+            return row
+
+    def add_row(self, certname, values):
+        """Adds a node with its fact values.
+
+        :param certname: The name of the node.
+        :type certname: :obj:`string`
+        :param values: The fact values, keyed by fact path.
+        :type values: :obj:`dict`
+        """
+        row = self._row(certname)
+        for path, column in self.columns.items():
+            column.set(row, values.get(path))
+
+    def add_value(self, certname, path, value):
+        """Sets a single fact value of a node."""
+        try:
+            column = self.columns[path]
+        except KeyError:
+            return
+        column.set(self._row(certname), value)
+
+    def finalize(self):
+        """Pads all columns to the number of rows. Called once all rows
+        have been added."""
+        for column in self.columns.values():
+            column.pad(len(self.certnames))
+        return self
+
+    def column(self, path):
+        """Get the decoded values of a fact path, one per row."""
+        return self.columns[path].values()
+
+    def value_counts(self, path):
+        """Counts how many nodes have each value of a fact path. This only
+        counts the codes, so it does not touch the values themselves.
+
+        :returns: A :obj:`dict` of values to the number of nodes, not\
+            including nodes without the fact.
+        :rtype: :obj:`dict`
+        """
+        column = self.columns[path]
+        counts = Counter(column.codes)
+        counts.pop(-1, None)
+        return {column.dictionary[code]: count for code, count in counts.items()}
+
+    def to_numpy(self):
+        """Converts the columns to NumPy arrays. Numeric facts become
+        `float64` arrays with `nan` for missing values, all other facts
+        become `object` arrays with `None` for missing values.
+
+        Requires `numpy` to be installed.
+
+        :returns: A :obj:`dict` of fact paths to arrays, plus a\
+            ``certname`` array.
+        :rtype: :obj:`dict`
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("FactMatrix.to_numpy() requires numpy")
+
+        result = {"certname": numpy.array(self.certnames, dtype=object)}
+        for path, column in self.columns.items():
+            codes = numpy.frombuffer(column.codes, dtype=numpy.int32)
+            if column.is_numeric:
+                dictionary = numpy.array(column.dictionary + [numpy.nan], dtype=float)
+            else:
+                dictionary = numpy.empty(len(column.dictionary) + 1, dtype=object)
+                dictionary[:-1] = column.dictionary
+            # -1 picks the trailing missing value
+            result[path] = dictionary[codes]
+        return result
+
+    def to_pandas(self):
+        """Converts the matrix to a pandas DataFrame indexed by certname.
+        Numeric facts become float columns, other scalar facts become
+        categorical columns built straight from the codes, unless they mix
+        values pandas considers equal, such as `True` and ``1``, which
+        become object columns like structured facts.
+
+        Requires `pandas` to be installed.
+
+        :rtype: :obj:`pandas.DataFrame`
+        """
+        try:
+            import pandas
+        except ImportError:
+            raise ImportError("FactMatrix.to_pandas() requires pandas")
+
+        arrays = self.to_numpy()
+        data = {}
+        for path, column in self.columns.items():
+            if column.is_categorical:
+                data[path] = pandas.Categorical.from_codes(
+                    list(column.codes), categories=column.dictionary
+                )
+            else:
+                data[path] = arrays[path]
+        return pandas.DataFrame(
+            data, index=pandas.Index(self.certnames, name="certname")
+        )
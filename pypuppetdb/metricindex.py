@@ -0,0 +1,179 @@
+import bisect
+import fnmatch
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+WILDCARDS = "*?["
+
+
+def _literal_prefix(pattern):
+    """The part of a wildcard pattern before its first wildcard."""
+    for index, char in enumerate(pattern):
+        if char in WILDCARDS:
+            return pattern[:index]
+    return pattern
+
+
+class MetricIndex:
+    """An index of the mbeans and attributes PuppetDB has metrics for,
+    built from the Jolokia list of :meth:`~pypuppetdb.api.MetricsAPI.metric`
+    and kept for `ttl` seconds, to find metrics without downloading the
+    whole, large, list every time.
+
+    The mbean names are kept sorted, so a prefix, or the part of a wildcard
+    pattern before its first wildcard, is looked up with :mod:`bisect` and
+    only the mbeans starting with it are matched against the pattern.
+
+    .. code-block:: python
+
+       >>> index = MetricIndex(db)
+       >>> index.search("puppetlabs.puppetdb.mq:name=global.*", "Count")
+       [('puppetlabs.puppetdb.mq:name=global.depth', 'Count'), ...]
+       >>> db.metrics(index.search("puppetlabs.puppetdb.storage:*", "Mean"))
+
+    :param api: The API to list the metrics of.
+    :type api: :class:`pypuppetdb.api.API`
+    :param ttl: (Default: 300) Number of seconds before the list is\
+        downloaded again.
+    :type ttl: :obj:`float`
+
+    :ivar refreshes: Number of times the list was downloaded.
+    """
+
+    def __init__(self, api, ttl=300):
+        self.api = api
+        self.ttl = ttl
+        self.refreshes = 0
+        self._names = []
+        self._attributes = {}
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<MetricIndex: {len(self._names)} mbeans>"
+
+    def __len__(self):
+        self._ensure()
+        return len(self._names)
+
+    def __contains__(self, mbean):
+        self._ensure()
+        return mbean in self._attributes
+
+    def refresh(self):
+        """Downloads the list of metrics now."""
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        listing = self.api.metric()
+        attributes = {}
+        for domain, mbeans in listing.items():
+            if not isinstance(mbeans, dict):
+                # the v1 API lists the mbean names with their URLs
+                attributes[domain] = {}
+                continue
+            for properties, info in mbeans.items():
+                attr = info.get("attr") if isinstance(info, dict) else None
+                attributes[f"{domain}:{properties}"] = attr or {}
+
+        self._attributes = attributes
+        self._names = sorted(attributes)
+        self._loaded = time.monotonic()
+        self.refreshes += 1
+        log.debug(f"Indexed {len(attributes)} mbeans")
+
+    def invalidate(self):
+        """Downloads the list again on its next use."""
+        self._loaded = None
+
+    def _stale(self):
+        return self._loaded is None or time.monotonic() - self._loaded >= self.ttl
+
+    def _ensure(self):
+        if self._stale():
+            with self._lock:
+                # another thread may have downloaded it while we waited
+                if self._stale():
+                    self._load()
+
+    def _with_prefix(self, prefix):
+        names = self._names
+        start = bisect.bisect_left(names, prefix)
+        end = start
+        while end < len(names) and names[end].startswith(prefix):
+            end += 1
+        return names[start:end]
+
+    def mbeans(self, pattern=None):
+        """Get the names of the mbeans starting with `pattern`, or matching
+        it if it has ``*``, ``?`` or ``[`` wildcards in the style of
+        :mod:`fnmatch`.
+
+        :param pattern: (optional) The prefix or pattern, all the mbeans\
+            if not given.
+        :type pattern: :obj:`string`
+
+        :rtype: :obj:`list` of :obj:`string`, sorted
+        """
+        self._ensure()
+        if not pattern:
+            return list(self._names)
+        candidates = self._with_prefix(_literal_prefix(pattern))
+        if not any(char in pattern for char in WILDCARDS):
+            return candidates
+        return [name for name in candidates if fnmatch.fnmatchcase(name, pattern)]
+
+    def attributes(self, mbean):
+        """Get the attributes of an mbean, with their type and description
+        as listed by Jolokia.
+
+        :raises: :class:`KeyError` if there is no such mbean.
+
+        :rtype: :obj:`dict`
+        """
+        self._ensure()
+        return self._attributes[mbean]
+
+    def search(self, mbean=None, attribute=None):
+        """Get the metrics whose mbean and attribute start with, or match,
+        the given patterns, as for :meth:`mbeans`.
+
+        :param mbean: (optional) The prefix or pattern of the mbeans.
+        :type mbean: :obj:`string`
+        :param attribute: (optional) The prefix or pattern of the attributes.
+        :type attribute: :obj:`string`
+
+        :returns: (mbean, attribute) tuples, to read with\
+            :meth:`~pypuppetdb.api.MetricsAPI.metrics`.
+        :rtype: :obj:`list`
+        """
+        wildcard = attribute is not None and any(c in attribute for c in WILDCARDS)
+        results = []
+        for name in self.mbeans(mbean):
+            for attr in sorted(self._attributes.get(name, ())):
+                if attribute is None:
+                    pass
+                elif wildcard:
+                    if not fnmatch.fnmatchcase(attr, attribute):
+                        continue
+                elif not attr.startswith(attribute):
+                    continue
+                results.append((name, attr))
+        return results
+
+    def read(self, mbean=None, attribute=None):
+        """Reads the metrics found by :meth:`search` with one bulk request.
+
+        :returns: The return of :meth:`~pypuppetdb.api.MetricsAPI.metrics`.
+        :rtype: :obj:`dict`
+        """
+        if attribute is None:
+            # whole mbeans, which includes those without listed attributes
+            metrics = self.mbeans(mbean)
+        else:
+            metrics = self.search(mbean, attribute)
+        return self.api.metrics(metrics)
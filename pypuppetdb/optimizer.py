@@ -0,0 +1,288 @@
+import json
+import logging
+
+from pypuppetdb.QueryBuilder import (
+    AndOperator,
+    BinaryOperator,
+    InOperator,
+    NotOperator,
+    OrOperator,
+)
+from pypuppetdb.errors import APIError
+
+log = logging.getLogger(__name__)
+
+BINARY_OPERATORS = ["=", ">", "<", ">=", "<=", "~", "~>", "null?"]
+
+
+def _key(ast):
+    return json.dumps(ast, sort_keys=True)
+
+
+def _is_literal(value):
+    return isinstance(value, (str, int, float)) and not isinstance(value, bool)
+
+
+def _in_field(ast):
+    """The field of an equality or array `in` clause that can be merged
+    into an `in` array, or None."""
+    if not isinstance(ast, list) or len(ast) != 3 or not isinstance(ast[1], str):
+        return None
+    # structured fact paths (eg. facts.os.family) are left alone, not all
+    # of them support `in`
+    if "." in ast[1]:
+        return None
+    if ast[0] == "=" and _is_literal(ast[2]):
+        return ast[1]
+    if (
+        ast[0] == "in"
+        and isinstance(ast[2], list)
+        and len(ast[2]) == 2
+        and ast[2][0] == "array"
+        and all(_is_literal(v) for v in ast[2][1])
+    ):
+        return ast[1]
+    return None
+
+
+def _in_values(ast):
+    if ast[0] == "=":
+        return [ast[2]]
+    return ast[2][1]
+
+
+def _dedupe(operations):
+    seen = set()
+    result = []
+    for operation in operations:
+        key = _key(operation)
+        if key not in seen:
+            seen.add(key)
+            result.append(operation)
+    return result
+
+
+def _merge_equalities(operations, min_values):
+    """Merges the equality clauses of an `or` on the same field into a
+    single `in` clause, in place of the first of them."""
+    fields = {}
+    for operation in operations:
+        field = _in_field(operation)
+        if field is not None:
+            fields.setdefault(field, []).append(operation)
+
+    merged = {}
+    for field, clauses in fields.items():
+        values = []
+        seen = set()
+        for clause in clauses:
+            for value in _in_values(clause):
+                key = (type(value), value)
+                if key not in seen:
+                    seen.add(key)
+                    values.append(value)
+        if len(clauses) > 1 and len(values) >= min_values:
+            merged[field] = ["in", field, ["array", values]]
+
+    if not merged:
+        return operations
+
+    result = []
+    for operation in operations:
+        field = _in_field(operation)
+        if field in merged:
+            if merged[field] is not None:
+                result.append(merged[field])
+                merged[field] = None
+        else:
+            result.append(operation)
+    return result
+
+
+def optimize_ast(ast, min_in_values=2):
+    """Optimizes a query in its JSON (list) form. See
+    :func:`~pypuppetdb.optimizer.optimize`.
+
+    :param ast: The query.
+    :type ast: :obj:`list`
+
+    :returns: The optimized query.
+    :rtype: :obj:`list`
+    """
+    if not isinstance(ast, list) or len(ast) == 0 or not isinstance(ast[0], str):
+        return ast
+
+    operator = ast[0]
+
+    if operator in ("and", "or"):
+        operations = []
+        for operation in ast[1:]:
+            operation = optimize_ast(operation, min_in_values)
+            # flatten nested operators of the same kind
+            if isinstance(operation, list) and operation[:1] == [operator]:
+                operations.extend(operation[1:])
+            else:
+                operations.append(operation)
+        operations = _dedupe(operations)
+        if operator == "or":
+            operations = _merge_equalities(operations, min_in_values)
+        if len(operations) == 1:
+            return operations[0]
+        return [operator] + operations
+
+    if operator == "not" and len(ast) == 2:
+        operation = optimize_ast(ast[1], min_in_values)
+        if isinstance(operation, list):
+            # ["not", ["not", x]] is x
+            if operation[:1] == ["not"] and len(operation) == 2:
+                return operation[1]
+            # ["not", ["null?", f, true]] is ["null?", f, false]
+            if (
+                operation[:1] == ["null?"]
+                and len(operation) == 3
+                and isinstance(operation[2], bool)
+            ):
+                return ["null?", operation[1], not operation[2]]
+        return ["not", operation]
+
+    if operator == "in" and len(ast) == 3:
+        return ["in", ast[1], optimize_ast(ast[2], min_in_values)]
+
+    if operator in ("extract", "from") and len(ast) >= 3:
+        if isinstance(ast[2], list) and ast[2][:1] != ["group_by"]:
+            return ast[:2] + [optimize_ast(ast[2], min_in_values)] + ast[3:]
+        return ast
+
+    if operator.startswith("select_") and len(ast) == 2:
+        return [operator, optimize_ast(ast[1], min_in_values)]
+
+    return ast
+
+
+def _to_operator(ast):
+    """Turns an optimized query back into an operator object where
+    possible, so that it can be used anywhere an operator can."""
+    if not isinstance(ast, list) or len(ast) == 0:
+        return ast
+    operator = ast[0]
+    if operator in ("and", "or", "not"):
+        op = {"and": AndOperator, "or": OrOperator, "not": NotOperator}[operator]()
+        op.operations = ast[1:]
+        return op
+    if operator == "in":
+        op = InOperator(ast[1])
+        op.query = True
+        op.arr = list(ast)
+        return op
+    if operator in BINARY_OPERATORS and len(ast) == 3:
+        return BinaryOperator(*ast)
+    return json.dumps(ast)
+
+
+def optimize(query, min_in_values=2):
+    """Rewrites a query into an equivalent one that is smaller and easier
+    for PuppetDB to plan:
+
+    * nested `and` and `or` operators are flattened into their parent,
+    * duplicate clauses are removed and `and`/`or` operators with a single\
+      clause are replaced with that clause,
+    * `or` chains of equality clauses on the same field are merged into an\
+      `in` clause with an array, like\
+      :meth:`~pypuppetdb.QueryBuilder.InOperator.add_array` creates,
+    * `not` operators around `not` or `null?` clauses are folded.
+
+    Subqueries are optimized too. Equality clauses on structured fact paths
+    are not merged into `in` clauses, as not all of them support it.
+
+    :param query: The query.
+    :type query: :obj:`string` or any operator object
+    :param min_in_values: (Default: 2) Only merge equality clauses into an\
+        `in` clause if they have at least this many distinct values.
+    :type min_in_values: :obj:`int`
+
+    :returns: The optimized query, as an operator object if possible and\
+        otherwise as a string.
+    """
+    if isinstance(query, str):
+        ast = json.loads(query)
+    elif hasattr(query, "json_data"):
+        ast = query.json_data()
+    else:
+        raise APIError("optimize only supports strings and operator objects")
+
+    return _to_operator(optimize_ast(ast, min_in_values))
+
+
+def _in_array_path(ast, max_values, path=()):
+    """The path to the first `in` array with more than `max_values` values
+    that can be split, ie. that is the query itself or is only nested in
+    `and` operators, or None."""
+    if not isinstance(ast, list) or len(ast) == 0:
+        return None
+    if (
+        ast[0] == "in"
+        and len(ast) == 3
+        and isinstance(ast[2], list)
+        and len(ast[2]) == 2
+        and ast[2][0] == "array"
+        and isinstance(ast[2][1], list)
+        and len(ast[2][1]) > max_values
+    ):
+        return path
+    if ast[0] == "and":
+        for i, operation in enumerate(ast[1:], 1):
+            found = _in_array_path(operation, max_values, path + (i,))
+            if found is not None:
+                return found
+    return None
+
+
+def _replace(ast, path, value):
+    if not path:
+        return value
+    copy = list(ast)
+    copy[path[0]] = _replace(ast[path[0]], path[1:], value)
+    return copy
+
+
+def split_in_ast(ast, max_values):
+    """Splits a query with an `in` array of more than `max_values` values
+    into queries with at most `max_values` values each. The results of
+    all of them together are the results of the original query, each
+    result is returned by exactly one of them.
+
+    Only an `in` array that is the query itself or is nested in `and`
+    operators is split, as only then the results can be combined.
+
+    :param ast: The query.
+    :type ast: :obj:`list`
+    :param max_values: The maximum number of values per `in` array.
+    :type max_values: :obj:`int`
+
+    :returns: The queries, or `None` if the query doesn't need splitting.
+    :rtype: :obj:`list` of :obj:`list`
+    """
+    path = _in_array_path(ast, max_values)
+    if path is None:
+        return None
+
+    in_ast = ast
+    for step in path:
+        in_ast = in_ast[step]
+    field = in_ast[1]
+
+    # duplicates would return the same results from more than one query
+    values = []
+    seen = set()
+    for value in in_ast[2][1]:
+        key = _key(value) if isinstance(value, (list, dict)) else (type(value), value)
+        if key not in seen:
+            seen.add(key)
+            values.append(value)
+
+    queries = []
+    for start in range(0, len(values), max_values):
+        end = start + max_values
+        chunk = values[start:end]
+        queries.append(_replace(ast, path, ["in", field, ["array", chunk]]))
+    return queries
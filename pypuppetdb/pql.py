@@ -0,0 +1,513 @@
+import json
+import logging
+import re
+
+from pypuppetdb.QueryBuilder import FromOperator
+from pypuppetdb.errors import APIError, PqlSyntaxError
+
+log = logging.getLogger(__name__)
+
+ENTITIES = [
+    "aggregate_event_counts",
+    "catalogs",
+    "edges",
+    "environments",
+    "event_counts",
+    "events",
+    "facts",
+    "fact_contents",
+    "fact_names",
+    "fact_paths",
+    "inventory",
+    "nodes",
+    "package_inventory",
+    "packages",
+    "producers",
+    "reports",
+    "resources",
+]
+
+FUNCTIONS = ["count", "avg", "sum", "min", "max", "to_string"]
+
+# PQL operator: (AST operator, negated)
+OPERATORS = {
+    "=": ("=", False),
+    "!=": ("=", True),
+    ">": (">", False),
+    "<": ("<", False),
+    ">=": (">=", False),
+    "<=": ("<=", False),
+    "~": ("~", False),
+    "!~": ("~", True),
+    "~>": ("~>", False),
+}
+
+PAGING = ("order_by", "limit", "offset")
+
+_STRING = r""""(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'"""
+
+_TOKENS = re.compile(
+    r"""
+    (?P<space>\s+)
+    |(?P<string>{string})
+    |(?P<number>-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)
+    |(?P<operator>!=|!~|>=|<=|~>|=|>|<|~|!)
+    |(?P<punctuation>[\[\]{{}}(),])
+    |(?P<word>[A-Za-z_][\w?\-]*(?:\.(?:[\w?\-]+|{string}))*)
+    """.format(string=_STRING),
+    re.VERBOSE,
+)
+
+
+def _tokenize(pql):
+    tokens = []
+    position = 0
+    while position < len(pql):
+        match = _TOKENS.match(pql, position)
+        if match is None:
+            raise PqlSyntaxError(
+                f"Unexpected character {pql[position]!r} at position {position}"
+            )
+        kind = match.lastgroup
+        if kind != "space":
+            tokens.append((kind, match.group(), position))
+        position = match.end()
+    tokens.append(("end", "", position))
+    return tokens
+
+
+def _string(text):
+    if text.startswith('"'):
+        return json.loads(text)
+    return re.sub(r"\\(.)", r"\1", text[1:-1])
+
+
+class _Parser:
+    def __init__(self, pql):
+        self.tokens = _tokenize(pql)
+        self.index = 0
+
+    @property
+    def token(self):
+        return self.tokens[self.index]
+
+    def peek(self, offset=1):
+        return self.tokens[min(self.index + offset, len(self.tokens) - 1)]
+
+    def error(self, expected):
+        kind, text, position = self.token
+        found = "end of query" if kind == "end" else repr(text)
+        raise PqlSyntaxError(f"Expected {expected} at position {position}, got {found}")
+
+    def accept(self, text):
+        if self.token[0] != "string" and self.token[1] == text:
+            self.index += 1
+            return True
+        return False
+
+    def expect(self, text):
+        if not self.accept(text):
+            self.error(repr(text))
+
+    def word(self, expected="a field"):
+        kind, text, _ = self.token
+        if kind != "word":
+            self.error(expected)
+        self.index += 1
+        return text
+
+    def integer(self):
+        kind, text, _ = self.token
+        if kind != "number" or not text.isdigit():
+            self.error("a positive integer")
+        self.index += 1
+        return int(text)
+
+    def parse(self):
+        ast = self.query()
+        if self.token[0] != "end":
+            self.error("end of query")
+        return ast
+
+    def query(self):
+        entity = self.word("an entity")
+        if entity not in ENTITIES:
+            raise PqlSyntaxError(f"Unknown entity {entity!r}")
+
+        fields = None
+        if self.accept("["):
+            fields = []
+            if not self.accept("]"):
+                fields.append(self.projection_field())
+                while self.accept(","):
+                    fields.append(self.projection_field())
+                self.expect("]")
+
+        self.expect("{")
+        condition = None
+        if not self.at_clause():
+            condition = self.expression()
+
+        group_by = []
+        paging = []
+        while not self.accept("}"):
+            if self.accept("group"):
+                self.expect("by")
+                group_by = ["group_by", self.projection_field()]
+                while self.accept(","):
+                    group_by.append(self.projection_field())
+            elif self.accept("order"):
+                self.expect("by")
+                order_by = [self.order_field()]
+                while self.accept(","):
+                    order_by.append(self.order_field())
+                paging.append(["order_by", order_by])
+            elif self.accept("limit"):
+                paging.append(["limit", self.integer()])
+            elif self.accept("offset"):
+                paging.append(["offset", self.integer()])
+            else:
+                self.error("'group by', 'order by', 'limit', 'offset' or '}'")
+
+        if group_by and not fields:
+            raise PqlSyntaxError("'group by' requires a projection")
+
+        ast = ["from", entity]
+        if fields:
+            extract = ["extract", fields]
+            if condition is not None:
+                extract.append(condition)
+            if group_by:
+                extract.append(group_by)
+            ast.append(extract)
+        elif condition is not None:
+            ast.append(condition)
+        # PuppetDB expects the paging clauses in this order
+        ast.extend(sorted(paging, key=lambda clause: PAGING.index(clause[0])))
+        return ast
+
+    def at_clause(self):
+        kind, text, _ = self.token
+        if kind == "punctuation" and text == "}":
+            return True
+        if kind != "word" or text not in ("group", "order", "limit", "offset"):
+            return False
+        # a field can have the same name as a keyword
+        following = self.peek()
+        return following[1] == "by" or following[0] == "number"
+
+    def projection_field(self):
+        name = self.word()
+        if not self.accept("("):
+            return name
+        if name not in FUNCTIONS:
+            raise PqlSyntaxError(f"Unknown function {name!r}")
+        function = ["function", name]
+        if not self.accept(")"):
+            function.append(self.word())
+            while self.accept(","):
+                function.append(self.literal())
+            self.expect(")")
+        return function
+
+    def order_field(self):
+        field = self.word()
+        if self.accept("desc"):
+            return [field, "desc"]
+        if self.accept("asc"):
+            return [field, "asc"]
+        return field
+
+    def expression(self):
+        operations = [self.conjunction()]
+        while self.accept("or"):
+            operations.append(self.conjunction())
+        if len(operations) == 1:
+            return operations[0]
+        return ["or"] + operations
+
+    def conjunction(self):
+        operations = [self.unary()]
+        while self.accept("and"):
+            operations.append(self.unary())
+        if len(operations) == 1:
+            return operations[0]
+        return ["and"] + operations
+
+    def unary(self):
+        if self.accept("!"):
+            return ["not", self.unary()]
+        if self.accept("("):
+            expression = self.expression()
+            self.expect(")")
+            return expression
+        return self.condition()
+
+    def condition(self):
+        kind, text, _ = self.token
+        if kind == "punctuation" and text == "[":
+            self.index += 1
+            fields = [self.word()]
+            while self.accept(","):
+                fields.append(self.word())
+            self.expect("]")
+            self.expect("in")
+            return ["in", fields, self.subquery()]
+
+        field = self.word("a condition")
+        if field in ENTITIES and self.token[1] == "{":
+            # implicit subquery, eg. nodes { facts { name = "kernel" } }
+            self.expect("{")
+            subquery = ["subquery", field]
+            if not self.accept("}"):
+                subquery.append(self.expression())
+                self.expect("}")
+            return subquery
+
+        if self.accept("is"):
+            is_null = not self.accept("not")
+            self.expect("null")
+            return ["null?", field, is_null]
+
+        if self.accept("in"):
+            if self.token[1] == "[" and self.token[0] == "punctuation":
+                return ["in", field, ["array", self.array()]]
+            return ["in", field, self.subquery()]
+
+        kind, text, _ = self.token
+        if kind != "operator" or text not in OPERATORS:
+            self.error("an operator")
+        self.index += 1
+        operator, negated = OPERATORS[text]
+        condition = [operator, field, self.literal()]
+        if negated:
+            return ["not", condition]
+        return condition
+
+    def subquery(self):
+        start = self.index
+        ast = self.query()
+        if len(ast) < 3 or ast[2][0] != "extract":
+            self.index = start
+            self.error("a subquery with a projection")
+        return ast
+
+    def array(self):
+        self.expect("[")
+        values = []
+        if not self.accept("]"):
+            values.append(self.literal())
+            while self.accept(","):
+                values.append(self.literal())
+            self.expect("]")
+        return values
+
+    def literal(self):
+        kind, text, _ = self.token
+        if kind == "string":
+            self.index += 1
+            return _string(text)
+        if kind == "number":
+            self.index += 1
+            return json.loads(text)
+        if kind == "word" and text in ("true", "false"):
+            self.index += 1
+            return text == "true"
+        if kind == "punctuation" and text == "[":
+            return self.array()
+        self.error("a value")
+
+
+def parse_ast(pql):
+    """Parses a PQL query into its AST (JSON) form, without sending it to
+    PuppetDB. This catches syntax errors before a round trip to the
+    server, and the result can be sent to any of the
+    :class:`~pypuppetdb.api.QueryAPI` methods.
+
+    :param pql: The PQL query, eg. ``nodes[certname] { facts_environment =
+        "production" }``.
+    :type pql: :obj:`string`
+
+    :raises: :class:`~pypuppetdb.errors.PqlSyntaxError` if the query is not\
+        valid PQL.
+
+    :returns: The query as a ``from`` AST query.
+    :rtype: :obj:`list`
+    """
+    return _Parser(pql).parse()
+
+
+def parse(pql):
+    """Parses a PQL query into a
+    :class:`~pypuppetdb.QueryBuilder.FromOperator`, see
+    :func:`~pypuppetdb.pql.parse_ast`.
+
+    :param pql: The PQL query.
+    :type pql: :obj:`string`
+
+    :raises: :class:`~pypuppetdb.errors.PqlSyntaxError` if the query is not\
+        valid PQL, :class:`~pypuppetdb.errors.APIError` if it can't be\
+        expressed with a :class:`~pypuppetdb.QueryBuilder.FromOperator`,\
+        like queries without a projection or condition.
+
+    :rtype: :class:`pypuppetdb.QueryBuilder.FromOperator`
+    """
+    ast = parse_ast(pql)
+    if len(ast) < 3 or ast[2][0] in PAGING:
+        raise APIError("FromOperator needs one main query, use parse_ast instead")
+
+    fr = FromOperator(ast[1])
+    fr.query = ast[2]
+    for clause in ast[3:]:
+        if clause[0] == "order_by":
+            fr.add_order_by(clause[1])
+        elif clause[0] == "limit":
+            fr.add_limit(clause[1])
+        else:
+            fr.add_offset(clause[1])
+    return fr
+
+
+def _format_value(value):
+    return json.dumps(value)
+
+
+def _format_fields(fields):
+    return ", ".join(_format_field(field) for field in fields)
+
+
+def _format_field(field):
+    if isinstance(field, str):
+        return field
+    if isinstance(field, list) and field[:1] == ["function"] and len(field) >= 2:
+        arguments = field[2:3] + [_format_value(arg) for arg in field[3:]]
+        return "{}({})".format(field[1], ", ".join(arguments))
+    raise APIError(f"Can not express field {field} in PQL")
+
+
+def _format_condition(ast, parent=None):
+    if not isinstance(ast, list) or len(ast) == 0:
+        raise APIError(f"Can not express {ast} in PQL")
+    operator = ast[0]
+
+    if operator in ("and", "or"):
+        text = f" {operator} ".join(_format_condition(op, operator) for op in ast[1:])
+        # and binds stronger than or
+        if parent is not None and parent != operator:
+            return f"({text})"
+        return text
+
+    if operator == "not" and len(ast) == 2:
+        inner = ast[1]
+        if isinstance(inner, list) and len(inner) == 3 and inner[0] in ("=", "~"):
+            negated = {"=": "!=", "~": "!~"}[inner[0]]
+            return "{} {} {}".format(inner[1], negated, _format_value(inner[2]))
+        return "!({})".format(_format_condition(inner))
+
+    if operator == "null?" and len(ast) == 3:
+        return "{} is {}null".format(ast[1], "" if ast[2] else "not ")
+
+    if operator == "subquery" and len(ast) in (2, 3):
+        if len(ast) == 2:
+            return f"{ast[1]} {{}}"
+        return "{} {{ {} }}".format(ast[1], _format_condition(ast[2]))
+
+    if operator == "in" and len(ast) == 3:
+        field = ast[1]
+        if isinstance(field, list):
+            field = "[{}]".format(_format_fields(field))
+        values = ast[2]
+        if isinstance(values, list) and values[:1] == ["array"] and len(values) == 2:
+            return "{} in [{}]".format(
+                field, ", ".join(_format_value(v) for v in values[1])
+            )
+        return f"{field} in {_format_subquery(values)}"
+
+    if operator in OPERATORS and len(ast) == 3:
+        return "{} {} {}".format(ast[1], operator, _format_value(ast[2]))
+
+    raise APIError(f"Can not express {ast} in PQL")
+
+
+def _format_subquery(ast):
+    if isinstance(ast, list) and ast[:1] == ["from"]:
+        return _format_from(ast)
+    # the older form, eg. ["extract", ["certname"], ["select_facts", ...]]
+    if (
+        isinstance(ast, list)
+        and len(ast) == 3
+        and ast[0] == "extract"
+        and isinstance(ast[2], list)
+        and ast[2]
+        and isinstance(ast[2][0], str)
+        and ast[2][0].startswith("select_")
+    ):
+        entity = ast[2][0].replace("select_", "", 1)
+        extract = ["extract", ast[1]] + ast[2][1:]
+        return _format_from(["from", entity, extract])
+    raise APIError(f"Can not express subquery {ast} in PQL")
+
+
+def _format_from(ast):
+    if len(ast) < 2 or ast[1] not in ENTITIES:
+        raise APIError(f"Can not express {ast} in PQL")
+    entity = ast[1]
+    clauses = ast[2:]
+    query = None
+    if clauses and clauses[0][0] not in PAGING:
+        query, clauses = clauses[0], clauses[1:]
+
+    projection = ""
+    body = []
+    if isinstance(query, list) and query[:1] == ["extract"]:
+        projection = "[{}]".format(_format_fields(query[1]))
+        for part in query[2:]:
+            if isinstance(part, list) and part[:1] == ["group_by"]:
+                body.append("group by {}".format(_format_fields(part[1:])))
+            else:
+                body.insert(0, _format_condition(part))
+    elif query is not None:
+        body.append(_format_condition(query))
+
+    for clause in clauses:
+        if clause[0] == "order_by":
+            fields = [
+                field if isinstance(field, str) else " ".join(field)
+                for field in clause[1]
+            ]
+            body.append("order by {}".format(", ".join(fields)))
+        elif clause[0] in ("limit", "offset"):
+            body.append("{} {}".format(clause[0], int(clause[1])))
+        else:
+            raise APIError(f"Can not express {clause} in PQL")
+
+    if not body:
+        return f"{entity}{projection} {{}}"
+    return "{}{} {{ {} }}".format(entity, projection, " ".join(body))
+
+
+def to_pql(query):
+    """Serializes a ``from`` query into PQL. Together with
+    :func:`~pypuppetdb.pql.parse_ast` this converts queries between the two
+    languages, eg. to send whichever encoding is smaller.
+
+    :param query: The query.
+    :type query: :class:`~pypuppetdb.QueryBuilder.FromOperator`,\
+        :obj:`string` or :obj:`list` in AST form
+
+    :raises: :class:`~pypuppetdb.errors.APIError` if the query is not a\
+        ``from`` query or uses operators that PQL doesn't support.
+
+    :returns: The PQL query.
+    :rtype: :obj:`string`
+    """
+    if isinstance(query, str):
+        ast = json.loads(query)
+    elif hasattr(query, "json_data"):
+        ast = query.json_data()
+    else:
+        ast = query
+
+    if not isinstance(ast, list) or ast[:1] != ["from"]:
+        raise APIError("Only from queries can be expressed in PQL")
+    return _format_from(ast)
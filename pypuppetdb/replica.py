@@ -0,0 +1,224 @@
+import datetime
+import json
+import logging
+import sqlite3
+
+from pypuppetdb.QueryBuilder import GreaterEqualOperator, OrOperator
+from pypuppetdb.errors import APIError
+from pypuppetdb.evaluator import compile_query
+from pypuppetdb.utils import datetime_to_json, json_to_datetime
+
+log = logging.getLogger(__name__)
+
+# the timestamps that change whenever a row of an endpoint changes
+WATERMARK_FIELDS = {
+    "nodes": ["facts_timestamp", "catalog_timestamp", "report_timestamp"],
+    "factsets": ["producer_timestamp"],
+    "inventory": ["timestamp"],
+}
+
+
+class Replica:
+    """A local copy of the nodes, factsets and/or inventory of PuppetDB in
+    an SQLite database, for tools that run many (analytic) queries on the
+    same data that PuppetDB would be slow to answer over and over again.
+
+    The first :meth:`refresh` loads all rows, every later one only pulls
+    the rows with a timestamp since the newest one already stored (the
+    watermark) minus an overlap window. The window catches rows that share
+    the watermark's timestamp or were stored late with an earlier one, eg.
+    as the clock of their producer runs behind. Rows that are pulled again
+    unchanged are skipped. Reads never touch PuppetDB.
+
+    Rows that disappear from PuppetDB, such as deactivated nodes, are only
+    removed by a full refresh.
+
+    Rows are stored as JSON, keyed by certname, so next to
+    :meth:`rows` the database can be queried with SQL and SQLite's JSON
+    functions, eg. ``SELECT certname FROM factsets WHERE
+    json_extract(data, '$.environment') = 'production'``.
+
+    :param api: The API to sync from.
+    :type api: :class:`pypuppetdb.api.API`
+    :param path: The SQLite database file, or ``:memory:``.
+    :type path: :obj:`string`
+    :param endpoints: (Default: nodes, factsets, inventory) The endpoints\
+        to replicate, any of `WATERMARK_FIELDS`.
+    :type endpoints: :obj:`list`
+    :param page_size: (Default: 1000) The number of rows to pull per\
+        request.
+    :type page_size: :obj:`int`
+    :param overlap: (Default: 60) The overlap window, in seconds.
+    :type overlap: :obj:`float`
+    """
+
+    def __init__(
+        self,
+        api,
+        path,
+        endpoints=("nodes", "factsets", "inventory"),
+        page_size=1000,
+        overlap=60,
+    ):
+        for endpoint in endpoints:
+            if endpoint not in WATERMARK_FIELDS:
+                raise APIError(f"Endpoint {endpoint} can not be replicated")
+        self.api = api
+        self.path = path
+        self.endpoints = list(endpoints)
+        self.page_size = page_size
+        self.overlap = datetime.timedelta(seconds=overlap)
+        self.connection = sqlite3.connect(path)
+
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS watermarks "
+                "(endpoint TEXT PRIMARY KEY, watermark TEXT)"
+            )
+            for endpoint in self.endpoints:
+                self.connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self._table(endpoint)} "
+                    "(certname TEXT PRIMARY KEY, watermark TEXT, data TEXT NOT NULL)"
+                )
+
+    def __repr__(self):
+        return f"<Replica: {self.path}>"
+
+    def close(self):
+        """Closes the database."""
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, trace):
+        self.close()
+
+    @staticmethod
+    def _table(endpoint):
+        return endpoint.replace("-", "_")
+
+    def _check_endpoint(self, endpoint):
+        if endpoint not in self.endpoints:
+            raise APIError(f"Endpoint {endpoint} is not replicated")
+
+    def watermark(self, endpoint):
+        """Get the newest timestamp stored for an endpoint.
+
+        :returns: The timestamp, or `None` if nothing was loaded yet.
+        :rtype: :obj:`None` or :obj:`string`
+        """
+        self._check_endpoint(endpoint)
+        row = self.connection.execute(
+            "SELECT watermark FROM watermarks WHERE endpoint = ?", (endpoint,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def refresh(self, full=False):
+        """Pulls the changes from PuppetDB.
+
+        :param full: (Default: `False`) Reload all rows, and drop those that\
+            are no longer in PuppetDB, instead of only pulling the newer ones.
+        :type full: :obj:`bool`
+
+        :returns: The number of rows pulled per endpoint.
+        :rtype: :obj:`dict`
+        """
+        return {
+            endpoint: self._refresh_endpoint(endpoint, full)
+            for endpoint in self.endpoints
+        }
+
+    def _refresh_endpoint(self, endpoint, full):
+        fields = WATERMARK_FIELDS[endpoint]
+        table = self._table(endpoint)
+        watermark = None if full else self.watermark(endpoint)
+
+        query = None
+        if watermark is not None:
+            since = datetime_to_json(json_to_datetime(watermark) - self.overlap)
+            if len(fields) == 1:
+                query = GreaterEqualOperator(fields[0], since)
+            else:
+                query = OrOperator()
+                query.add([GreaterEqualOperator(field, since) for field in fields])
+
+        rows = self.api._query_paged(endpoint, self.page_size, query=query)
+
+        count = 0
+        newest = watermark
+        # one transaction, so that readers never see a half loaded replica
+        with self.connection:
+            if watermark is None:
+                self.connection.execute(f"DELETE FROM {table}")
+            for row in rows:
+                timestamps = [row[f] for f in fields if row.get(f) is not None]
+                row_watermark = max(timestamps) if timestamps else None
+                if row_watermark is not None and (
+                    newest is None or row_watermark > newest
+                ):
+                    newest = row_watermark
+                data = json.dumps(row)
+                if watermark is not None:
+                    stored = self.connection.execute(
+                        f"SELECT data FROM {table} WHERE certname = ?",
+                        (row["certname"],),
+                    ).fetchone()
+                    # pulled again in the overlap window
+                    if stored is not None and stored[0] == data:
+                        continue
+                self.connection.execute(
+                    f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?)",
+                    (row["certname"], row_watermark, data),
+                )
+                count += 1
+            self.connection.execute(
+                "INSERT OR REPLACE INTO watermarks VALUES (?, ?)", (endpoint, newest)
+            )
+
+        log.debug(f"Pulled {count} {endpoint} rows, watermark is now {newest}")
+        return count
+
+    def get(self, endpoint, certname):
+        """Get the row of a node.
+
+        :returns: The row, or `None` if the node isn't in the replica.
+        :rtype: :obj:`None` or :obj:`dict`
+        """
+        self._check_endpoint(endpoint)
+        row = self.connection.execute(
+            f"SELECT data FROM {self._table(endpoint)} WHERE certname = ?",
+            (certname,),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def rows(self, endpoint, query=None):
+        """Get the rows of an endpoint, optionally filtered with a query
+        that is evaluated locally, see
+        :func:`~pypuppetdb.evaluator.compile_query`.
+
+        :param endpoint: The endpoint.
+        :type endpoint: :obj:`string`
+        :param query: (optional) The query.
+        :type query: :obj:`string` or any operator object
+
+        :returns: A generator yielding the rows ordered by certname.
+        :rtype: :obj:`dict`
+        """
+        self._check_endpoint(endpoint)
+        predicate = compile_query(query) if query is not None else None
+        cursor = self.connection.execute(
+            f"SELECT data FROM {self._table(endpoint)} ORDER BY certname"
+        )
+        for (data,) in cursor:
+            row = json.loads(data)
+            if predicate is None or predicate(row):
+                yield row
+
+    def sql(self, statement, parameters=()):
+        """Runs an SQL statement on the replica.
+
+        :returns: The resulting rows.
+        :rtype: :obj:`list` of :obj:`tuple`
+        """
+        return self.connection.execute(statement, parameters).fetchall()
@@ -0,0 +1,271 @@
+import bisect
+import logging
+import math
+import threading
+import time
+from array import array
+
+import requests
+
+from pypuppetdb.errors import APIError, MetricReadError
+
+log = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """A fixed number of floats in a preallocated :class:`array.array`,
+    where every new value overwrites the oldest one once it is full.
+
+    Appending never allocates. Indexing goes from the oldest (0) to the
+    newest (-1) value, and as the values of a timestamp buffer are sorted
+    it can be searched with :mod:`bisect` directly.
+
+    :param size: The number of values to keep.
+    :type size: :obj:`int`
+    """
+
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError(f"size must be at least 1, was given: {size}")
+        self.size = size
+        self._data = array("d", [math.nan]) * size
+        self._next = 0
+        self._count = 0
+
+    def __repr__(self):
+        return f"<RingBuffer: {self._count} of {self.size}>"
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("ring buffer index out of range")
+        return self._data[(self._next - self._count + index) % self.size]
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+    def append(self, value):
+        """Adds a value, overwriting the oldest one if the buffer is full."""
+        self._data[self._next] = value
+        self._next = (self._next + 1) % self.size
+        if self._count < self.size:
+            self._count += 1
+
+
+def _number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return math.nan
+    return float(value)
+
+
+class MetricsSampler:
+    """Samples numeric PuppetDB metrics on an interval, such as the depth
+    of the command queue and the rates and timers of command processing
+    and storage, and derives rates, deltas and percentiles from them.
+
+    Every sample is one bulk read with
+    :meth:`~pypuppetdb.api.MetricsAPI.metrics`, and is stored in
+    :class:`RingBuffer` objects that keep the last `size` samples, so
+    sampling doesn't allocate and memory use is fixed. Attributes that
+    couldn't be read, or aren't numbers, are stored as NaN and skipped by
+    the derived values.
+
+    .. code-block:: python
+
+       >>> processed = ("puppetlabs.puppetdb.mq:name=global.processed", "Count")
+       >>> sampler = MetricsSampler(db, [processed], interval=10)
+       >>> sampler.start()
+       >>> sampler.rate(*processed, window=60)
+       42.5
+
+    :param api: The API to sample.
+    :type api: :class:`pypuppetdb.api.API`
+    :param metrics: The (mbean, attribute) tuples to sample.
+    :type metrics: :obj:`list`
+    :param interval: (Default: 10) Number of seconds between samples.
+    :type interval: :obj:`float`
+    :param size: (Default: 360) Number of samples to keep.
+    :type size: :obj:`int`
+
+    :ivar timestamps: The times of the samples.
+    :ivar errors: Number of samples that failed completely.
+    """
+
+    def __init__(self, api, metrics, interval=10, size=360):
+        self.api = api
+        self.metrics = []
+        for metric in metrics:
+            if isinstance(metric, str) or len(metric) != 2:
+                raise ValueError(
+                    f"metrics must be (mbean, attribute) tuples, was given: {metric}"
+                )
+            self.metrics.append(tuple(metric))
+        self.interval = interval
+        self.size = size
+        self.timestamps = RingBuffer(size)
+        self.errors = 0
+        self._buffers = {metric: RingBuffer(size) for metric in self.metrics}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker = None
+
+    def __repr__(self):
+        return "<MetricsSampler: {} metrics, {} samples>".format(
+            len(self.metrics), len(self.timestamps)
+        )
+
+    def sample(self):
+        """Takes a sample now."""
+        try:
+            values = self.api.metrics(self.metrics)
+        except (APIError, requests.exceptions.RequestException, ValueError) as err:
+            # a failing PuppetDB must not stop the sampling thread
+            log.warning(f"Could not sample metrics: {err}")
+            self.errors += 1
+            return
+
+        now = time.time()
+        with self._lock:
+            self.timestamps.append(now)
+            for metric, buffer in self._buffers.items():
+                value = values.get(metric[0])
+                if isinstance(value, dict):
+                    buffer.append(_number(value.get(metric[1])))
+                else:
+                    if isinstance(value, MetricReadError):
+                        log.debug(f"Could not sample {metric[0]}: {value}")
+                    buffer.append(math.nan)
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.sample()
+            self._stop.wait(max(0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        """Starts sampling in a background thread."""
+        if self._worker is not None:
+            return
+        self._stop.clear()
+        self._worker = threading.Thread(
+            target=self._run, name="pypuppetdb-sampler", daemon=True
+        )
+        self._worker.start()
+
+    def stop(self, timeout=None):
+        """Stops the background thread."""
+        if self._worker is None:
+            return
+        self._stop.set()
+        self._worker.join(timeout)
+        self._worker = None
+
+    def buffer(self, mbean, attribute):
+        """Get the samples of a metric.
+
+        :rtype: :class:`RingBuffer`
+        """
+        try:
+            return self._buffers[(mbean, attribute)]
+        except KeyError:
+            raise KeyError(f"{mbean} {attribute} is not sampled") from None
+
+    def _window_start(self, window):
+        """The index of the oldest sample within `window` seconds of the
+        newest one."""
+        if window is None:
+            return 0
+        return bisect.bisect_left(self.timestamps, self.timestamps[-1] - window)
+
+    def _ends(self, mbean, attribute, window):
+        """The first and last sample in the window that aren't NaN, as
+        (index, value) tuples."""
+        buffer = self.buffer(mbean, attribute)
+        if len(buffer) == 0:
+            return None, None
+        start = self._window_start(window)
+        first = last = None
+        for index in range(start, len(buffer)):
+            if not math.isnan(buffer[index]):
+                first = (index, buffer[index])
+                break
+        for index in range(len(buffer) - 1, start - 1, -1):
+            if not math.isnan(buffer[index]):
+                last = (index, buffer[index])
+                break
+        return first, last
+
+    def last(self, mbean, attribute):
+        """Get the newest value of a metric.
+
+        :returns: The value, or `None` if it wasn't sampled yet.
+        :rtype: :obj:`None` or :obj:`float`
+        """
+        with self._lock:
+            _, last = self._ends(mbean, attribute, None)
+        return None if last is None else last[1]
+
+    def delta(self, mbean, attribute, window=None):
+        """Get how much a metric changed over the last `window` seconds, or
+        over all samples.
+
+        :returns: The change, or `None` if there are fewer than two samples.
+        :rtype: :obj:`None` or :obj:`float`
+        """
+        with self._lock:
+            first, last = self._ends(mbean, attribute, window)
+        if first is None or first[0] == last[0]:
+            return None
+        return last[1] - first[1]
+
+    def rate(self, mbean, attribute, window=None):
+        """Get the rate per second at which a counter increased over the
+        last `window` seconds, or over all samples.
+
+        :returns: The rate, or `None` if there are fewer than two samples\
+            or the counter was reset, eg. by a restart of PuppetDB.
+        :rtype: :obj:`None` or :obj:`float`
+        """
+        with self._lock:
+            first, last = self._ends(mbean, attribute, window)
+            if first is None or first[0] == last[0]:
+                return None
+            elapsed = self.timestamps[last[0]] - self.timestamps[first[0]]
+        delta = last[1] - first[1]
+        if delta < 0 or elapsed <= 0:
+            return None
+        return delta / elapsed
+
+    def percentile(self, mbean, attribute, percentile, window=None):
+        """Get a percentile of the values of a metric over the last `window`
+        seconds, or over all samples, with linear interpolation.
+
+        :param percentile: The percentile, from 0 to 100.
+        :type percentile: :obj:`float`
+
+        :returns: The percentile, or `None` if there are no samples.
+        :rtype: :obj:`None` or :obj:`float`
+        """
+        if not 0 <= percentile <= 100:
+            raise ValueError(f"percentile must be 0 to 100, was given: {percentile}")
+        with self._lock:
+            buffer = self.buffer(mbean, attribute)
+            if len(buffer) == 0:
+                return None
+            start = self._window_start(window)
+            values = sorted(
+                buffer[i]
+                for i in range(start, len(buffer))
+                if not math.isnan(buffer[i])
+            )
+        if not values:
+            return None
+        position = (len(values) - 1) * percentile / 100
+        lower = math.floor(position)
+        upper = math.ceil(position)
+        return values[lower] + (values[upper] - values[lower]) * (position - lower)
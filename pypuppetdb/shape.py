@@ -0,0 +1,92 @@
+import functools
+import json
+import logging
+import re
+
+from pypuppetdb.errors import PqlSyntaxError
+from pypuppetdb.pql import parse_ast
+
+log = logging.getLogger(__name__)
+
+# the operators whose last argument is a value
+VALUE_OPERATORS = {"=", ">", "<", ">=", "<=", "~", "~>", "null?"}
+# the operators whose only argument is a value
+COUNT_OPERATORS = {"limit", "offset"}
+
+PLACEHOLDER = "?"
+
+# strings and numbers in PQL that couldn't be parsed
+PQL_LITERALS = re.compile(
+    r"""'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|\b-?\d+(?:\.\d+)?\b"""
+)
+
+
+def _normalize(ast):
+    if not isinstance(ast, list) or not ast or not isinstance(ast[0], str):
+        return ast
+    operator = ast[0]
+    if operator in VALUE_OPERATORS and len(ast) == 3:
+        return [operator, ast[1], PLACEHOLDER]
+    if operator in COUNT_OPERATORS:
+        return [operator, PLACEHOLDER]
+    if operator == "array":
+        # the same query with 3 or 300 values has the same shape
+        return [operator, PLACEHOLDER]
+    return [operator] + [_normalize(argument) for argument in ast[1:]]
+
+
+def _blank(match):
+    return '""' if match.group(0)[0] in "'\"" else "0"
+
+
+@functools.lru_cache(maxsize=1024)
+def _pql_shape(template):
+    """Get the shape of a PQL query whose literals are blanked out, so that
+    all the queries of a shape are parsed only once."""
+    try:
+        ast = parse_ast(template)
+    except PqlSyntaxError:
+        return PQL_LITERALS.sub(PLACEHOLDER, template)
+    return json.dumps(_normalize(ast), separators=(",", ":"))
+
+
+def _ast_shape(query):
+    try:
+        ast = json.loads(query)
+    except ValueError:
+        return query
+    return json.dumps(_normalize(ast), separators=(",", ":"))
+
+
+def query_shape(query, pql=False):
+    """Get the shape of a query: its AST with the values compared to,
+    the values of `in` arrays and the limits and offsets replaced by
+    ``?``, so that all the queries that only differ in their values have
+    the same shape.
+
+    .. code-block:: python
+
+       >>> query_shape('["and", ["=", "certname", "node1"], ["=", "latest_report?", true]]')
+       '["and",["=","certname","?"],["=","latest_report?","?"]]'
+       >>> query_shape('nodes { certname = "node1" }', pql=True)
+       '["from","nodes",["=","certname","?"]]'
+
+    PQL queries have their literals blanked out before they are parsed, and
+    the shapes of the results are memoized, so every shape is only parsed
+    once.
+
+    :param query: An AST query, or a PQL query if `pql` is set.
+    :type query: :obj:`string` or any operator of\
+        :mod:`pypuppetdb.QueryBuilder`
+    :param pql: (Default: `False`) Whether `query` is a PQL query. PQL\
+        that can't be parsed has its literals replaced instead.
+    :type pql: :obj:`bool`
+
+    :returns: The shape, or `None` if there is no query.
+    :rtype: :obj:`None` or :obj:`string`
+    """
+    if query is None:
+        return None
+    if pql:
+        return _pql_shape(PQL_LITERALS.sub(_blank, " ".join(str(query).split())))
+    return _ast_shape(str(query))
@@ -0,0 +1,224 @@
+import logging
+import threading
+
+from pypuppetdb.exporter import LATENCY_BUCKETS, Histogram
+
+log = logging.getLogger(__name__)
+
+ORDERS = ("total", "max", "mean", "count", "bytes")
+
+
+class ShapeStats:
+    """The requests made with queries of one shape, see
+    :func:`~pypuppetdb.shape.query_shape`.
+
+    :ivar endpoint: The endpoint queried.
+    :ivar shape: The shape of the queries, `None` for requests without one.
+    :ivar count: Number of requests, including the `inherited` ones.
+    :ivar errors: Number of requests that failed.
+    :ivar total: Total number of seconds the requests took, including\
+        the `error`.
+    :ivar max: The most seconds a request took.
+    :ivar bytes: Total size of the responses.
+    :ivar histogram: The :class:`~pypuppetdb.exporter.Histogram` of the\
+        seconds the requests took.
+    :ivar example: The URL of the slowest request, to reproduce it.
+    :ivar error: The number of seconds of `total` that were inherited\
+        from the shape this one replaced, see :class:`SlowQueryLog`. The\
+        requests of this shape took at least `total` minus `error` seconds.
+    :ivar inherited: The number of requests of `count` that were inherited\
+        with the `error`. The `max`, `bytes`, `histogram` and `mean` are of\
+        the requests of this shape only.
+    """
+
+    def __init__(self, endpoint, shape, buckets=LATENCY_BUCKETS):
+        self.endpoint = endpoint
+        self.shape = shape
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytes = 0
+        self.histogram = Histogram(buckets)
+        self.example = None
+        self.error = 0.0
+        self.inherited = 0
+
+    def __repr__(self):
+        return "<ShapeStats: {} {} {} requests, {:.3f}s>".format(
+            self.endpoint, self.shape, self.count, self.total
+        )
+
+    @property
+    def mean(self):
+        """The mean number of seconds a request of this shape took, without
+        the inherited ones."""
+        count = self.count - self.inherited
+        if count == 0:
+            return 0.0
+        return (self.total - self.error) / count
+
+    def add(self, event):
+        elapsed = event.elapsed
+        self.count += 1
+        if event.error is not None:
+            self.errors += 1
+        self.total += elapsed
+        self.bytes += event.bytes
+        self.histogram.observe(elapsed)
+        if elapsed >= self.max:
+            self.max = elapsed
+            self.example = event.url
+
+
+class SlowQueryLog:
+    """A request hook that finds the queries that are hard on PuppetDB.
+
+    The requests are grouped by their endpoint and the shape of their
+    query, so that eg. all the queries for a node by its certname add up,
+    and the latency and size of the responses of each group are kept in a
+    :class:`ShapeStats`. At most `capacity` shapes are kept: when a new
+    shape comes in, it replaces the one that took the least time in total
+    and inherits its count and total, as in the Space-Saving algorithm.
+    A new shape thus isn't the first to go when the next one comes in, and
+    a shape that keeps coming back works its way up. The inherited part is
+    kept as the `error` of the shape.
+
+    Requests that take at least `threshold` seconds are logged right away,
+    with the timings of their phases.
+
+    .. code-block:: python
+
+       >>> slowlog = SlowQueryLog(threshold=2)
+       >>> db = connect(request_hooks=[slowlog])
+       >>> ...
+       >>> print(slowlog.report(limit=3))
+
+    Commands are not queries, they are left out.
+
+    :param threshold: (optional) Log the requests that take at least this\
+        many seconds.
+    :type threshold: :obj:`float`
+    :param capacity: (Default: 200) The most shapes to keep.
+    :type capacity: :obj:`int`
+    :param buckets: (optional) The upper bounds of the latency buckets of\
+        the histograms, in seconds.
+    :type buckets: :obj:`tuple`
+
+    :ivar dropped: Number of shapes dropped to make room for new ones.
+    """
+
+    def __init__(self, threshold=None, capacity=200, buckets=LATENCY_BUCKETS):
+        if capacity < 1:
+            raise ValueError(f"capacity must be at least 1, was given: {capacity}")
+        self.threshold = threshold
+        self.capacity = capacity
+        self.buckets = buckets
+        self.dropped = 0
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<SlowQueryLog: {len(self._stats)} shapes>"
+
+    def __len__(self):
+        return len(self._stats)
+
+    def __call__(self, event):
+        if event.endpoint == "cmd":
+            return
+
+        key = (event.endpoint, event.shape)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = ShapeStats(*key, buckets=self.buckets)
+                if len(self._stats) >= self.capacity:
+                    least = min(self._stats, key=lambda k: self._stats[k].total)
+                    evicted = self._stats.pop(least)
+                    stats.count = stats.inherited = evicted.count
+                    stats.total = stats.error = evicted.total
+                    self.dropped += 1
+                self._stats[key] = stats
+            stats.add(event)
+
+        if self.threshold is not None and event.elapsed >= self.threshold:
+            log.warning(
+                "Slow query: %.3fs for %s %s (shape %s, status %s, %d bytes;"
+                " connect %s, ttfb %s, download %s, decode %s, construct %s)",
+                event.elapsed,
+                event.method,
+                event.url,
+                event.shape,
+                event.status,
+                event.bytes,
+                *(
+                    "-" if phase is None else f"{phase:.3f}s"
+                    for phase in (
+                        event.connect,
+                        event.ttfb,
+                        event.download,
+                        event.decode,
+                        event.construct,
+                    )
+                ),
+            )
+
+    def reset(self):
+        """Forgets all the shapes."""
+        with self._lock:
+            self._stats.clear()
+            self.dropped = 0
+
+    def top(self, limit=10, by="total"):
+        """Get the worst shapes.
+
+        :param limit: (Default: 10) The number of shapes.
+        :type limit: :obj:`int`
+        :param by: (Default: ``total``) What makes a shape bad, one of\
+            ``total``, ``max``, ``mean``, ``count`` or ``bytes``.
+        :type by: :obj:`string`
+
+        :rtype: :obj:`list` of :class:`ShapeStats`
+        """
+        if by not in ORDERS:
+            raise ValueError(f"by must be one of {ORDERS}, was given: {by}")
+        with self._lock:
+            stats = list(self._stats.values())
+        stats.sort(key=lambda s: getattr(s, by), reverse=True)
+        return stats[:limit]
+
+    def report(self, limit=10, by="total"):
+        """Get a report of the worst shapes, as for :meth:`top`. The `count`
+        and `total` include what a shape inherited, which is shown as its
+        `error`.
+
+        :rtype: :obj:`string`
+        """
+        lines = [
+            "{:>8} {:>6} {:>10} {:>10} {:>9} {:>9} {:>12}  {}".format(
+                "count",
+                "errors",
+                "total",
+                "error",
+                "mean",
+                "max",
+                "bytes",
+                "endpoint shape",
+            )
+        ]
+        for stats in self.top(limit, by):
+            lines.append(
+                "{:>8} {:>6} {:>9.3f}s {:>9.3f}s {:>8.3f}s {:>8.3f}s {:>12}  {} {}".format(
+                    stats.count,
+                    stats.errors,
+                    stats.total,
+                    stats.error,
+                    stats.mean,
+                    stats.max,
+                    stats.bytes,
+                    stats.endpoint,
+                    stats.shape or "-",
+                )
+            )
+        return "\n".join(lines)
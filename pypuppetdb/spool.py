@@ -0,0 +1,563 @@
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from pypuppetdb.api.command import EncodedCommand
+from pypuppetdb.errors import APIError
+
+log = logging.getLogger(__name__)
+
+# every record is the length of its metadata and body, their CRC32 and then
+# the metadata (the command parameters as JSON) and the body themselves
+RECORD_HEADER = struct.Struct(">III")
+
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+# the commands that could not be delivered, in the format of the segments
+DEAD_LETTER_FILE = "dead-letter"
+
+# responses to commands that will never be accepted, no matter how often
+# they are sent again
+REJECTED_STATUS = range(400, 500)
+RETRIED_STATUS = (408, 429)
+
+
+def _segment_name(number):
+    return f"{number:020d}{SEGMENT_SUFFIX}"
+
+
+def _pack_record(encoded, **meta):
+    """Get the record of an encoded command, with extra `meta` data."""
+    meta = json.dumps(
+        dict(meta, params=encoded.params, content_encoding=encoded.content_encoding)
+    ).encode("utf-8")
+    crc = zlib.crc32(encoded.body, zlib.crc32(meta))
+    header = RECORD_HEADER.pack(len(meta), len(encoded.body), crc)
+    return header + meta + encoded.body
+
+
+def _read_entry(f):
+    """Reads the record at the position of `f`.
+
+    :returns: The metadata, the body and the size of the record, or `None`\
+        if there is no complete record.
+    """
+    header = f.read(RECORD_HEADER.size)
+    if len(header) < RECORD_HEADER.size:
+        return None
+    meta_size, body_size, crc = RECORD_HEADER.unpack(header)
+    meta = f.read(meta_size)
+    body = f.read(body_size)
+    if len(meta) < meta_size or len(body) < body_size:
+        return None
+    if zlib.crc32(body, zlib.crc32(meta)) != crc:
+        raise APIError(f"Corrupt record in command spool {f.name}")
+    return json.loads(meta), body, RECORD_HEADER.size + meta_size + body_size
+
+
+def _read_record(f):
+    """Reads the record at the position of `f`.
+
+    :returns: The encoded command and the size of the record, or `None` if\
+        there is no complete record.
+    """
+    entry = _read_entry(f)
+    if entry is None:
+        return None
+    meta, body, size = entry
+    encoded = EncodedCommand.restore(
+        meta["params"], body, content_encoding=meta.get("content_encoding")
+    )
+    return encoded, size
+
+
+def _transient(err):
+    """Whether sending a command failed because PuppetDB was unreachable
+    or overloaded, and it may well succeed later."""
+    if isinstance(err, requests.exceptions.HTTPError):
+        if err.response is None:
+            return True
+        status = err.response.status_code
+        return status >= 500 or status in RETRIED_STATUS
+    return isinstance(
+        err, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    )
+
+
+class CommandSpool:
+    """A durable queue of commands on disk, so that producers of facts and
+    reports can keep going at full speed while PuppetDB is unreachable.
+
+    :meth:`submit` appends a command to the current segment file of the
+    spool and returns at once. A background worker, started with
+    :meth:`start` (or :meth:`drain`), sends the spooled commands to
+    PuppetDB in the order they were submitted, in batches of `concurrency`
+    commands that are sent at the same time. Commands are retried with an
+    exponential backoff while PuppetDB is down or overloaded (connection
+    errors, timeouts and 5xx statuses). Those that PuppetDB rejects (with
+    a 4xx status), and those that fail for any other reason `max_attempts`
+    times, are logged and moved to the dead letter file of the spool, see
+    :meth:`dead_letters`.
+
+    Appends are flushed at once but only synced to disk every `sync_every`
+    commands or `sync_interval` seconds, so a crash of the host (not just
+    of the process) may lose the last few of them. The position of the
+    worker is saved after every batch, with the commands after it that are
+    already done and the attempts of those that aren't, and the spool
+    continues where it was after a restart. A command may be sent twice if
+    the process dies while sending it.
+
+    Commands for the same node are never in the same batch, so they reach
+    PuppetDB in order.
+
+    :param api: The API to send the commands to.
+    :type api: :class:`pypuppetdb.api.API`
+    :param directory: The directory of the spool, created if missing.
+    :type directory: :obj:`string`
+    :param segment_size: (Default: 64 MiB) The size at which a new segment\
+        file is started. Segments are removed once all their commands are\
+        sent.
+    :type segment_size: :obj:`int`
+    :param sync_every: (Default: 100) Sync to disk after this many commands.
+    :type sync_every: :obj:`int`
+    :param sync_interval: (Default: 1) Sync to disk after this many seconds.
+    :type sync_interval: :obj:`float`
+    :param concurrency: (Default: 4) The most commands sent at once.
+    :type concurrency: :obj:`int`
+    :param retry_interval: (Default: 1) Seconds to wait before the first\
+        retry, doubled for every next one.
+    :type retry_interval: :obj:`float`
+    :param max_retry_interval: (Default: 60) The longest wait between retries.
+    :type max_retry_interval: :obj:`float`
+    :param max_attempts: (Default: 5) The number of times a command that\
+        fails for other reasons than PuppetDB being unavailable is sent\
+        before it is given up on.
+    :type max_attempts: :obj:`int`
+
+    :ivar submitted: Number of commands submitted to the spool.
+    :ivar delivered: Number of commands sent to PuppetDB.
+    :ivar rejected: Number of commands PuppetDB rejected.
+    :ivar dead: Number of commands moved to the dead letter file.
+    :ivar retries: Number of times a command had to be sent again.
+    """
+
+    def __init__(
+        self,
+        api,
+        directory,
+        segment_size=64 * 1024**2,
+        sync_every=100,
+        sync_interval=1,
+        concurrency=4,
+        retry_interval=1,
+        max_retry_interval=60,
+        max_attempts=5,
+    ):
+        self.api = api
+        self.directory = directory
+        self.segment_size = segment_size
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.concurrency = concurrency
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.max_attempts = max_attempts
+        self.submitted = 0
+        self.delivered = 0
+        self.rejected = 0
+        self.dead = 0
+        self.retries = 0
+
+        self._lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._worker = None
+        self._executor = None
+
+        os.makedirs(directory, exist_ok=True)
+        segments = self._segments()
+        if not segments:
+            segments = [0]
+        self._segment = segments[-1]
+        self._recover(self._segment)
+        self._file = open(self._path(self._segment), "ab")
+        self._size = self._file.tell()
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+        # the starts of the records after the cursor that are delivered or
+        # dead lettered, and the attempts of those that failed
+        self._done = set()
+        self._attempts = {}
+        self._cursor = self._load_cursor(segments[0])
+
+    def __repr__(self):
+        return f"<CommandSpool: {self.directory}>"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, trace):
+        self.close()
+
+    def _path(self, segment):
+        return os.path.join(self.directory, _segment_name(segment))
+
+    def _segments(self):
+        return sorted(
+            int(name[: -len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _recover(self, segment):
+        """Cuts off a record that was only partially written when the
+        process died."""
+        path = self._path(segment)
+        if not os.path.exists(path):
+            return
+        valid = 0
+        with open(path, "rb") as f:
+            while True:
+                try:
+                    record = _read_record(f)
+                except (APIError, ValueError, KeyError):
+                    record = None
+                if record is None:
+                    break
+                valid += record[1]
+            end = f.seek(0, os.SEEK_END)
+        if valid != end:
+            log.warning(f"Dropping {end - valid} bytes of a partial record from {path}")
+            with open(path, "rb+") as f:
+                f.truncate(valid)
+
+    def _load_cursor(self, first_segment):
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE)) as f:
+                cursor = json.load(f)
+            segment, offset = cursor["segment"], cursor["offset"]
+            done = {tuple(start) for start in cursor.get("done", [])}
+            attempts = {
+                (segment_, offset_): count
+                for segment_, offset_, count in cursor.get("attempts", [])
+            }
+        except (OSError, ValueError, KeyError, TypeError):
+            return first_segment, 0
+        if segment < first_segment:
+            return first_segment, 0
+        self._done = done
+        self._attempts = attempts
+        return segment, offset
+
+    def _save_cursor(self, cursor):
+        self._done = {start for start in self._done if start >= cursor}
+        self._attempts = {
+            start: count for start, count in self._attempts.items() if start >= cursor
+        }
+        path = os.path.join(self.directory, CURSOR_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(
+                {
+                    "segment": cursor[0],
+                    "offset": cursor[1],
+                    "done": sorted(self._done),
+                    "attempts": [
+                        [*start, count]
+                        for start, count in sorted(self._attempts.items())
+                    ],
+                },
+                f,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self._cursor = cursor
+
+        # the segments before the cursor have been sent completely
+        for segment in self._segments():
+            if segment >= cursor[0]:
+                break
+            os.remove(self._path(segment))
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def submit(self, command, payload):
+        """Appends a command to the spool.
+
+        :param command: The PuppetDB Command we want to execute.
+        :type command: :obj:`string`
+        :param payload: The payload, in wire format, specific to the command.
+        :type payload: :obj:`dict`
+
+        :raises: :class:`~pypuppetdb.errors.APIError` if the command isn't\
+            supported.
+        """
+        encoded = EncodedCommand(command, payload, self.api.compress_commands)
+        record = _pack_record(encoded)
+        size = len(record)
+
+        with self._lock:
+            if self._size > 0 and self._size + size > self.segment_size:
+                self._sync()
+                self._file.close()
+                self._segment += 1
+                self._file = open(self._path(self._segment), "ab")
+                self._size = 0
+            self._file.write(record)
+            self._file.flush()
+            self._size += size
+            self._unsynced += 1
+            self.submitted += 1
+            if (
+                self._unsynced >= self.sync_every
+                or time.monotonic() - self._synced_at >= self.sync_interval
+            ):
+                self._sync()
+        self._wakeup.set()
+
+    def flush(self):
+        """Syncs the submitted commands to disk."""
+        with self._lock:
+            if self._unsynced:
+                self._sync()
+
+    def backlog(self):
+        """Get the number of bytes of commands that have not been sent yet.
+
+        :rtype: :obj:`int`
+        """
+        total = 0
+        for segment in self._segments():
+            if segment >= self._cursor[0]:
+                total += os.path.getsize(self._path(segment))
+        return total - self._cursor[1]
+
+    def _read_batch(self):
+        """Reads the next commands after the cursor that aren't done yet,
+        at most `concurrency` and at most one per node.
+
+        :returns: A list of (encoded command, start, end) tuples, where\
+            start and end are the cursors before and after the record.
+        """
+        batch = []
+        certnames = set()
+        segment, offset = self._cursor
+        last_segment = self._segment
+        while len(batch) < self.concurrency:
+            path = self._path(segment)
+            if not os.path.exists(path):
+                if segment >= last_segment:
+                    break
+                segment, offset = segment + 1, 0
+                continue
+            with open(path, "rb") as f:
+                f.seek(offset)
+                while len(batch) < self.concurrency:
+                    try:
+                        record = _read_record(f)
+                    except (APIError, ValueError, KeyError) as err:
+                        # the rest of the segment can't be trusted
+                        log.error(f"Skipping the rest of {path}: {err}")
+                        if batch or segment >= last_segment:
+                            return batch
+                        self._save_cursor((segment + 1, 0))
+                        return self._read_batch()
+                    if record is None:
+                        break
+                    encoded, size = record
+                    if (segment, offset) in self._done:
+                        offset += size
+                        if not batch:
+                            self._save_cursor((segment, offset))
+                        continue
+                    if encoded.certname in certnames:
+                        return batch
+                    certnames.add(encoded.certname)
+                    batch.append((encoded, (segment, offset), (segment, offset + size)))
+                    offset += size
+            if len(batch) < self.concurrency:
+                if segment >= last_segment:
+                    break
+                segment, offset = segment + 1, 0
+        return batch
+
+    def _deliver(self, encoded):
+        """Sends a command.
+
+        :returns: `None` if it was delivered, else the error.
+        """
+        try:
+            self.api._send_command(encoded)
+        except (requests.exceptions.RequestException, APIError, ValueError) as err:
+            return err
+        with self._lock:
+            self.delivered += 1
+        return None
+
+    def _dead_letter(self, encoded, err):
+        """Moves a command that can't be delivered to the dead letter file."""
+        log.error(
+            f"Could not deliver {encoded!r}, moving it to the dead letters: {err}"
+        )
+        record = _pack_record(encoded, error=str(err), failed=time.time())
+        with self._lock:
+            with open(os.path.join(self.directory, DEAD_LETTER_FILE), "ab") as f:
+                f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+            self.dead += 1
+
+    def dead_letters(self):
+        """Get the commands that could not be delivered, eg. to fix and
+        submit them again.
+
+        :returns: A generator yielding the encoded commands with the error\
+            they failed with.
+        :rtype: :obj:`tuple` of :class:`~pypuppetdb.api.command.EncodedCommand`\
+            and :obj:`string`
+        """
+        path = os.path.join(self.directory, DEAD_LETTER_FILE)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            while True:
+                entry = _read_entry(f)
+                if entry is None:
+                    return
+                meta, body, _ = entry
+                encoded = EncodedCommand.restore(
+                    meta["params"], body, content_encoding=meta.get("content_encoding")
+                )
+                yield encoded, meta.get("error")
+
+    def _send_batch(self, batch, deadline=None):
+        """Sends a batch until all of it is delivered, the spool stops or
+        the `deadline` (a :func:`time.monotonic` time) passes.
+
+        :returns: The number of commands of the batch that are done.
+        """
+        pending = batch
+        delay = self.retry_interval
+        while True:
+            encoded = [record[0] for record in pending]
+            if self._executor is not None and len(encoded) > 1:
+                errors = list(self._executor.map(self._deliver, encoded))
+            else:
+                errors = [self._deliver(e) for e in encoded]
+            failed = []
+            for record, err in zip(pending, errors):
+                start = record[1]
+                if err is None:
+                    self._done.add(start)
+                    continue
+                if _transient(err):
+                    failed.append(record)
+                    continue
+                self._attempts[start] = self._attempts.get(start, 0) + 1
+                if (
+                    isinstance(err, requests.exceptions.HTTPError)
+                    and err.response.status_code in REJECTED_STATUS
+                ):
+                    # permanently rejected, sending it again won't help
+                    with self._lock:
+                        self.rejected += 1
+                    self._dead_letter(record[0], err)
+                    self._done.add(start)
+                elif self._attempts[start] >= self.max_attempts:
+                    self._dead_letter(record[0], err)
+                    self._done.add(start)
+                else:
+                    failed.append(record)
+            pending = failed
+            if not pending:
+                self._save_cursor(batch[-1][2])
+                return len(batch)
+
+            # the commands after the first undelivered one that are done are
+            # saved with the cursor, so they aren't sent again
+            self._save_cursor(pending[0][1])
+            self.retries += len(pending)
+            if deadline is not None:
+                delay = min(delay, deadline - time.monotonic())
+                if delay <= 0:
+                    return len(batch) - len(pending)
+            log.warning(
+                f"Could not send {len(pending)} spooled commands, retrying in {delay}s"
+            )
+            if self._stop.wait(delay):
+                return len(batch) - len(pending)
+            delay = min(delay * 2, self.max_retry_interval)
+
+    def drain(self, timeout=None):
+        """Sends all spooled commands, in the calling thread.
+
+        :param timeout: (optional) Give up retrying after this many seconds.
+        :type timeout: :obj:`None` or :obj:`float`
+
+        :returns: The number of commands sent (or given up on).
+        :rtype: :obj:`int`
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        count = 0
+        with self._drain_lock:
+            while not self._stop.is_set():
+                batch = self._read_batch()
+                if not batch:
+                    break
+                done = self._send_batch(batch, deadline)
+                count += done
+                if done < len(batch):
+                    break
+        return count
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            self.drain()
+            # also syncs appends that came in slower than sync_every
+            self.flush()
+            self._wakeup.wait(self.sync_interval)
+
+    def start(self):
+        """Starts sending the spooled commands in a background thread."""
+        if self._worker is not None:
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self._worker = threading.Thread(
+            target=self._run, name="pypuppetdb-spool", daemon=True
+        )
+        self._worker.start()
+
+    def stop(self, timeout=None):
+        """Stops the background thread, the commands that weren't sent yet
+        stay in the spool."""
+        if self._worker is None:
+            return
+        self._stop.set()
+        self._wakeup.set()
+        self._worker.join(timeout)
+        self._executor.shutdown()
+        self._worker = None
+        self._executor = None
+        self._stop.clear()
+
+    def close(self):
+        """Stops the background thread and syncs the spool to disk."""
+        self.stop()
+        with self._lock:
+            self._sync()
+            self._file.close()
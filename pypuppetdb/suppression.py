@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# fields of a `replace facts` payload that change every run without the
+# facts themselves changing
+VOLATILE_FIELDS = ("producer_timestamp",)
+
+
+def _canonical(payload):
+    canonical = {k: v for k, v in payload.items() if k not in VOLATILE_FIELDS}
+    return json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def facts_digest(payload):
+    """Get the canonical hash of a `replace facts` payload, which ignores
+    the order of the keys and the `VOLATILE_FIELDS`.
+
+    :rtype: :obj:`string`
+    """
+    return hashlib.sha1(_canonical(payload).encode("utf-8")).hexdigest()  # nosec
+
+
+def facts_body(payload):
+    """Serializes a `replace facts` payload to JSON and gets its
+    :func:`facts_digest`, serializing the payload only once.
+
+    :returns: The body and the digest.
+    :rtype: :obj:`tuple` of :obj:`bytes` and :obj:`string`
+    """
+    data = _canonical(payload)
+    digest = hashlib.sha1(data.encode("utf-8")).hexdigest()  # nosec
+    volatile = {k: payload[k] for k in VOLATILE_FIELDS if k in payload}
+    if volatile:
+        # the volatile fields go in front of the canonical ones
+        head = json.dumps(volatile, separators=(",", ":"), default=str)[:-1]
+        data = head + ("}" if data == "{}" else "," + data[1:])
+    return data.encode("utf-8"), digest
+
+
+class FactsSuppressor:
+    """Skips `replace facts` commands for nodes whose facts didn't change
+    since they were last submitted, so that fact pushers that run often
+    don't fill the command queue of PuppetDB with commands that change
+    nothing.
+
+    The hash of the last successfully submitted facts of every node is
+    kept in memory, or in an SQLite database at `path` so that it is
+    remembered across runs and shared by processes. Unchanged facts are
+    still sent every `keepalive` seconds, so that the node isn't
+    deactivated or purged by PuppetDB's `node-ttl`.
+
+    Pass it as `facts_suppressor` to :func:`~pypuppetdb.connect`, skipped
+    commands then return `None`.
+
+    :param path: (optional) The database file, if not given the hashes are\
+        only kept in memory.
+    :type path: :obj:`None` or :obj:`string`
+    :param keepalive: (Default: 6 hours) Number of seconds after which\
+        unchanged facts are sent anyway, `None` to never send them.
+    :type keepalive: :obj:`None` or :obj:`int`
+    :param timeout: (Default: 10) Number of seconds to wait for another\
+        process that is writing to the database.
+    :type timeout: :obj:`float`
+
+    :ivar checked: Number of commands checked.
+    :ivar suppressed: Number of commands skipped because nothing changed.
+    :ivar changed: Number of commands sent because the facts changed, or\
+        weren't submitted before.
+    :ivar keepalives: Number of commands with unchanged facts sent because\
+        of the `keepalive`.
+    """
+
+    def __init__(self, path=None, keepalive=6 * 3600, timeout=10):
+        self.path = path
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.checked = 0
+        self.suppressed = 0
+        self.changed = 0
+        self.keepalives = 0
+        self._hashes = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        if path is not None:
+            with self._connection() as connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS facts "
+                    "(certname TEXT PRIMARY KEY, hash TEXT, submitted REAL)"
+                )
+
+    def __repr__(self):
+        return "<FactsSuppressor: {} suppressed of {}>".format(
+            self.suppressed, self.checked
+        )
+
+    def _connection(self):
+        # sqlite connections can't be shared with threads or forked processes
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _last(self, certname):
+        if self.path is None:
+            return self._hashes.get(certname, (None, None))
+        try:
+            row = (
+                self._connection()
+                .execute(
+                    "SELECT hash, submitted FROM facts WHERE certname = ?", (certname,)
+                )
+                .fetchone()
+            )
+        except sqlite3.Error as err:
+            log.warning(f"Could not read from facts suppressor {self.path}: {err}")
+            row = None
+        return row if row is not None else (None, None)
+
+    def should_send(self, certname, digest):
+        """Checks whether the facts of a node have to be sent.
+
+        :param certname: The node.
+        :type certname: :obj:`string`
+        :param digest: The hash of its facts, see :func:`facts_digest`.
+        :type digest: :obj:`string`
+
+        :rtype: :obj:`bool`
+        """
+        last_hash, submitted = self._last(certname)
+        with self._lock:
+            self.checked += 1
+            if last_hash != digest:
+                self.changed += 1
+                return True
+            if self.keepalive is not None and time.time() - submitted >= self.keepalive:
+                self.keepalives += 1
+                return True
+            self.suppressed += 1
+        log.debug(f"Facts of {certname} didn't change, not sending them")
+        return False
+
+    def record(self, certname, digest):
+        """Remembers the facts of a node were submitted."""
+        now = time.time()
+        if self.path is None:
+            with self._lock:
+                self._hashes[certname] = (digest, now)
+            return
+        try:
+            with self._connection() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO facts VALUES (?, ?, ?)",
+                    (certname, digest, now),
+                )
+        except sqlite3.Error as err:
+            log.warning(f"Could not write to facts suppressor {self.path}: {err}")
+
+    def forget(self, certname=None):
+        """Forgets the facts of a node, or of all nodes, so that they are
+        sent the next time."""
+        with self._lock:
+            if certname is None:
+                self._hashes.clear()
+            else:
+                self._hashes.pop(certname, None)
+        if self.path is not None:
+            with self._connection() as connection:
+                if certname is None:
+                    connection.execute("DELETE FROM facts")
+                else:
+                    connection.execute(
+                        "DELETE FROM facts WHERE certname = ?", (certname,)
+                    )
@@ -2,6 +2,8 @@ import logging
 from datetime import timedelta
 
 from pypuppetdb.QueryBuilder import EqualsOperator, AndOperator
+from pypuppetdb.graph import CatalogGraph
+from pypuppetdb.interning import get_pool
 from pypuppetdb.utils import json_to_datetime
 
 log = logging.getLogger(__name__)
@@ -256,7 +258,7 @@ class Report:
         """Get all events for this report. Additional arguments may also be
         specified that will be passed to the query function.
         """
-        return self.__api.events(query=EqualsOperator("report", self.hash_), **kwargs)
+        return self.__api.report_events(self.hash_, **kwargs)
 
     @staticmethod
     def create_from_dict(query_api, report):
@@ -314,6 +316,13 @@ class Fact:
         )
 
     def __init__(self, node, name, value, environment=None):
+        pool = get_pool()
+        if pool is not None:
+            node = pool.value(node)
+            name = pool.key(name)
+            value = pool.value(value)
+            environment = pool.key(environment)
+
         self.node = node
         self.name = name
         self.value = value
@@ -377,6 +386,15 @@ class Resource:
         environment=None,
         parameters={},
     ):
+        pool = get_pool()
+        if pool is not None:
+            node = pool.value(node)
+            type_ = pool.key(type_)
+            tags = pool.value(tags)
+            sourcefile = pool.value(sourcefile)
+            parameters = pool.value(parameters)
+            environment = pool.key(environment)
+
         self.node = node
         self.name = name
         self.type_ = type_
@@ -821,6 +839,18 @@ class Catalog:
     def get_edges(self):
         return iter(self.edges)
 
+    def get_graph(self, relationships=None):
+        """Get the dependency graph of this catalog.
+
+        :param relationships: (optional) Only use edges with these\
+            relationships, eg. ``["before", "required-by"]``.
+        :type relationships: :obj:`None` or :obj:`list` of :obj:`string`
+
+        :returns: An instance of CatalogGraph
+        :rtype: :class:`pypuppetdb.graph.CatalogGraph`
+        """
+        return CatalogGraph.from_catalog(self, relationships)
+
     @staticmethod
     def create_from_dict(catalog):
         return Catalog(
@@ -911,6 +941,12 @@ class Inventory:
     """
 
     def __init__(self, node, time, environment, facts, trusted):
+        pool = get_pool()
+        if pool is not None:
+            environment = pool.key(environment)
+            facts = pool.value(facts)
+            trusted = pool.value(trusted)
+
         self.node = node
         self.time = json_to_datetime(time)
         self.environment = environment
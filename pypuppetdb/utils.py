@@ -38,3 +38,16 @@ def json_to_datetime(date):
     return datetime.datetime.strptime(date, "%Y-%m-%dT%H:%M:%S.%fZ").replace(
         tzinfo=UTC()
     )
+
+
+def datetime_to_json(date):
+    """Tranforms a timezone aware datetime object into a JSON datetime
+    string, the reverse of :func:`json_to_datetime`.
+
+    :param date: The datetime object, in UTC.
+    :type date: :class:`datetime.datetime`
+
+    :returns: The datetime representation.
+    :rtype: :obj:`string`
+    """
+    return date.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
@@ -58,6 +58,12 @@ setup(
     data_files=[("requirements_for_tests", ["requirements-test.txt"])],
     cmdclass={"test": PyTest},
     install_requires=requirements,
+    entry_points={
+        "console_scripts": [
+            "pypuppetdb-export = pypuppetdb.export:main",
+            "pypuppetdb-exporter = pypuppetdb.exporter:main",
+        ],
+    },
     python_requires=">=3.7.0",
     classifiers=[
         "Development Status :: 5 - Production/Stable",
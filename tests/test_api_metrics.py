@@ -170,3 +170,102 @@ class TestMetricsAPI:
     def test_metric_bad_version(self, api):
         with pytest.raises(ValueError):
             api.metric("test", version="bad")
+
+    def test_metrics_bulk(self, api):
+        responses = [
+            {
+                "request": {"mbean": "test:name=Num", "type": "read"},
+                "value": {"Value": 0, "Count": 1},
+                "status": 200,
+            },
+            {
+                "request": {
+                    "mbean": "test:name=Timer",
+                    "attribute": ["Mean", "Max"],
+                    "type": "read",
+                },
+                "value": {"Mean": 1.5, "Max": 3.0},
+                "status": 200,
+            },
+            {
+                "request": {"mbean": "test:name=Missing", "type": "read"},
+                "error_type": "javax.management.InstanceNotFoundException",
+                "error": "javax.management.InstanceNotFoundException : test:name=Missing",
+                "status": 404,
+            },
+        ]
+
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.POST,
+            "http://localhost:8080/metrics/v2",
+            body=json.dumps(responses),
+        )
+        metrics = api.metrics(
+            [
+                "test:name=Num",
+                ("test:name=Timer", "Mean"),
+                ("test:name=Timer", "Max"),
+                "test:name=Missing",
+            ]
+        )
+        last_request = httpretty.last_request()
+        assert last_request.method == "POST"
+        assert last_request.path == "/metrics/v2"
+        assert json.loads(last_request.body) == [
+            {"type": "read", "mbean": "test:name=Num"},
+            {"type": "read", "mbean": "test:name=Timer", "attribute": ["Mean", "Max"]},
+            {"type": "read", "mbean": "test:name=Missing"},
+        ]
+        assert metrics["test:name=Num"] == {"Value": 0, "Count": 1}
+        assert metrics["test:name=Timer"] == {"Mean": 1.5, "Max": 3.0}
+        error = metrics["test:name=Missing"]
+        assert isinstance(error, pypuppetdb.errors.MetricReadError)
+        assert isinstance(error, pypuppetdb.errors.DoesNotComputeError)
+        assert error.mbean == "test:name=Missing"
+        assert error.status == 404
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_metrics_all_attributes_win(self, api):
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.POST,
+            "http://localhost:8080/metrics/v2",
+            body=json.dumps([{"value": {"Value": 0}, "status": 200}]),
+        )
+        api.metrics([("test:name=Num", "Value"), "test:name=Num"])
+        assert json.loads(httpretty.last_request().body) == [
+            {"type": "read", "mbean": "test:name=Num"}
+        ]
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_metrics_empty(self, api):
+        assert api.metrics([]) == {}
+
+    def test_metrics_v1(self, api):
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.GET,
+            "http://localhost:8080/metrics/v1/mbeans/test:name=Num",
+            body=json.dumps({"Value": 0, "Count": 1}),
+        )
+        httpretty.register_uri(
+            httpretty.GET,
+            "http://localhost:8080/metrics/v1/mbeans/test:name=Missing",
+            body="not found",
+            status=404,
+        )
+        metrics = api.metrics(
+            [("test:name=Num", "Count"), "test:name=Missing"], version="v1"
+        )
+        assert metrics["test:name=Num"] == {"Count": 1}
+        assert metrics["test:name=Missing"].status == 404
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_metrics_bad_version(self, api):
+        with pytest.raises(ValueError):
+            api.metrics(["test"], version="bad")
@@ -1,9 +1,13 @@
+import gzip
+import hashlib
 import json
 
 import httpretty
 import pytest
 
 import pypuppetdb
+from pypuppetdb.api.command import EncodedCommand
+from pypuppetdb.hooks import TimingAdapter
 
 
 def stub_request(url, data=None, method=httpretty.GET, status=200, **kwargs):
@@ -45,7 +49,7 @@ class TestCommandAPI:
             "certname": [node_name],
             "command": ["deactivate node"],
             "version": ["3"],
-            "checksum": ["b93d474970e54943aec050ee399dfb85d21e143a"],
+            "checksum": ["cf5683ce4ae43ec3fbebf9cadd7a29efc5fcdaac"],
         }
         assert last_request.headers["Content-Type"] == "application/json"
         assert last_request.method == "POST"
@@ -70,6 +74,147 @@ class TestCommandAPI:
         assert httpretty.last_request().path.startswith("/pdb/cmd/v1")
         assert httpretty.last_request().headers["X-Authentication"] == "tokenstring"
 
+    def test_cmd_checksum_matches_body(self, api):
+        httpretty.reset()
+        httpretty.enable()
+        stub_request("http://localhost:8080/pdb/cmd/v1", method=httpretty.POST)
+        api._cmd("replace facts", {"certname": "node1", "values": {"a": "é"}})
+        last_request = httpretty.last_request()
+        assert last_request.querystring["checksum"] == [
+            hashlib.sha1(last_request.body).hexdigest()
+        ]
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_cmd_compressed(self):
+        api = pypuppetdb.connect(compress_commands=True)
+        httpretty.reset()
+        httpretty.enable()
+        stub_request("http://localhost:8080/pdb/cmd/v1", method=httpretty.POST)
+        payload = {"certname": "node1", "values": {f"fact{i}": i for i in range(200)}}
+        api._cmd("replace facts", payload)
+        last_request = httpretty.last_request()
+        assert last_request.headers["Content-Encoding"] == "gzip"
+        body = gzip.decompress(last_request.body)
+        assert json.loads(body) == payload
+        assert last_request.querystring["checksum"] == [hashlib.sha1(body).hexdigest()]
+
+        # small bodies aren't worth it
+        api._cmd("deactivate node", {"certname": "node1"})
+        assert "Content-Encoding" not in httpretty.last_request().headers
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_cmd_encoded(self, api):
+        httpretty.reset()
+        httpretty.enable()
+        stub_request("http://localhost:8080/pdb/cmd/v1", method=httpretty.POST)
+        encoded = EncodedCommand("deactivate node", {"certname": "node1"})
+        api._cmd("deactivate node", encoded)
+        api._cmd("deactivate node", encoded)
+        requests = httpretty.latest_requests()[-2:]
+        assert requests[0].body == requests[1].body == encoded.body
+        assert requests[0].querystring["checksum"] == [encoded.checksum]
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_encoded_bad_command(self):
+        with pytest.raises(pypuppetdb.errors.APIError):
+            EncodedCommand("incorrect command", {"certname": "node1"})
+
+    def test_submit_many(self, api):
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.POST,
+            "http://localhost:8080/pdb/cmd/v1",
+            body=json.dumps({"uuid": "d0b6a5a0-1c1e-4a5c-9f49-2f8a3e3e6c1a"}),
+        )
+        commands = (("deactivate node", {"certname": f"node{i}"}) for i in range(10))
+        seen = []
+        stats = api.submit_many(commands, concurrency=3, callback=seen.append)
+        assert stats.submitted == 10
+        assert stats.succeeded == 10
+        assert stats.failed == 0
+        assert stats.rate > 0
+        assert [r.certname for r in stats.results] == [f"node{i}" for i in range(10)]
+        assert stats.results[0].response["uuid"].startswith("d0b6")
+        assert len(seen) == 10
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_submit_many_failures(self, api):
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.POST,
+            "http://localhost:8080/pdb/cmd/v1",
+            body=json.dumps({"uuid": "1"}),
+        )
+        commands = [
+            ("deactivate node", {"certname": "node1"}),
+            ("incorrect command", {"certname": "node2"}),
+            ("deactivate node", {"certname": "node3"}),
+        ]
+        stats = api.submit_many(commands, concurrency=2)
+        assert stats.succeeded == 2
+        assert stats.failed == 1
+        assert not stats.results[1].ok
+        assert isinstance(stats.results[1].error, pypuppetdb.errors.APIError)
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_submit_many_backpressure(self, api):
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.POST,
+            "http://localhost:8080/pdb/cmd/v1",
+            body=json.dumps({"uuid": "1"}),
+        )
+        taken = []
+        finished = []
+
+        def commands():
+            for i in range(6):
+                # never more than `concurrency` commands are taken ahead
+                assert len(taken) - len(finished) <= 2
+                taken.append(i)
+                yield "deactivate node", {"certname": f"node{i}"}
+
+        stats = api.submit_many(commands(), concurrency=2, callback=finished.append)
+        assert stats.submitted == 6
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_submit_many_pool(self, api):
+        api.add_request_hook(lambda event: None)
+        url = "http://localhost:8080/pdb/cmd/v1"
+        adapters = []
+
+        def respond(request, uri, headers):
+            adapters.append(api.session.get_adapter(url))
+            return [200, headers, json.dumps({"uuid": "1"})]
+
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(httpretty.POST, url, body=respond)
+        original = api.session.get_adapter(url)
+        commands = [("deactivate node", {"certname": f"node{i}"}) for i in range(3)]
+        stats = api.submit_many(commands, concurrency=20)
+        assert stats.succeeded == 3
+        # sized to the concurrency, still timing connections
+        assert isinstance(adapters[0], TimingAdapter)
+        assert adapters[0]._pool_maxsize == 20
+        # and the session is left as it was
+        assert api.session.get_adapter(url) is original
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_submit_many_bad_concurrency(self, api):
+        with pytest.raises(ValueError):
+            api.submit_many([], concurrency=0)
+
 
 class TestStatusAPI:
     def test_status(self, api):
@@ -1,7 +1,10 @@
 import json
 
 import httpretty
+import pytest
 
+from pypuppetdb.QueryBuilder import EqualsOperator, FromOperator
+from pypuppetdb.errors import PqlSyntaxError
 from pypuppetdb.types import Node, Inventory, Fact
 
 
@@ -132,3 +135,34 @@ class TestPqlAPI:
         type = api._get_type_from_query(pql)
 
         assert type is None
+
+    def test_pql_from_operator(self, api):
+        fr = FromOperator("nodes")
+        fr.add_query(EqualsOperator("certname", "foo.example.com"))
+        pql_url = "http://localhost:8080/pdb/query/v4"
+
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, pql_url, body="[]")
+
+        list(api.pql(fr))
+
+        assert httpretty.last_request().querystring["query"] == [
+            'nodes { certname = "foo.example.com" }'
+        ]
+
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_pql_validate(self, api):
+        httpretty.enable()
+
+        with pytest.raises(PqlSyntaxError):
+            list(api.pql("nodes { certname = }", validate=True))
+
+        assert len(httpretty.latest_requests()) == 0
+
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_get_type_from_query_invalid(self, api):
+        assert api._get_type_from_query("nodes { certname = }") == Node
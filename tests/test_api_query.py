@@ -4,6 +4,8 @@ import httpretty
 import pytest
 
 import pypuppetdb
+from pypuppetdb.QueryBuilder import AndOperator, EqualsOperator, InOperator
+from pypuppetdb.cache import ImmutableCache
 
 
 def stub_request(url, data=None, method=httpretty.GET, status=200, **kwargs):
@@ -123,3 +125,356 @@ class TestQueryAPI:
 
         httpretty.disable()
         httpretty.reset()
+
+    def test_fact_matrix_inventory(self, api):
+        body = [
+            {"certname": "node1", "facts.os.family": "Debian", "facts.memory": 2},
+            {"certname": "node2", "facts.os.family": "RedHat"},
+            {"certname": "node3", "facts.os.family": "Debian", "facts.memory": 4},
+        ]
+        url = "http://localhost:8080/pdb/query/v4/inventory"
+
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, url, body=json.dumps(body))
+
+        matrix = api.fact_matrix(
+            ["os.family", "memory"],
+            query=pypuppetdb.QueryBuilder.EqualsOperator("environment", "prod"),
+        )
+
+        assert json.loads(httpretty.last_request().querystring["query"][0]) == [
+            "extract",
+            ["certname", "facts.os.family", "facts.memory"],
+            ["=", "environment", "prod"],
+        ]
+        assert matrix.certnames == ["node1", "node2", "node3"]
+        assert matrix.column("os.family") == ["Debian", "RedHat", "Debian"]
+        assert list(matrix.columns["os.family"].codes) == [0, 1, 0]
+        assert matrix.column("memory") == [2, None, 4]
+
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_fact_matrix_fact_contents(self, api):
+        body = [
+            {"certname": "node1", "path": ["os", "family"], "value": "Debian"},
+            {"certname": "node2", "path": ["os", "family"], "value": "RedHat"},
+            {"certname": "node2", "path": ["disks", 0], "value": "sda"},
+        ]
+        url = "http://localhost:8080/pdb/query/v4/fact-contents"
+
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, url, body=json.dumps(body))
+
+        matrix = api.fact_matrix(["os.family", "disks.0"], endpoint="fact-contents")
+
+        assert json.loads(httpretty.last_request().querystring["query"][0]) == [
+            "extract",
+            ["certname", "path", "value"],
+            ["or", ["=", "path", ["os", "family"]], ["=", "path", ["disks", 0]]],
+        ]
+        assert matrix.column("os.family") == ["Debian", "RedHat"]
+        assert matrix.column("disks.0") == [None, "sda"]
+
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_fact_matrix_paged(self, api):
+        pages = [
+            [{"certname": "node1", "facts.kernel": "Linux"}],
+            [],
+        ]
+        url = "http://localhost:8080/pdb/query/v4/inventory"
+
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.GET,
+            url,
+            responses=[httpretty.Response(body=json.dumps(p)) for p in pages],
+        )
+
+        matrix = api.fact_matrix(["kernel"], page_size=1)
+
+        assert matrix.column("kernel") == ["Linux"]
+        querystring = httpretty.last_request().querystring
+        assert querystring["limit"] == ["1"]
+        assert querystring["offset"] == ["1"]
+
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_fact_matrix_fact_contents_paged(self, api):
+        rows = [
+            {"certname": "node1", "path": ["kernel"], "value": "Linux"},
+            {"certname": "node2", "path": ["kernel"], "value": "Linux"},
+        ]
+        url = "http://localhost:8080/pdb/query/v4/fact-contents"
+
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.GET,
+            url,
+            responses=[httpretty.Response(body=json.dumps(rows))],
+        )
+
+        matrix = api.fact_matrix(
+            ["kernel"], endpoint="fact-contents", page_size=2, limit=1
+        )
+
+        assert matrix.certnames == ["node1"]
+        querystring = httpretty.last_request().querystring
+        assert querystring["limit"] == ["2"]
+        assert json.loads(querystring["order_by"][0]) == [
+            {"field": "certname", "order": "asc"},
+            {"field": "path", "order": "asc"},
+        ]
+
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_fact_matrix_bad_endpoint(self, api):
+        with pytest.raises(pypuppetdb.errors.APIError):
+            api.fact_matrix(["kernel"], endpoint="nodes")
+
+    def test_report_events_cached(self):
+        api = pypuppetdb.api.API(object_cache=ImmutableCache())
+        body = [
+            {
+                "certname": "node1",
+                "status": "success",
+                "timestamp": "2017-06-05T20:18:23.374Z",
+                "report": "abc",
+                "resource_title": "sshd",
+                "property": "ensure",
+                "message": "started",
+                "new_value": "running",
+                "old_value": "stopped",
+                "resource_type": "Service",
+                "containing_class": "Ssh",
+                "containment_path": ["Ssh"],
+                "file": None,
+                "line": None,
+            }
+        ]
+        url = "http://localhost:8080/pdb/query/v4/events"
+
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, url, body=json.dumps(body))
+
+        first = list(api.report_events("abc"))
+        second = list(api.report_events("abc"))
+
+        assert len(httpretty.latest_requests()) == 1
+        assert str(first[0]) == str(second[0]) == "Service[sshd]/abc"
+
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_report_events_empty_cached(self):
+        api = pypuppetdb.api.API(object_cache=ImmutableCache())
+        base = "http://localhost:8080/pdb/query/v4"
+        reports = []
+
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, f"{base}/events", body="[]")
+        httpretty.register_uri(
+            httpretty.GET,
+            f"{base}/reports",
+            body=lambda request, uri, headers: [200, headers, json.dumps(reports)],
+        )
+
+        # the report isn't stored yet, so its events may still turn up
+        assert list(api.report_events("abc")) == []
+        reports.append({"hash": "abc"})
+        assert list(api.report_events("abc")) == []
+        assert list(api.report_events("abc")) == []
+        paths = [r.path.split("?")[0] for r in httpretty.latest_requests()]
+        assert paths.count("/pdb/query/v4/events") == 2
+        assert paths.count("/pdb/query/v4/reports") == 2
+
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_catalog_cached(self):
+        api = pypuppetdb.api.API(object_cache=ImmutableCache())
+        catalog = {
+            "certname": "node1",
+            "version": "1",
+            "transaction_uuid": "t",
+            "environment": "production",
+            "catalog_uuid": "uuid1",
+            "resources": {"data": []},
+            "edges": {"data": []},
+        }
+        url = "http://localhost:8080/pdb/query/v4/catalogs"
+
+        def respond(request, uri, headers):
+            if request.querystring["query"][0].startswith('["extract"'):
+                return [200, headers, json.dumps([{"catalog_uuid": "uuid1"}])]
+            return [200, headers, json.dumps([catalog])]
+
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, url, body=respond)
+
+        assert api.catalog("node1").catalog_uuid == "uuid1"
+        assert api.catalog("node1").catalog_uuid == "uuid1"
+        # two small uuid lookups and only one full catalog fetch
+        assert len(httpretty.latest_requests()) == 3
+
+        httpretty.disable()
+        httpretty.reset()
+
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_split_in_query(self, workers):
+        api = pypuppetdb.api.API(max_in_values=2, query_workers=workers)
+        url = "http://localhost:8080/pdb/query/v4/nodes"
+
+        def respond(request, uri, headers):
+            query = json.loads(request.querystring["query"][0])
+            certnames = query[2][2][1]
+            assert len(certnames) <= 2
+            headers["X-Records"] = str(len(certnames))
+            body = [
+                {"certname": c, "report_timestamp": None}
+                for c in sorted(certnames, reverse=True)
+            ]
+            return [200, headers, json.dumps(body)]
+
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, url, body=respond)
+
+        certnames = InOperator("certname")
+        certnames.add_array(["n3", "n1", "n5", "n2", "n4", "n1"])
+        query = AndOperator()
+        query.add(EqualsOperator("deactivated", None))
+        query.add(certnames)
+        order_by = json.dumps([{"field": "certname", "order": "desc"}])
+
+        nodes = api._query("nodes", query=query, order_by=order_by, include_total=True)
+        assert [n["certname"] for n in nodes] == ["n5", "n4", "n3", "n2", "n1"]
+        assert len(httpretty.latest_requests()) == 3
+        assert api.total == 5
+
+        nodes = api._query("nodes", query=query, order_by=order_by, limit=2, offset=1)
+        assert [n["certname"] for n in nodes] == ["n4", "n3"]
+        for request in httpretty.latest_requests()[-3:]:
+            assert request.querystring["limit"] == ["3"]
+            assert "offset" not in request.querystring
+
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_split_in_query_merges_order(self):
+        api = pypuppetdb.api.API(max_in_values=2)
+        url = "http://localhost:8080/pdb/query/v4/nodes"
+        environments = {"n1": "b", "n2": "a", "n3": "b", "n4": None}
+
+        def respond(request, uri, headers):
+            query = json.loads(request.querystring["query"][0])
+            body = [
+                {"certname": c, "catalog_environment": environments[c]}
+                for c in query[2][1]
+            ]
+            body.sort(key=lambda n: n["certname"], reverse=True)
+            body.sort(
+                key=lambda n: (
+                    n["catalog_environment"] is None,
+                    n["catalog_environment"],
+                )
+            )
+            return [200, headers, json.dumps(body)]
+
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, url, body=respond)
+
+        certnames = InOperator("certname")
+        certnames.add_array(["n1", "n2", "n3", "n4"])
+        order_by = json.dumps(
+            [
+                {"field": "catalog_environment"},
+                {"field": "certname", "order": "desc"},
+            ]
+        )
+
+        nodes = api._query("nodes", query=certnames, order_by=order_by)
+        assert isinstance(nodes, list)
+        assert [n["certname"] for n in nodes] == ["n2", "n3", "n1", "n4"]
+
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_split_in_query_unmergeable(self):
+        api = pypuppetdb.api.API(max_in_values=2, query_workers=1)
+        url = "http://localhost:8080/pdb/query/v4/facts"
+        values = {"n1": 1, "n2": "a", "n3": 2, "n4": "b"}
+
+        def respond(request, uri, headers):
+            query = json.loads(request.querystring["query"][0])
+            body = [{"certname": c, "value": values[c]} for c in query[2][1]]
+            body.sort(key=lambda f: (isinstance(f["value"], str), f["value"]))
+            return [200, headers, json.dumps(body)]
+
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, url, body=respond)
+
+        certnames = InOperator("certname")
+        certnames.add_array(["n1", "n2", "n3", "n4"])
+        order_by = json.dumps([{"field": "value"}])
+
+        facts = api._query("facts", query=certnames, order_by=order_by)
+        assert [f["certname"] for f in facts] == ["n1", "n3", "n2", "n4"]
+        # the two split queries, then the original one
+        requests = httpretty.latest_requests()
+        assert len(requests) == 3
+        assert json.loads(requests[-1].querystring["query"][0])[2] == [
+            "array",
+            ["n1", "n2", "n3", "n4"],
+        ]
+
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_split_in_query_stream(self):
+        api = pypuppetdb.api.API(max_in_values=2, query_workers=1)
+        url = "http://localhost:8080/pdb/query/v4/nodes"
+
+        def respond(request, uri, headers):
+            query = json.loads(request.querystring["query"][0])
+            body = [{"certname": c} for c in query[2][1]]
+            return [200, headers, json.dumps(body)]
+
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, url, body=respond)
+
+        certnames = InOperator("certname")
+        certnames.add_array(["n1", "n2", "n3", "n4"])
+
+        nodes = api._query("nodes", query=certnames, stream=True)
+        assert len(httpretty.latest_requests()) == 0
+        assert next(nodes)["certname"] == "n1"
+        # only the first chunk has been fetched
+        assert len(httpretty.latest_requests()) == 1
+        assert [n["certname"] for n in nodes] == ["n2", "n3", "n4"]
+
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_split_in_query_disabled(self):
+        api = pypuppetdb.api.API(max_in_values=None)
+        url = "http://localhost:8080/pdb/query/v4/nodes"
+
+        httpretty.enable()
+        stub_request(url)
+
+        certnames = InOperator("certname")
+        certnames.add_array(["n{}".format(i) for i in range(2000)])
+        api._query("nodes", query=certnames)
+        assert len(httpretty.latest_requests()) == 1
+
+        httpretty.disable()
+        httpretty.reset()
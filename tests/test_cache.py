@@ -0,0 +1,202 @@
+import multiprocessing
+import os
+import time
+
+import httpretty
+
+import pypuppetdb
+from pypuppetdb.cache import ImmutableCache, ResponseCache
+
+
+class TestImmutableCache:
+    def test_get_set(self):
+        cache = ImmutableCache()
+        assert cache.get("report/abc") is None
+        cache.set("report/abc", {"hash": "abc"})
+        assert "report/abc" in cache
+        assert cache.get("report/abc") == {"hash": "abc"}
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_returns_copies(self):
+        cache = ImmutableCache()
+        cache.set("events/abc", [{"status": "success"}])
+        cache.get("events/abc")[0]["status"] = "failure"
+        assert cache.get("events/abc") == [{"status": "success"}]
+
+    def test_get_or_set(self):
+        cache = ImmutableCache()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            return [1, 2]
+
+        assert cache.get_or_set("key", fetch) == [1, 2]
+        assert cache.get_or_set("key", fetch) == [1, 2]
+        assert len(calls) == 1
+
+    def test_get_or_set_empty(self):
+        cache = ImmutableCache()
+        results = [[], [1]]
+        assert cache.get_or_set("key", lambda: results.pop(0)) == []
+        # not stored yet the first time, so asked again
+        assert cache.get_or_set("key", lambda: results.pop(0)) == [1]
+        assert cache.get_or_set("key", lambda: results.pop(0)) == [1]
+
+    def test_get_or_set_empty_final(self):
+        cache = ImmutableCache()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            return []
+
+        assert cache.get_or_set("key", fetch, lambda: True) == []
+        assert cache.get_or_set("key", fetch, lambda: True) == []
+        assert len(calls) == 1
+
+    def test_lru_eviction(self):
+        cache = ImmutableCache(max_bytes=20)
+        cache.set("a", "x" * 5)
+        cache.set("b", "y" * 5)
+        cache.get("a")
+        cache.set("c", "z" * 5)
+        assert cache.size <= 20
+        assert "a" in cache
+        assert "b" not in cache
+        assert "c" in cache
+
+    def test_spill(self, tmpdir):
+        cache = ImmutableCache(max_bytes=20, spill_dir=str(tmpdir))
+        cache.set("a", "x" * 10)
+        cache.set("b", "y" * 10)
+        assert len(os.listdir(str(tmpdir))) == 1
+        assert len(cache) == 2
+        assert cache.get("a") == "x" * 10
+        assert cache.get("b") == "y" * 10
+
+    def test_spill_survives_restart(self, tmpdir):
+        cache = ImmutableCache(spill_dir=str(tmpdir))
+        cache.set("a", [1])
+        cache.flush()
+        assert cache.size == 0
+
+        cache = ImmutableCache(spill_dir=str(tmpdir))
+        assert cache.get("a") == [1]
+
+    def test_spill_bounded(self, tmpdir):
+        cache = ImmutableCache(max_bytes=1, spill_dir=str(tmpdir), spill_max_bytes=30)
+        for key in "abcde":
+            cache.set(key, "x" * 10)
+        assert cache.spill_size <= 30
+        assert "a" not in cache
+        assert "e" in cache
+
+    def test_clear(self, tmpdir):
+        cache = ImmutableCache(max_bytes=1, spill_dir=str(tmpdir))
+        cache.set("a", "x" * 10)
+        cache.set("b", 1)
+        cache.clear()
+        assert len(cache) == 0
+        assert os.listdir(str(tmpdir)) == []
+
+
+def _fill(path, start):
+    cache = ResponseCache(path)
+    for i in range(start, start + 50):
+        cache.set(f"key{i}", {"value": i})
+
+
+class TestResponseCache:
+    def test_get_set(self, tmpdir):
+        cache = ResponseCache(str(tmpdir.join("cache.db")))
+        assert cache.get("a") is None
+        cache.set("a", [{"certname": "node1"}])
+        assert cache.get("a") == [{"certname": "node1"}]
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_ttl(self, tmpdir):
+        cache = ResponseCache(
+            str(tmpdir.join("cache.db")), ttls={"nodes": 0, "fact-names": None}
+        )
+        cache.set("a", 1, ttl=0.05)
+        assert cache.get("a") == 1
+        time.sleep(0.1)
+        assert cache.get("a") is None
+        assert cache.ttl_for("nodes") == 0
+        assert cache.ttl_for("fact-names") == 300
+        # only the endpoints in ttls are cached
+        assert cache.ttl_for("facts") == 0
+
+    def test_eviction(self, tmpdir):
+        cache = ResponseCache(str(tmpdir.join("cache.db")), max_bytes=30)
+        cache.set("a", "x" * 10)
+        # a replaced response only counts once
+        cache.set("a", "x" * 10)
+        cache.set("b", "x" * 10)
+        assert cache.get("a") is not None
+        cache.set("c", "x" * 10)
+        # the oldest response goes first, reading it doesn't keep it
+        assert cache.get("a") is None
+        assert cache.get("b") is not None
+        assert cache.get("c") is not None
+        # too big to cache at all
+        cache.set("d", "x" * 100)
+        assert cache.get("d") is None
+        cache.clear()
+        cache.set("e", "x" * 10)
+        cache.set("f", "x" * 10)
+        assert cache.get("e") is not None
+
+    def test_shared_between_processes(self, tmpdir):
+        path = str(tmpdir.join("cache.db"))
+        cache = ResponseCache(path)
+        processes = [
+            multiprocessing.Process(target=_fill, args=(path, start))
+            for start in (0, 50, 100)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            assert process.exitcode == 0
+
+        assert [cache.get(f"key{i}") for i in range(150)] == [
+            {"value": i} for i in range(150)
+        ]
+
+    def test_api(self, tmpdir):
+        ttls = {"environments": 60}
+        cache = ResponseCache(str(tmpdir.join("cache.db")), ttls=ttls)
+        api = pypuppetdb.api.API(response_cache=cache)
+        url = "http://localhost:8080/pdb/query/v4/environments"
+
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, url, body='[{"name": "production"}]')
+        httpretty.register_uri(
+            httpretty.GET, "http://localhost:8080/pdb/query/v4/nodes", body="[]"
+        )
+        requests = len(httpretty.latest_requests())
+
+        assert api.environments() == [{"name": "production"}]
+        # a new process (or API) with the same cache gets a warm answer
+        other = pypuppetdb.api.API(response_cache=ResponseCache(cache.path, ttls=ttls))
+        assert other.environments() == [{"name": "production"}]
+        assert len(httpretty.latest_requests()) == requests + 1
+
+        api.environments(include_total=True)
+        assert len(httpretty.latest_requests()) == requests + 2
+
+        api._query("environments", cache=False)
+        assert len(httpretty.latest_requests()) == requests + 3
+
+        # endpoints that aren't in ttls are never cached
+        api._query("nodes")
+        api._query("nodes")
+        assert len(httpretty.latest_requests()) == requests + 5
+
+        httpretty.disable()
+        httpretty.reset()
@@ -0,0 +1,168 @@
+import copy
+
+import pytest
+
+from pypuppetdb.diff import (
+    CatalogFingerprint,
+    diff_catalogs,
+    diff_many,
+    fingerprint,
+)
+from pypuppetdb.types import Catalog
+
+
+@pytest.fixture
+def catalog_dict():
+    return {
+        "certname": "node1",
+        "version": "1",
+        "transaction_uuid": "abc",
+        "environment": "production",
+        "code_id": "code1",
+        "resources": {
+            "data": [
+                {
+                    "type": "Package",
+                    "title": "openssh-server",
+                    "tags": ["ssh", "package"],
+                    "exported": False,
+                    "file": "/etc/puppetlabs/code/ssh.pp",
+                    "line": 1,
+                    "parameters": {"ensure": "installed"},
+                },
+                {
+                    "type": "File",
+                    "title": "/etc/ssh/sshd_config",
+                    "tags": ["ssh", "file"],
+                    "exported": False,
+                    "parameters": {"mode": "0600", "owner": "root"},
+                },
+            ]
+        },
+        "edges": {
+            "data": [
+                {
+                    "source_type": "Package",
+                    "source_title": "openssh-server",
+                    "target_type": "File",
+                    "target_title": "/etc/ssh/sshd_config",
+                    "relationship": "before",
+                }
+            ]
+        },
+    }
+
+
+class TestFingerprint:
+    def test_key_order(self):
+        assert fingerprint({"a": 1, "b": 2}) == fingerprint({"b": 2, "a": 1})
+        assert fingerprint({"a": 1}) != fingerprint({"a": 2})
+
+    def test_ignores_source_location(self, catalog_dict):
+        other = copy.deepcopy(catalog_dict)
+        other["resources"]["data"][0]["line"] = 42
+        other["resources"]["data"][0]["tags"] = ["package", "ssh"]
+        old = CatalogFingerprint(Catalog.create_from_dict(catalog_dict))
+        new = CatalogFingerprint(Catalog.create_from_dict(other))
+        assert old.digest == new.digest
+
+    def test_cached(self, catalog_dict):
+        catalog = Catalog.create_from_dict(catalog_dict)
+        fp = CatalogFingerprint.of(catalog)
+        assert CatalogFingerprint.of(catalog) is fp
+        assert CatalogFingerprint.of(fp) is fp
+
+
+class TestDiffCatalogs:
+    def test_identical(self, catalog_dict):
+        diff = diff_catalogs(
+            Catalog.create_from_dict(catalog_dict),
+            Catalog.create_from_dict(catalog_dict),
+        )
+        assert not diff
+        assert repr(diff) == "<CatalogDiff: node1 -> node1 (+0 -0 ~0)>"
+
+    def test_changes(self, catalog_dict):
+        other = copy.deepcopy(catalog_dict)
+        other["certname"] = "node2"
+        resources = other["resources"]["data"]
+        resources[1]["parameters"] = {"mode": "0644", "group": "root"}
+        resources[1]["exported"] = True
+        resources.pop(0)
+        resources.append(
+            {
+                "type": "Service",
+                "title": "sshd",
+                "tags": [],
+                "exported": False,
+                "parameters": {},
+            }
+        )
+        other["edges"]["data"] = [
+            {
+                "source_type": "File",
+                "source_title": "/etc/ssh/sshd_config",
+                "target_type": "Service",
+                "target_title": "sshd",
+                "relationship": "notifies",
+            }
+        ]
+
+        diff = diff_catalogs(
+            Catalog.create_from_dict(catalog_dict), Catalog.create_from_dict(other)
+        )
+        assert diff
+        assert diff.old == "node1"
+        assert diff.new == "node2"
+        assert diff.added_resources == ["Service[sshd]"]
+        assert diff.removed_resources == ["Package[openssh-server]"]
+        assert diff.changed_resources == {
+            "File[/etc/ssh/sshd_config]": {
+                "parameters": {
+                    "mode": ("0600", "0644"),
+                    "owner": ("root", None),
+                    "group": (None, "root"),
+                },
+                "exported": (False, True),
+            }
+        }
+        assert diff.added_edges == [
+            ("File[/etc/ssh/sshd_config]", "notifies", "Service[sshd]")
+        ]
+        assert diff.removed_edges == [
+            ("Package[openssh-server]", "before", "File[/etc/ssh/sshd_config]")
+        ]
+        assert diff.to_dict()["added_resources"] == ["Service[sshd]"]
+
+
+class TestDiffMany:
+    def test_in_process(self, catalog_dict):
+        other = copy.deepcopy(catalog_dict)
+        other["resources"]["data"][1]["parameters"]["mode"] = "0644"
+        diffs = list(
+            diff_many([(catalog_dict, catalog_dict), (catalog_dict, other)], 1)
+        )
+        assert [bool(d) for d in diffs] == [False, True]
+
+    def test_processes(self, catalog_dict):
+        other = copy.deepcopy(catalog_dict)
+        other["resources"]["data"][1]["parameters"]["mode"] = "0644"
+        pairs = [(catalog_dict, catalog_dict), (catalog_dict, other)] * 4
+        diffs = list(diff_many(pairs, max_workers=2, chunksize=2))
+        assert [bool(d) for d in diffs] == [False, True] * 4
+
+    def test_processes_lazy(self, catalog_dict):
+        other = copy.deepcopy(catalog_dict)
+        other["resources"]["data"][1]["parameters"]["mode"] = "0644"
+        taken = []
+
+        def pairs():
+            for i in range(20):
+                taken.append(i)
+                yield (catalog_dict, other if i % 2 else catalog_dict)
+
+        diffs = diff_many(pairs(), max_workers=2, chunksize=2)
+        assert not next(diffs)
+        # at most two chunks per worker were read ahead
+        assert len(taken) <= 8
+        assert [bool(d) for d in diffs] == [True] + [False, True] * 9
@@ -0,0 +1,138 @@
+import timeit
+
+import pytest
+
+from pypuppetdb.QueryBuilder import (
+    AndOperator,
+    EqualsOperator,
+    ExtractOperator,
+    GreaterOperator,
+    InOperator,
+    LessEqualOperator,
+    NotOperator,
+    NullOperator,
+    OrOperator,
+    RegexArrayOperator,
+    RegexOperator,
+)
+from pypuppetdb.errors import APIError
+from pypuppetdb.evaluator import compile_query, filter_rows
+
+
+@pytest.fixture
+def rows():
+    return [
+        {
+            "certname": "web01.example.com",
+            "environment": "production",
+            "deactivated": None,
+            "facts": {"os": {"family": "Debian"}, "processors": {"count": 4}},
+            "path": ["networking", "eth0", "macaddress"],
+            "uptime": 100,
+            "virtual": True,
+        },
+        {
+            "certname": "db01.example.com",
+            "environment": "staging",
+            "deactivated": "2016-06-01T00:00:00.000Z",
+            "facts": {"os": {"family": "RedHat"}, "disks": ["sda", "sdb"]},
+            "path": ["networking", "lo"],
+            "uptime": 1,
+            "virtual": 1,
+        },
+        {"certname": "odd", "facts.os.family": "Debian", "uptime": "n/a"},
+    ]
+
+
+def certnames(query, rows):
+    return [row["certname"] for row in filter_rows(query, rows)]
+
+
+class TestEvaluator:
+    def test_equals(self, rows):
+        assert certnames(EqualsOperator("environment", "staging"), rows) == [
+            "db01.example.com"
+        ]
+        assert certnames(EqualsOperator("virtual", True), rows) == ["web01.example.com"]
+        assert certnames(EqualsOperator("virtual", 1), rows) == ["db01.example.com"]
+
+    def test_dotted_paths(self, rows):
+        assert certnames(EqualsOperator("facts.os.family", "Debian"), rows) == [
+            "web01.example.com",
+            "odd",
+        ]
+        assert certnames(EqualsOperator("facts.disks.1", "sdb"), rows) == [
+            "db01.example.com"
+        ]
+        assert certnames(GreaterOperator("facts.processors.count", 2), rows) == [
+            "web01.example.com"
+        ]
+
+    def test_comparisons(self, rows):
+        assert certnames(GreaterOperator("uptime", 10), rows) == ["web01.example.com"]
+        assert certnames(LessEqualOperator("uptime", 1), rows) == ["db01.example.com"]
+
+    def test_regex(self, rows):
+        assert certnames(RegexOperator("certname", r"^web\d+"), rows) == [
+            "web01.example.com"
+        ]
+        assert certnames(
+            RegexArrayOperator("path", ["net.*", "eth.*", "mac"]), rows
+        ) == ["web01.example.com"]
+
+    def test_null(self, rows):
+        assert certnames(NullOperator("deactivated", True), rows) == [
+            "web01.example.com",
+            "odd",
+        ]
+        assert certnames(NullOperator("deactivated", False), rows) == [
+            "db01.example.com"
+        ]
+
+    def test_in(self, rows):
+        op = InOperator("certname")
+        op.add_array(["odd", "db01.example.com", "other"])
+        assert certnames(op, rows) == ["db01.example.com", "odd"]
+
+        query = '["in", "path", ["array", [["networking", "lo"]]]]'
+        assert certnames(query, rows) == ["db01.example.com"]
+
+    def test_boolean(self, rows):
+        op = AndOperator()
+        op.add(EqualsOperator("facts.os.family", "Debian"))
+        op.add(GreaterOperator("uptime", 10))
+        assert certnames(op, rows) == ["web01.example.com"]
+
+        op = OrOperator()
+        op.add(EqualsOperator("environment", "staging"))
+        op.add(EqualsOperator("certname", "odd"))
+        op.add(EqualsOperator("certname", "nope"))
+        assert certnames(op, rows) == ["db01.example.com", "odd"]
+
+        op = NotOperator()
+        op.add(EqualsOperator("environment", "staging"))
+        assert certnames(op, rows) == ["web01.example.com", "odd"]
+
+    def test_string_query(self, rows):
+        assert certnames('["=", "certname", "odd"]', rows) == ["odd"]
+
+    def test_unsupported(self):
+        ex = ExtractOperator()
+        ex.add_field("certname")
+        op = InOperator("certname")
+        op.add_query(ex)
+        with pytest.raises(APIError):
+            compile_query(op)
+        with pytest.raises(APIError):
+            compile_query('["bogus", "a", "b"]')
+        with pytest.raises(APIError):
+            compile_query("[]")
+
+    def test_fast(self, rows):
+        op = AndOperator()
+        op.add(RegexOperator("certname", r"^web\d+"))
+        op.add(EqualsOperator("facts.os.family", "Debian"))
+        predicate = compile_query(op)
+        row = rows[0]
+        # well below 100 microseconds per evaluation
+        assert timeit.timeit(lambda: predicate(row), number=10000) < 1
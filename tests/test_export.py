@@ -0,0 +1,203 @@
+import csv
+import gzip
+import json
+
+import httpretty
+import pytest
+
+from pypuppetdb.errors import APIError
+from pypuppetdb.evaluator import filter_rows
+from pypuppetdb.export import export, main
+
+NODES = [
+    {"certname": f"node{i}", "facts_environment": "production", "deactivated": None}
+    for i in range(1, 6)
+]
+
+RESOURCES = [
+    {
+        "certname": "node1",
+        "type": "Class",
+        "title": title,
+        "parameters": {"ensure": "present"},
+    }
+    for title in ("A", "B", "C")
+]
+
+
+class FakePuppetDB:
+    """Serves nodes and resources, filtering and paging them like
+    PuppetDB would."""
+
+    def __init__(self):
+        self.queries = []
+
+    def respond(self, rows):
+        def respond(request, uri, headers):
+            query = request.querystring.get("query", [None])[0]
+            self.queries.append(query)
+            fields = None
+            if query and json.loads(query)[0] == "extract":
+                _, fields, *where = json.loads(query)
+                query = json.dumps(where[0]) if where else None
+            result = list(filter_rows(query, rows)) if query else list(rows)
+            if fields is not None:
+                result = [{f: r[f] for f in fields} for r in result]
+            offset = int(request.querystring.get("offset", [0])[0])
+            end = offset + int(request.querystring["limit"][0])
+            return [200, headers, json.dumps(result[offset:end])]
+
+        return respond
+
+    def __enter__(self):
+        httpretty.enable()
+        for endpoint, rows in (("nodes", NODES), ("resources", RESOURCES)):
+            httpretty.register_uri(
+                httpretty.GET,
+                f"http://localhost:8080/pdb/query/v4/{endpoint}",
+                body=self.respond(rows),
+            )
+        return self
+
+    def __exit__(self, type, value, trace):
+        httpretty.disable()
+        httpretty.reset()
+
+
+def read_jsonl(path, opener=open):
+    with opener(path, "rt") as f:
+        return [json.loads(line) for line in f]
+
+
+class TestExport:
+    def test_jsonl(self, api, tmp_path):
+        path = str(tmp_path / "nodes.jsonl")
+        with FakePuppetDB():
+            assert export(api, path, endpoint="nodes", page_size=2) == 5
+            request = httpretty.last_request()
+        assert read_jsonl(path) == NODES
+        assert json.loads(request.querystring["order_by"][0]) == [
+            {"field": "certname", "order": "asc"}
+        ]
+
+    def test_csv(self, api, tmp_path):
+        path = str(tmp_path / "resources.csv")
+        with FakePuppetDB():
+            assert export(api, path, endpoint="resources") == 3
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        assert [r["title"] for r in rows] == ["A", "B", "C"]
+        assert json.loads(rows[0]["parameters"]) == {"ensure": "present"}
+
+    def test_gzip(self, api, tmp_path):
+        path = str(tmp_path / "nodes.jsonl.gz")
+        with FakePuppetDB():
+            export(api, path, endpoint="nodes")
+        assert read_jsonl(path, gzip.open) == NODES
+
+    def test_pql(self, api, tmp_path):
+        path = str(tmp_path / "nodes.jsonl")
+        with FakePuppetDB() as fake:
+            count = export(api, path, pql='nodes { certname ~ "node[12]" }')
+        assert count == 2
+        assert json.loads(fake.queries[0]) == ["~", "certname", "node[12]"]
+
+    def test_pql_with_paging(self, api, tmp_path):
+        with pytest.raises(APIError):
+            export(api, str(tmp_path / "x.jsonl"), pql="nodes { limit 10 }")
+
+    def test_no_endpoint(self, api, tmp_path):
+        with pytest.raises(APIError):
+            export(api, str(tmp_path / "x.jsonl"))
+
+    def test_file_object(self, api, tmp_path):
+        path = tmp_path / "nodes.jsonl"
+        with FakePuppetDB(), open(path, "w") as f:
+            export(api, f, endpoint="nodes")
+        assert read_jsonl(path) == NODES
+
+    def test_resume(self, api, tmp_path):
+        path = tmp_path / "nodes.jsonl"
+        # an interrupted export, with a partially written last line
+        path.write_text(json.dumps(NODES[0]) + "\n" + json.dumps(NODES[1])[:10])
+        with FakePuppetDB() as fake:
+            count = export(api, str(path), endpoint="nodes", resume=True)
+            request = httpretty.latest_requests()[0]
+        assert count == 4
+        assert read_jsonl(path) == NODES
+        assert fake.queries[0] is None
+        assert request.querystring["offset"] == ["1"]
+
+    def test_resume_csv(self, api, tmp_path):
+        path = str(tmp_path / "resources.csv")
+        with FakePuppetDB():
+            export(api, path, endpoint="resources")
+        with open(path) as f:
+            lines = f.readlines()
+        with open(path, "w") as f:
+            f.writelines(lines[:2])
+        with FakePuppetDB() as fake:
+            count = export(
+                api,
+                path,
+                endpoint="resources",
+                query='["=", "type", "Class"]',
+                resume=True,
+            )
+            request = httpretty.latest_requests()[0]
+        assert count == 2
+        with open(path, newline="") as f:
+            assert [r["title"] for r in csv.DictReader(f)] == ["A", "B", "C"]
+        assert json.loads(fake.queries[0]) == ["=", "type", "Class"]
+        assert request.querystring["offset"] == ["1"]
+
+    def test_unique_order(self, api, tmp_path):
+        path = str(tmp_path / "resources.jsonl")
+        with FakePuppetDB():
+            export(api, path, endpoint="resources", key=["title"])
+            request = httpretty.last_request()
+        assert json.loads(request.querystring["order_by"][0]) == [
+            {"field": "title", "order": "asc"},
+            {"field": "certname", "order": "asc"},
+            {"field": "type", "order": "asc"},
+        ]
+
+    def test_resume_extract(self, api, tmp_path):
+        path = tmp_path / "nodes.jsonl"
+        path.write_text(json.dumps({"certname": "node1"}) + "\n")
+        pql = 'nodes[certname] { facts_environment = "production" }'
+        with FakePuppetDB() as fake:
+            count = export(api, str(path), pql=pql, resume=True)
+        assert count == 4
+        assert json.loads(fake.queries[0]) == [
+            "extract",
+            ["certname"],
+            ["=", "facts_environment", "production"],
+        ]
+
+    def test_resume_missing_file(self, api, tmp_path):
+        path = str(tmp_path / "nodes.jsonl")
+        with FakePuppetDB():
+            assert export(api, path, endpoint="nodes", resume=True) == 5
+
+    def test_resume_without_key(self, api, tmp_path):
+        path = tmp_path / "fact-names.jsonl"
+        path.write_text("")
+        with pytest.raises(APIError):
+            export(api, str(path), endpoint="fact-names", resume=True)
+
+    def test_unsupported_format(self, api, tmp_path):
+        with pytest.raises(APIError):
+            export(api, str(tmp_path / "x"), endpoint="nodes", fmt="xml")
+
+
+class TestMain:
+    def test_main(self, tmp_path):
+        path = str(tmp_path / "nodes.jsonl")
+        with FakePuppetDB():
+            assert main(["--endpoint", "nodes", "-o", path, "--page-size", "2"]) == 0
+        assert read_jsonl(path) == NODES
+
+    def test_source_required(self):
+        with pytest.raises(SystemExit):
+            main([])
@@ -0,0 +1,195 @@
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import httpretty
+import pytest
+
+import pypuppetdb
+from pypuppetdb.errors import APIError, MetricReadError
+from pypuppetdb.exporter import Exporter, Histogram, RequestMetrics, metric_name
+
+DEPTH = "puppetlabs.puppetdb.mq:name=global.depth"
+PROCESSED = "puppetlabs.puppetdb.mq:name=global.processed"
+
+
+class FakeAPI:
+    """Answers the reads of the exporter, and counts them."""
+
+    def __init__(self, request_metrics=None):
+        self.request_metrics = request_metrics
+        self.reads = 0
+        self.fail = False
+
+    def metrics(self, mbeans):
+        self.reads += 1
+        if self.fail:
+            raise APIError
+        return {
+            DEPTH: MetricReadError("not found", mbean=DEPTH, status=404),
+            PROCESSED: {"Count": 42, "RateUnit": "events/second", "MeanRate": 1.5},
+        }
+
+    def status(self):
+        return {
+            "state": "running",
+            "status": {"queue_depth": 3, "read_db_up?": True, "write_db": {}},
+        }
+
+
+def lines(exporter):
+    return exporter.scrape().decode("utf-8").splitlines()
+
+
+class TestHistogram:
+    def test_buckets(self):
+        histogram = Histogram((0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+        assert histogram.render("h", (("a", "b"),)) == [
+            'h_bucket{a="b",le="0.1"} 2',
+            'h_bucket{a="b",le="1.0"} 3',
+            'h_bucket{a="b",le="+Inf"} 4',
+            'h_sum{a="b"} 3.65',
+            'h_count{a="b"} 4',
+        ]
+
+
+class TestRequestMetrics:
+    def test_observe(self):
+        metrics = RequestMetrics(buckets=(1,))
+        url = "http://localhost:8080/pdb/query/v4/nodes"
+        metrics.observe(url, "get", "success", 0.5)
+        metrics.observe(url, "GET", "error", 2)
+        rendered = metrics.render()
+        assert (
+            'pypuppetdb_request_duration_seconds_count{endpoint="nodes",method="GET"} 2'
+            in rendered
+        )
+        assert (
+            'pypuppetdb_requests_total{endpoint="nodes",method="GET",outcome="error"} 1'
+            in rendered
+        )
+
+    def test_observed_by_api(self):
+        metrics = RequestMetrics()
+        api = pypuppetdb.connect(request_metrics=metrics)
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.GET, "http://localhost:8080/pdb/query/v4/nodes", body="[]"
+        )
+        httpretty.register_uri(
+            httpretty.POST,
+            "http://localhost:8080/pdb/cmd/v1",
+            body="{}",
+            status=503,
+        )
+        try:
+            list(api.nodes())
+            with pytest.raises(Exception):
+                api.command("deactivate node", {"certname": "node1"})
+        finally:
+            httpretty.disable()
+            httpretty.reset()
+        assert metrics.requests == {
+            ("nodes", "GET", "success"): 1,
+            ("cmd", "POST", "error"): 1,
+        }
+        assert metrics.latency[("nodes", "GET")].count == 1
+
+
+class TestExporter:
+    def test_metric_name(self):
+        assert (
+            metric_name(PROCESSED, "MeanRate")
+            == "puppetdb_mq_name_global_processed_mean_rate"
+        )
+        assert metric_name("puppetdb_status", "read_db_up?") == (
+            "puppetdb_status_read_db_up"
+        )
+
+    def test_refresh(self):
+        metrics = RequestMetrics()
+        metrics.observe("http://localhost:8080/pdb/query/v4/nodes", "GET", "success", 1)
+        exporter = Exporter(FakeAPI(metrics), mbeans=[DEPTH, PROCESSED])
+        exporter.refresh()
+        rendered = lines(exporter)
+        assert "puppetdb_up 1" in rendered
+        assert "puppetdb_status_queue_depth 3" in rendered
+        assert "puppetdb_status_read_db_up 1" in rendered
+        assert "puppetdb_mq_name_global_processed_count 42" in rendered
+        assert "puppetdb_mq_name_global_processed_mean_rate 1.5" in rendered
+        # strings and unreadable mbeans are left out
+        assert not any("rate_unit" in line for line in rendered)
+        assert not any("global_depth" in line for line in rendered)
+        assert "# TYPE pypuppetdb_request_duration_seconds histogram" in rendered
+
+    def test_scrapes_are_cached(self):
+        api = FakeAPI()
+        exporter = Exporter(api, mbeans=[PROCESSED])
+        exporter.refresh()
+        for _ in range(5):
+            exporter.scrape()
+        assert api.reads == 1
+
+    def test_request_metrics_at_scrape(self):
+        metrics = RequestMetrics()
+        exporter = Exporter(FakeAPI(metrics), mbeans=[PROCESSED])
+        exporter.refresh()
+        metrics.observe("http://localhost:8080/pdb/query/v4/nodes", "GET", "success", 1)
+        rendered = lines(exporter)
+        assert (
+            'pypuppetdb_request_duration_seconds_count{endpoint="nodes",method="GET"} 1'
+            in rendered
+        )
+
+    def test_start_after_refresh(self):
+        api = FakeAPI()
+        exporter = Exporter(api, mbeans=[PROCESSED], interval=60)
+        exporter.refresh()
+        exporter.start()
+        time.sleep(0.05)
+        exporter.stop()
+        # the metrics were just read, so the worker waits for the interval
+        assert api.reads == 1
+
+    def test_refresh_errors(self):
+        api = FakeAPI()
+        api.fail = True
+        exporter = Exporter(api, mbeans=[PROCESSED])
+        exporter.refresh()
+        rendered = lines(exporter)
+        assert exporter.errors == 1
+        assert "pypuppetdb_exporter_errors_total 1" in rendered
+        assert "puppetdb_up 1" in rendered
+        assert not any("global_processed" in line for line in rendered)
+
+    def test_serve(self):
+        exporter = Exporter(FakeAPI(), mbeans=[PROCESSED], interval=60)
+        exporter.refresh()
+        server = exporter.server("127.0.0.1", 0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base = "http://127.0.0.1:{}".format(server.server_address[1])
+        try:
+            with urllib.request.urlopen(base + "/metrics") as response:
+                assert response.headers["Content-Type"].startswith("text/plain")
+                assert b"puppetdb_up 1" in response.read()
+            with pytest.raises(urllib.error.HTTPError):
+                urllib.request.urlopen(base + "/")
+        finally:
+            exporter.stop()
+        thread.join(5)
+
+    def test_background(self):
+        api = FakeAPI()
+        exporter = Exporter(api, mbeans=[PROCESSED], interval=0.01)
+        exporter.start()
+        deadline = time.monotonic() + 5
+        while api.reads < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        exporter.stop()
+        assert exporter.refreshes >= 3
+        assert b"puppetdb_up 1" in exporter.scrape()
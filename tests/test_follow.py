@@ -0,0 +1,166 @@
+import asyncio
+import json
+import threading
+
+import httpretty
+import pytest
+
+from pypuppetdb.QueryBuilder import EqualsOperator
+from pypuppetdb.errors import APIError
+from pypuppetdb.follow import Follower
+from pypuppetdb.types import Report
+
+
+class FakeAPI:
+    def __init__(self):
+        self.rows = []
+        self.queries = []
+
+    def _query(self, endpoint, query=None, order_by=None, cache=True):
+        assert cache is False
+        self.queries.append(query.json_data())
+        return list(self.rows)
+
+
+def factset(certname, timestamp):
+    return {
+        "certname": certname,
+        "hash": certname + timestamp,
+        "producer_timestamp": timestamp,
+    }
+
+
+class TestFollower:
+    def test_poll(self):
+        api = FakeAPI()
+        follower = Follower(
+            api,
+            "factsets",
+            query=EqualsOperator("environment", "production"),
+            since="2023-01-01T00:00:00.000Z",
+            overlap=10,
+        )
+
+        api.rows = [
+            factset("old", "2022-12-31T23:59:59.000Z"),
+            factset("a", "2023-01-01T00:00:01.000Z"),
+            factset("b", "2023-01-01T00:00:05.000Z"),
+        ]
+        assert [r["certname"] for r in follower.poll()] == ["a", "b"]
+        assert api.queries[-1] == [
+            "and",
+            [">=", "producer_timestamp", "2022-12-31T23:59:50.000Z"],
+            ["=", "environment", "production"],
+        ]
+
+        # a late arrival inside the overlap window is returned, the rest
+        # of the window is not returned again
+        api.rows.append(factset("late", "2023-01-01T00:00:03.000Z"))
+        assert [r["certname"] for r in follower.poll()] == ["late"]
+        assert api.queries[-1][1] == [
+            ">=",
+            "producer_timestamp",
+            "2022-12-31T23:59:55.000Z",
+        ]
+        assert follower.poll() == []
+
+    def test_adaptive_interval(self):
+        api = FakeAPI()
+        follower = Follower(
+            api,
+            "reports",
+            since="2023-01-01T00:00:00.000Z",
+            min_interval=1,
+            max_interval=5,
+        )
+        intervals = []
+        for _ in range(4):
+            follower.poll()
+            intervals.append(follower.interval)
+        assert intervals == [2, 4, 5, 5]
+
+        api.rows = [{"hash": "abc", "receive_time": "2023-01-01T00:00:01.000Z"}]
+        follower.poll()
+        assert follower.interval == 1
+
+    def test_seen_is_bounded(self):
+        api = FakeAPI()
+        follower = Follower(api, "reports", since="2023-01-01T00:00:00.000Z", overlap=1)
+        for second in range(1, 60):
+            api.rows = [
+                {
+                    "hash": str(second),
+                    "receive_time": f"2023-01-01T00:00:{second:02}.000Z",
+                }
+            ]
+            follower.poll()
+        assert len(follower._seen) <= 2
+
+    def test_bad_endpoint(self):
+        with pytest.raises(APIError):
+            Follower(FakeAPI(), "nodes")
+
+
+class TestQueryAPIFollow:
+    url = "http://localhost:8080/pdb/query/v4/factsets"
+
+    def register(self, rows):
+        def respond(request, uri, headers):
+            return [200, headers, json.dumps(rows)]
+
+        httpretty.register_uri(httpretty.GET, self.url, body=respond)
+
+    def test_follow_thread(self, api):
+        rows = [factset("a", "2023-01-01T00:00:01.000Z")]
+        stop = threading.Event()
+
+        httpretty.enable()
+        self.register(rows)
+        follow = api.follow(
+            "factsets", stop=stop, since="2023-01-01T00:00:00.000Z", min_interval=0
+        )
+        assert next(follow)["certname"] == "a"
+        rows.append(factset("b", "2023-01-01T00:00:02.000Z"))
+        assert next(follow)["certname"] == "b"
+        stop.set()
+        assert list(follow) == []
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_afollow(self, api):
+        rows = [factset("a", "2023-01-01T00:00:01.000Z")]
+
+        async def first_two():
+            results = []
+            async for factset_ in api.afollow(
+                "factsets", since="2023-01-01T00:00:00.000Z", min_interval=0
+            ):
+                results.append(factset_["certname"])
+                rows.append(factset("b", "2023-01-01T00:00:02.000Z"))
+                if len(results) == 2:
+                    return results
+
+        httpretty.enable()
+        self.register(rows)
+        assert asyncio.run(first_two()) == ["a", "b"]
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_followed_types(self, api):
+        report = {
+            "certname": "node1",
+            "hash": "abc",
+            "start_time": "2023-01-01T00:00:00.000Z",
+            "end_time": "2023-01-01T00:00:01.000Z",
+            "receive_time": "2023-01-01T00:00:02.000Z",
+            "configuration_version": "1",
+            "report_format": 10,
+            "puppet_version": "7.0.0",
+            "transaction_uuid": "t",
+            "environment": "production",
+            "status": "unchanged",
+            "metrics": {"data": []},
+            "logs": {"data": []},
+        }
+        assert isinstance(api._followed("reports", report), Report)
+        assert api._followed("factsets", {"a": 1}) == {"a": 1}
@@ -0,0 +1,149 @@
+import time
+
+import pytest
+
+from pypuppetdb.errors import APIError
+from pypuppetdb.graph import CatalogGraph
+from pypuppetdb.types import Catalog, Edge
+
+
+def make_resource(type_, title):
+    return {
+        "type": type_,
+        "title": title,
+        "tags": [],
+        "exported": False,
+        "parameters": {},
+    }
+
+
+def make_edge(source, target, relationship="before"):
+    source_type, source_title = source[:-1].split("[", 1)
+    target_type, target_title = target[:-1].split("[", 1)
+    return {
+        "source_type": source_type,
+        "source_title": source_title,
+        "target_type": target_type,
+        "target_title": target_title,
+        "relationship": relationship,
+    }
+
+
+@pytest.fixture
+def catalog():
+    resources = [
+        make_resource("Package", "openssh-server"),
+        make_resource("File", "/etc/ssh/sshd_config"),
+        make_resource("Service", "sshd"),
+        make_resource("File", "/etc/motd"),
+    ]
+    edges = [
+        make_edge("Package[openssh-server]", "File[/etc/ssh/sshd_config]"),
+        make_edge("File[/etc/ssh/sshd_config]", "Service[sshd]", "notifies"),
+    ]
+    return Catalog("node", edges, resources, "unique", None)
+
+
+class TestCatalogGraph:
+    def test_graph(self, catalog):
+        graph = catalog.get_graph()
+        assert len(graph) == 4
+        assert "Service[sshd]" in graph
+        assert repr(graph) == "<CatalogGraph: 4 resources, 2 edges>"
+        assert graph.successors("Package[openssh-server]") == [
+            "File[/etc/ssh/sshd_config]"
+        ]
+        assert graph.predecessors("Service[sshd]") == ["File[/etc/ssh/sshd_config]"]
+
+    def test_unknown_resource(self, catalog):
+        graph = catalog.get_graph()
+        with pytest.raises(APIError):
+            graph.descendants("File[/nope]")
+
+    def test_topological_order(self, catalog):
+        order = catalog.get_graph().topological_order()
+        assert order == [
+            "Package[openssh-server]",
+            "File[/etc/ssh/sshd_config]",
+            "Service[sshd]",
+            "File[/etc/motd]",
+        ]
+
+    def test_descendants_and_ancestors(self, catalog):
+        graph = catalog.get_graph()
+        assert sorted(graph.descendants("Package[openssh-server]")) == [
+            "File[/etc/ssh/sshd_config]",
+            "Service[sshd]",
+        ]
+        assert graph.descendants("File[/etc/motd]") == []
+        assert sorted(graph.ancestors("Service[sshd]")) == [
+            "File[/etc/ssh/sshd_config]",
+            "Package[openssh-server]",
+        ]
+        assert graph.reaches("Package[openssh-server]", "Service[sshd]")
+        assert not graph.reaches("Service[sshd]", "Package[openssh-server]")
+        assert not graph.reaches("Service[sshd]", "Service[sshd]")
+
+    def test_relationship_filter(self, catalog):
+        graph = catalog.get_graph(relationships=["notifies"])
+        assert graph.descendants("Package[openssh-server]") == []
+        assert graph.descendants("File[/etc/ssh/sshd_config]") == ["Service[sshd]"]
+
+    def test_cycles(self):
+        edges = [
+            Edge("A[a]", "B[b]", "before"),
+            Edge("B[b]", "C[c]", "before"),
+            Edge("C[c]", "A[a]", "before"),
+            Edge("C[c]", "D[d]", "before"),
+            Edge("E[e]", "E[e]", "before"),
+        ]
+        graph = CatalogGraph([], edges)
+        assert graph.has_cycles()
+        assert sorted(graph.cycles()) == [["A[a]", "B[b]", "C[c]"], ["E[e]"]]
+        assert sorted(graph.descendants("B[b]")) == ["A[a]", "B[b]", "C[c]", "D[d]"]
+        assert graph.reaches("A[a]", "A[a]")
+        assert graph.reaches("E[e]", "E[e]")
+        with pytest.raises(APIError):
+            graph.topological_order()
+
+    def test_no_cycles(self, catalog):
+        graph = catalog.get_graph()
+        assert graph.cycles() == []
+        assert not graph.has_cycles()
+
+    def test_subgraph(self, catalog):
+        graph = catalog.get_graph()
+        sub = graph.subgraph(["File[/etc/ssh/sshd_config]", "Service[sshd]"])
+        assert len(sub) == 2
+        assert len(sub.edges) == 1
+        assert sub.resources["Service[sshd]"] is graph.resources["Service[sshd]"]
+
+        impact = graph.impact_subgraph("File[/etc/ssh/sshd_config]")
+        assert impact.topological_order() == [
+            "File[/etc/ssh/sshd_config]",
+            "Service[sshd]",
+        ]
+
+    def test_large_graph(self):
+        # 20k resources in a long chain plus 40k shortcuts should be fine
+        count = 20000
+        nodes = [f"File[{i}]" for i in range(count)]
+        edges = [Edge(nodes[i], nodes[i + 1], "before") for i in range(count - 1)]
+        edges += [
+            Edge(nodes[i], nodes[(i * 7 + 3) % count], "before")
+            for i in range(count)
+            if (i * 7 + 3) % count > i
+        ]
+        edges += [
+            Edge(nodes[i], nodes[min(i + 50, count - 1)], "before")
+            for i in range(count - 1)
+        ]
+        graph = CatalogGraph(nodes, edges)
+
+        start = time.time()
+        assert len(graph.topological_order()) == count
+        assert graph.cycles() == []
+        assert len(graph.descendants(nodes[0])) == count - 1
+        assert len(graph.descendants(nodes[count // 2])) == count // 2 - 1
+        assert len(graph.ancestors(nodes[-1])) == count - 1
+        assert time.time() - start < 10
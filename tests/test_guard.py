@@ -0,0 +1,181 @@
+import json
+import logging
+
+import httpretty
+import pytest
+
+import pypuppetdb
+from pypuppetdb.QueryBuilder import AndOperator, EqualsOperator, InOperator
+from pypuppetdb.errors import UnboundedQueryError
+from pypuppetdb.guard import QueryGuard, estimate_ast
+
+
+class TestEstimate:
+    def test_selective_fields(self):
+        fields = {"certname": 1, "hash": 1}
+        assert estimate_ast(["=", "certname", "a"], fields) == 1
+        assert estimate_ast(["=", "status", "failed"], fields) is None
+        assert estimate_ast(["in", "hash", ["array", ["a", "b", "c"]]], fields) == 3
+        assert (
+            estimate_ast(["and", ["=", "status", "failed"], ["=", "hash", "a"]], fields)
+            == 1
+        )
+        assert (
+            estimate_ast(["or", ["=", "certname", "a"], ["=", "hash", "b"]], fields)
+            == 2
+        )
+        assert (
+            estimate_ast(["or", ["=", "certname", "a"], ["=", "status", "b"]], fields)
+            is None
+        )
+        assert estimate_ast(["not", ["=", "certname", "a"]], fields) is None
+        assert estimate_ast(["extract", ["hash"], ["=", "certname", "a"]], fields) == 1
+
+    def test_estimate(self):
+        guard = QueryGuard()
+        assert guard.estimate("events") is None
+        assert guard.estimate("events", limit=10) == 10
+        assert guard.estimate("events", query=EqualsOperator("report", "abc")) == 100
+        assert guard.estimate("events", query='["=", "report", "abc"]', limit=10) == 10
+
+    def test_bad_action(self):
+        with pytest.raises(ValueError):
+            QueryGuard(action="ignore")
+
+
+class TestQueryGuard:
+    def test_reject(self):
+        api = pypuppetdb.api.API(query_guard=QueryGuard(action="reject"))
+
+        with pytest.raises(UnboundedQueryError):
+            list(api.events())
+        with pytest.raises(UnboundedQueryError):
+            list(api.events(limit=100000))
+
+        certnames = InOperator("certname")
+        certnames.add_array(["a", "b", "c"])
+        query = AndOperator()
+        query.add(EqualsOperator("status", "failed"))
+        query.add(certnames)
+        with pytest.raises(UnboundedQueryError):
+            list(api.events(query=query))
+        assert api.query_guard.guarded == 3
+
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.GET, "http://localhost:8080/pdb/query/v4/events", body="[]"
+        )
+        httpretty.register_uri(
+            httpretty.GET, "http://localhost:8080/pdb/query/v4/nodes", body="[]"
+        )
+        list(api.events(query=EqualsOperator("report", "abc")))
+        list(api.events(limit=100))
+        # not a heavy endpoint
+        list(api.nodes())
+        assert api.query_guard.guarded == 3
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_warn(self, caplog):
+        api = pypuppetdb.api.API(query_guard=QueryGuard())
+
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.GET, "http://localhost:8080/pdb/query/v4/reports", body="[]"
+        )
+        with caplog.at_level(logging.WARNING, logger="pypuppetdb.guard"):
+            list(api.reports())
+        assert "may return any number of results" in caplog.text
+        assert httpretty.last_request().path == "/pdb/query/v4/reports"
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_page(self):
+        guard = QueryGuard(action="page", limits={"events": 2, "nodes": 2})
+        api = pypuppetdb.api.API(query_guard=guard)
+        rows = [{"certname": f"node{i}"} for i in range(5)]
+
+        def respond(request, uri, headers):
+            offset = int(request.querystring["offset"][0])
+            limit = int(request.querystring["limit"][0])
+            end = offset + limit
+            return [200, headers, json.dumps(rows[offset:end])]
+
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.GET, "http://localhost:8080/pdb/query/v4/nodes", body=respond
+        )
+
+        results = api._query("nodes")
+        assert isinstance(results, list)
+        assert [r["certname"] for r in results] == [r["certname"] for r in rows]
+        requests = httpretty.latest_requests()[-3:]
+        assert [r.querystring["offset"] for r in requests] == [["0"], ["2"], ["4"]]
+        for request in requests:
+            assert request.querystring["limit"] == ["2"]
+
+        results = api._query("nodes", limit=3)
+        assert [r["certname"] for r in results] == ["node0", "node1", "node2"]
+
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_page_unique_order(self):
+        guard = QueryGuard(action="page", limits={"reports": 2})
+        api = pypuppetdb.api.API(query_guard=guard)
+
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.GET, "http://localhost:8080/pdb/query/v4/reports", body="[]"
+        )
+
+        api._query("reports")
+        order_by = httpretty.last_request().querystring["order_by"][0]
+        assert json.loads(order_by) == [{"field": "hash", "order": "asc"}]
+
+        api._query("reports", order_by='[{"field": "certname", "order": "desc"}]')
+        order_by = httpretty.last_request().querystring["order_by"][0]
+        assert json.loads(order_by) == [
+            {"field": "certname", "order": "desc"},
+            {"field": "hash", "order": "asc"},
+        ]
+
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_page_no_unique_fields(self):
+        guard = QueryGuard(action="page", limits={"fact-names": 2})
+        api = pypuppetdb.api.API(query_guard=guard)
+        with pytest.raises(UnboundedQueryError):
+            api._query("fact-names")
+
+    def test_page_split(self):
+        guard = QueryGuard(action="page", limits={"nodes": 2})
+        api = pypuppetdb.api.API(query_guard=guard, max_in_values=2, query_workers=1)
+
+        def respond(request, uri, headers):
+            query = json.loads(request.querystring["query"][0])
+            rows = [{"certname": c} for c in sorted(query[2][1])]
+            offset = int(request.querystring["offset"][0])
+            limit = int(request.querystring["limit"][0])
+            end = offset + limit
+            return [200, headers, json.dumps(rows[offset:end])]
+
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.GET, "http://localhost:8080/pdb/query/v4/nodes", body=respond
+        )
+
+        certnames = InOperator("certname")
+        certnames.add_array(["n4", "n1", "n3", "n2"])
+        results = api._query("nodes", query=certnames, offset=1)
+        assert [r["certname"] for r in results] == ["n2", "n3", "n4"]
+        # every chunk is paged on its own, no page reads the ones before it
+        for request in httpretty.latest_requests():
+            assert request.querystring["limit"] == ["2"]
+            assert len(json.loads(request.querystring["query"][0])[2][1]) == 2
+
+        httpretty.disable()
+        httpretty.reset()
@@ -0,0 +1,187 @@
+import json
+
+import httpretty
+import pytest
+import requests
+
+import pypuppetdb
+from pypuppetdb.api.base import endpoint_name
+from pypuppetdb.guard import QueryGuard
+from pypuppetdb.hooks import TimingAdapter
+
+NODES = [
+    {
+        "certname": certname,
+        "deactivated": None,
+        "expired": None,
+        "report_timestamp": None,
+        "catalog_timestamp": None,
+        "facts_timestamp": None,
+        "report_environment": "production",
+        "catalog_environment": "production",
+        "facts_environment": "production",
+    }
+    for certname in ("node1", "node2")
+]
+
+
+@pytest.fixture
+def pdb():
+    httpretty.reset()
+    httpretty.enable()
+    httpretty.register_uri(
+        httpretty.GET,
+        "http://localhost:8080/pdb/query/v4/nodes",
+        body=json.dumps(NODES),
+    )
+    yield
+    httpretty.disable()
+    httpretty.reset()
+
+
+def test_endpoint_name():
+    assert endpoint_name("http://localhost:8080/pdb/query/v4/nodes") == "nodes"
+    assert endpoint_name("http://localhost:8080/pdb/query/v4/nodes/node1/facts") == (
+        "nodes"
+    )
+    assert endpoint_name("https://db:8081/puppetdb/pdb/query/v4/fact-names") == (
+        "fact-names"
+    )
+    assert endpoint_name("http://localhost:8080/pdb/query/v4") == "pql"
+    assert endpoint_name("http://localhost:8080/metrics/v2") == "metrics-base"
+    assert endpoint_name("http://localhost:8080/metrics/v2/read/x") == "metrics"
+    assert endpoint_name("http://localhost:8080/unknown") == "other"
+
+
+class TestRequestHooks:
+    def test_no_hooks(self, pdb):
+        api = pypuppetdb.connect()
+        assert not isinstance(
+            api.session.get_adapter("http://localhost"), TimingAdapter
+        )
+        assert len(list(api.nodes())) == 2
+
+    def test_nodes(self, pdb):
+        events = []
+        api = pypuppetdb.connect(request_hooks=[events.append])
+        assert isinstance(api.session.get_adapter("http://localhost"), TimingAdapter)
+
+        nodes = api.nodes(query='["=", "certname", "node1"]')
+        next(nodes)
+        # the event waits for all the nodes to be built
+        assert events == []
+        list(nodes)
+
+        (event,) = events
+        assert event.method == "GET"
+        assert event.endpoint == "nodes"
+        assert event.shape == '["=","certname","?"]'
+        assert event.status == 200
+        assert event.bytes == len(json.dumps(NODES))
+        assert event.results == 2
+        assert event.error is None
+        for phase in ("connect", "ttfb", "download", "decode", "construct"):
+            assert getattr(event, phase) >= 0
+        assert event.elapsed >= event.ttfb
+
+    def test_closed_generator(self, pdb):
+        events = []
+        api = pypuppetdb.connect(request_hooks=[events.append])
+        nodes = api.nodes()
+        next(nodes)
+        nodes.close()
+        assert len(events) == 1
+
+    def test_paged(self):
+        events = []
+        guard = QueryGuard(action="page", limits={"nodes": 1})
+        api = pypuppetdb.connect(request_hooks=[events.append], query_guard=guard)
+
+        def respond(request, uri, headers):
+            offset = int(request.querystring["offset"][0])
+            end = offset + 1
+            return [200, headers, json.dumps(NODES[offset:end])]
+
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.GET, "http://localhost:8080/pdb/query/v4/nodes", body=respond
+        )
+
+        nodes = api.nodes()
+        next(nodes)
+        assert events == []
+        # the first page is built once the second comes in
+        next(nodes)
+        assert len(events) == 1
+        assert events[0].results == 1
+        assert events[0].construct >= 0
+        nodes.close()
+        # closing passes on the events of the pages fetched so far
+        assert len(events) == 2
+        assert all(event.construct is not None for event in events)
+
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_without_construction(self, pdb):
+        events = []
+        api = pypuppetdb.connect(request_hooks=[events.append])
+        api._query("nodes")
+        (event,) = events
+        assert event.construct is None
+
+    def test_pql_shape(self, pdb):
+        httpretty.register_uri(
+            httpretty.GET, "http://localhost:8080/pdb/query/v4", body="[]"
+        )
+        events = []
+        api = pypuppetdb.connect(request_hooks=[events.append])
+        api._pql('nodes { certname = "node1" }')
+        assert events[0].endpoint == "pql"
+        assert events[0].shape == '["from","nodes",["=","certname","?"]]'
+
+    def test_error(self, pdb):
+        httpretty.register_uri(
+            httpretty.GET,
+            "http://localhost:8080/pdb/query/v4/facts",
+            body="boom",
+            status=500,
+        )
+        events = []
+        api = pypuppetdb.connect(request_hooks=[events.append])
+        with pytest.raises(requests.exceptions.HTTPError):
+            list(api.facts())
+        (event,) = events
+        assert event.status == 500
+        assert isinstance(event.error, requests.exceptions.HTTPError)
+        assert event.decode is None
+
+    def test_command(self, pdb):
+        httpretty.register_uri(
+            httpretty.POST,
+            "http://localhost:8080/pdb/cmd/v1",
+            body='{"uuid": "abc"}',
+        )
+        events = []
+        api = pypuppetdb.connect(request_hooks=[events.append])
+        api.command("deactivate node", {"certname": "node1"})
+        (event,) = events
+        assert (event.method, event.endpoint, event.status) == ("POST", "cmd", 200)
+        assert event.shape is None
+
+    def test_failing_hook(self, pdb):
+        def hook(event):
+            raise RuntimeError("broken hook")
+
+        api = pypuppetdb.connect(request_hooks=[hook])
+        assert len(list(api.nodes())) == 2
+
+    def test_remove(self, pdb):
+        events = []
+        api = pypuppetdb.connect()
+        api.add_request_hook(events.append)
+        api._query("nodes")
+        api.remove_request_hook(events.append)
+        api._query("nodes")
+        assert len(events) == 1
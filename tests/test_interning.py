@@ -0,0 +1,178 @@
+import gc
+import json
+import tracemalloc
+
+import httpretty
+import pytest
+
+from pypuppetdb import interning
+from pypuppetdb.interning import InternPool
+from pypuppetdb.types import Fact, Inventory, Resource
+
+
+@pytest.fixture
+def pool():
+    pool = interning.enable()
+    yield pool
+    interning.disable()
+
+
+def synthetic_fleet(count):
+    """The inventory of a fleet, decoded from JSON so that every node has
+    its own copy of every string, as it would have coming from PuppetDB."""
+    families = ["Debian", "RedHat", "Suse"]
+    body = json.dumps(
+        [
+            {
+                "certname": f"node{i}.example.com",
+                "timestamp": "2017-06-05T20:18:23.374Z",
+                "environment": "production",
+                "facts": {
+                    "kernel": "Linux",
+                    "kernelrelease": "5.10.0-21-amd64",
+                    "os": {
+                        "family": families[i % 3],
+                        "name": families[i % 3],
+                        "release": {"major": "11", "full": "11.6"},
+                    },
+                    "virtual": "kvm",
+                    "timezone": "UTC",
+                    "uptime_seconds": i,
+                },
+                "trusted": {"authenticated": "remote", "extensions": {}},
+            }
+            for i in range(count)
+        ]
+    )
+    return json.loads(body)
+
+
+def measure(count):
+    gc.collect()
+    tracemalloc.start()
+    inventory = [Inventory.create_from_dict(i) for i in synthetic_fleet(count)]
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del inventory
+    return size
+
+
+class TestInternPool:
+    def test_disabled_by_default(self):
+        assert interning.get_pool() is None
+
+    def test_strings(self):
+        pool = InternPool(max_value_length=8, max_values=2)
+        a = "".join(["Deb", "ian"])
+        b = "".join(["Deb", "ian"])
+        assert a is not b
+        assert pool.value(a) is a
+        assert pool.value(b) is a
+        assert pool.hits == 1
+        assert pool.misses == 1
+
+        long_value = "x" * 9
+        assert pool.value(long_value) is long_value
+        assert len(pool) == 1
+
+        pool.value("one")
+        pool.value("two")
+        assert len(pool) == 2
+
+        pool.clear()
+        assert len(pool) == 0
+        assert pool.hits == 0
+
+    def test_non_strings(self):
+        pool = InternPool()
+        assert pool.value(1) == 1
+        assert pool.value(True) is True
+        assert pool.value(None) is None
+        assert pool.key(None) is None
+
+    def test_nested(self):
+        pool = InternPool()
+        a = pool.value({"os": {"family": "".join(["Deb", "ian"])}})
+        b = pool.value({"os": {"family": "".join(["Deb", "ian"])}})
+        assert a == b
+        assert a is not b
+        assert a["os"]["family"] is b["os"]["family"]
+
+    def test_structured(self):
+        pool = InternPool(structured=True)
+        a = pool.value({"major": "11", "full": "11.6"})
+        b = pool.value({"full": "11.6", "major": "11"})
+        assert a is b
+        assert pool.value(["a", "b"]) is pool.value(["a", "b"])
+
+    def test_object_pairs_hook(self):
+        pool = InternPool()
+        body = '[{"family": "Debian"}, {"family": "Debian"}]'
+        a, b = json.loads(body, object_pairs_hook=pool.object_pairs_hook)
+        assert a["family"] is b["family"]
+        assert list(a)[0] is list(b)[0]
+
+    def test_object_pairs_hook_arrays(self):
+        pool = InternPool()
+        body = '[{"tags": ["ssh", ["ssh"]]}, {"tags": ["ssh"]}]'
+        a, b = json.loads(body, object_pairs_hook=pool.object_pairs_hook)
+        assert a["tags"][0] is b["tags"][0]
+        assert a["tags"][1][0] is b["tags"][0]
+
+    def test_decoded_values_not_walked_again(self):
+        pool = InternPool()
+        (value,) = json.loads(
+            '[{"os": {"family": "Debian"}, "tags": ["a"]}]',
+            object_pairs_hook=pool.object_pairs_hook,
+        )
+        assert pool.value(value) is value
+        assert pool.value(value["tags"]) is value["tags"]
+        # plain values are still walked and copied
+        plain = {"os": {"family": "Debian"}}
+        assert pool.value(plain) is not plain
+
+    def test_decoded_values_structured(self):
+        pool = InternPool(structured=True)
+        a, b = json.loads(
+            '[{"major": "11"}, {"major": "11"}]',
+            object_pairs_hook=pool.object_pairs_hook,
+        )
+        assert pool.value(a) is pool.value(b)
+
+
+class TestTypesInterning:
+    def test_fact(self, pool):
+        a = Fact("node1", "os", {"family": "".join(["Deb", "ian"])}, "production")
+        b = Fact("node2", "os", {"family": "".join(["Deb", "ian"])}, "production")
+        assert a.value["family"] is b.value["family"]
+
+    def test_resource(self, pool):
+        a = Resource("node1", "sshd", "Service", ["".join(["s", "sh"])], False, None, 1)
+        b = Resource("node2", "sshd", "Service", ["".join(["s", "sh"])], False, None, 1)
+        assert a.tags[0] is b.tags[0]
+
+    def test_decoder(self, api, pool):
+        url = "http://localhost:8080/pdb/query/v4/facts"
+        body = [
+            {"certname": "a", "name": "kernel", "value": "Linux", "environment": "p"},
+            {"certname": "b", "name": "kernel", "value": "Linux", "environment": "p"},
+        ]
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, url, body=json.dumps(body))
+        a, b = list(api.facts())
+        assert a.value is b.value
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_memory_savings(self):
+        # a memory benchmark on a synthetic fleet: the pooled inventory
+        # must be noticeably smaller than the one without interning
+        count = 2000
+        baseline = measure(count)
+        interning.enable(InternPool(structured=True))
+        try:
+            pooled = measure(count)
+        finally:
+            interning.disable()
+        assert pooled < baseline * 0.7
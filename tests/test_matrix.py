@@ -0,0 +1,75 @@
+import pytest
+
+from pypuppetdb.errors import APIError
+from pypuppetdb.matrix import DictionaryColumn, FactMatrix
+
+
+@pytest.fixture
+def matrix():
+    matrix = FactMatrix(["os.family", "memory", "disks"])
+    matrix.add_row("node1", {"os.family": "Debian", "memory": 2, "disks": ["sda"]})
+    matrix.add_row("node2", {"os.family": "RedHat", "disks": ["sda"]})
+    matrix.add_row("node3", {"os.family": "Debian", "memory": 4.5})
+    return matrix.finalize()
+
+
+class TestDictionaryColumn:
+    def test_encoding(self):
+        column = DictionaryColumn()
+        for value in ["a", "b", "a", None, True, 1, {"x": 1}, {"x": 1}]:
+            column.append(value)
+        assert list(column.codes) == [0, 1, 0, -1, 2, 3, 4, 4]
+        assert column.dictionary == ["a", "b", True, 1, {"x": 1}]
+        assert column.values() == ["a", "b", "a", None, True, 1, {"x": 1}, {"x": 1}]
+        assert not column.is_numeric
+        assert not column.is_scalar
+
+
+class TestFactMatrix:
+    def test_no_paths(self):
+        with pytest.raises(APIError):
+            FactMatrix([])
+
+    def test_matrix(self, matrix):
+        assert len(matrix) == 3
+        assert repr(matrix) == "<FactMatrix: 3 nodes x 3 facts>"
+        assert matrix.column("memory") == [2, None, 4.5]
+        assert matrix.column("disks") == [["sda"], ["sda"], None]
+        assert matrix.value_counts("os.family") == {"Debian": 2, "RedHat": 1}
+        assert matrix.value_counts("memory") == {2: 1, 4.5: 1}
+
+    def test_add_value(self):
+        matrix = FactMatrix(["kernel"])
+        matrix.add_value("node1", "kernel", "Linux")
+        matrix.add_value("node2", "unknown", "x")
+        matrix.finalize()
+        assert matrix.certnames == ["node1"]
+        assert matrix.column("kernel") == ["Linux"]
+
+    def test_to_numpy(self, matrix):
+        numpy = pytest.importorskip("numpy")
+        arrays = matrix.to_numpy()
+        assert arrays["memory"].dtype == numpy.float64
+        assert numpy.isnan(arrays["memory"][1])
+        assert list(arrays["os.family"]) == ["Debian", "RedHat", "Debian"]
+        assert list(arrays["certname"]) == ["node1", "node2", "node3"]
+
+    def test_to_pandas(self, matrix):
+        pytest.importorskip("pandas")
+        frame = matrix.to_pandas()
+        assert str(frame["os.family"].dtype) == "category"
+        assert frame.loc["node2", "os.family"] == "RedHat"
+        assert frame.groupby("os.family", observed=True)["memory"].sum()[
+            "Debian"
+        ] == pytest.approx(6.5)
+
+    def test_to_pandas_mixed_bool_int(self):
+        pytest.importorskip("pandas")
+        matrix = FactMatrix(["virtual"])
+        matrix.add_row("node1", {"virtual": True})
+        matrix.add_row("node2", {"virtual": 1})
+        matrix.add_row("node3", {"virtual": "kvm"})
+        frame = matrix.finalize().to_pandas()
+        assert str(frame["virtual"].dtype) == "object"
+        assert frame.loc["node1", "virtual"] is True
+        assert frame.loc["node2", "virtual"] == 1
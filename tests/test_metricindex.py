@@ -0,0 +1,128 @@
+import pytest
+
+from pypuppetdb.api.metrics import MetricsAPI
+from pypuppetdb.metricindex import MetricIndex
+
+LISTING = {
+    "puppetlabs.puppetdb.mq": {
+        "name=global.depth": {"attr": {"Count": {"type": "long"}}},
+        "name=global.processed": {
+            "attr": {
+                "Count": {"type": "long"},
+                "MeanRate": {"type": "double"},
+                "OneMinuteRate": {"type": "double"},
+            }
+        },
+        "name=replace facts.9.processed": {"attr": {"Count": {"type": "long"}}},
+    },
+    "puppetlabs.puppetdb.storage": {
+        "name=gc-time": {"attr": {"Mean": {"type": "double"}}},
+    },
+    "java.lang": {"type=Memory": {"op": {"gc": {}}}},
+}
+
+
+class FakeMetricsAPI:
+    """Lists the metrics in LISTING, and counts the lists."""
+
+    def __init__(self, listing=LISTING):
+        self.listing = listing
+        self.lists = 0
+        self.read = None
+
+    def metric(self):
+        self.lists += 1
+        return self.listing
+
+    def metrics(self, metrics):
+        self.read = metrics
+        return {}
+
+
+class TestMetricIndex:
+    def test_cached(self):
+        api = FakeMetricsAPI()
+        index = MetricIndex(api)
+        assert len(index) == 5
+        assert "java.lang:type=Memory" in index
+        index.mbeans("puppetlabs")
+        assert api.lists == 1
+
+    def test_ttl(self):
+        api = FakeMetricsAPI()
+        index = MetricIndex(api, ttl=0)
+        index.mbeans()
+        index.mbeans()
+        assert api.lists == 2
+
+    def test_invalidate(self):
+        api = FakeMetricsAPI()
+        index = MetricIndex(api)
+        index.mbeans()
+        index.invalidate()
+        index.mbeans()
+        assert api.lists == 2
+
+    def test_prefix(self):
+        index = MetricIndex(FakeMetricsAPI())
+        assert index.mbeans("puppetlabs.puppetdb.mq:name=global.") == [
+            "puppetlabs.puppetdb.mq:name=global.depth",
+            "puppetlabs.puppetdb.mq:name=global.processed",
+        ]
+        assert index.mbeans("nothing") == []
+
+    def test_wildcard(self):
+        index = MetricIndex(FakeMetricsAPI())
+        assert index.mbeans("puppetlabs.puppetdb.*:name=g*") == [
+            "puppetlabs.puppetdb.mq:name=global.depth",
+            "puppetlabs.puppetdb.mq:name=global.processed",
+            "puppetlabs.puppetdb.storage:name=gc-time",
+        ]
+        assert index.mbeans("*.processed") == [
+            "puppetlabs.puppetdb.mq:name=global.processed",
+            "puppetlabs.puppetdb.mq:name=replace facts.9.processed",
+        ]
+
+    def test_attributes(self):
+        index = MetricIndex(FakeMetricsAPI())
+        assert index.attributes("puppetlabs.puppetdb.mq:name=global.depth") == {
+            "Count": {"type": "long"}
+        }
+        assert index.attributes("java.lang:type=Memory") == {}
+        with pytest.raises(KeyError):
+            index.attributes("test:name=Num")
+
+    def test_search(self):
+        index = MetricIndex(FakeMetricsAPI())
+        assert index.search("puppetlabs.puppetdb.mq:name=global.", "Count") == [
+            ("puppetlabs.puppetdb.mq:name=global.depth", "Count"),
+            ("puppetlabs.puppetdb.mq:name=global.processed", "Count"),
+        ]
+        assert index.search("*processed", "*Rate") == [
+            ("puppetlabs.puppetdb.mq:name=global.processed", "MeanRate"),
+            ("puppetlabs.puppetdb.mq:name=global.processed", "OneMinuteRate"),
+        ]
+        assert index.search("puppetlabs.puppetdb.storage") == [
+            ("puppetlabs.puppetdb.storage:name=gc-time", "Mean"),
+        ]
+
+    def test_read(self):
+        api = FakeMetricsAPI()
+        index = MetricIndex(api)
+        index.read("puppetlabs.puppetdb.storage")
+        assert api.read == ["puppetlabs.puppetdb.storage:name=gc-time"]
+        index.read("*depth", "Count")
+        assert api.read == [("puppetlabs.puppetdb.mq:name=global.depth", "Count")]
+
+    def test_v1_listing(self):
+        api = FakeMetricsAPI({"test:name=Num": "/metrics/v1/mbeans/test:name=Num"})
+        index = MetricIndex(api)
+        assert index.mbeans() == ["test:name=Num"]
+        assert index.attributes("test:name=Num") == {}
+
+
+def test_escape_metric_name_memoized():
+    MetricsAPI._escape_metric_name.cache_clear()
+    assert MetricsAPI._escape_metric_name('a/b!"c') == 'a!/b!!!"c'
+    MetricsAPI._escape_metric_name('a/b!"c')
+    assert MetricsAPI._escape_metric_name.cache_info().hits == 1
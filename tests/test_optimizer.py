@@ -0,0 +1,161 @@
+import json
+
+import pytest
+
+from pypuppetdb.QueryBuilder import (
+    AndOperator,
+    BinaryOperator,
+    EqualsOperator,
+    ExtractOperator,
+    InOperator,
+    NotOperator,
+    NullOperator,
+    OrOperator,
+)
+from pypuppetdb.errors import APIError
+from pypuppetdb.optimizer import optimize, optimize_ast, split_in_ast
+
+
+class TestOptimize:
+    def test_flatten(self):
+        inner = AndOperator()
+        inner.add(EqualsOperator("environment", "production"))
+        inner.add(EqualsOperator("latest_report?", True))
+        op = AndOperator()
+        op.add(EqualsOperator("certname", "node1"))
+        op.add(inner)
+        assert str(optimize(op)) == (
+            '["and", ["=", "certname", "node1"], '
+            '["=", "environment", "production"], ["=", "latest_report?", true]]'
+        )
+
+    def test_dedupe_and_unwrap(self):
+        op = AndOperator()
+        op.add(EqualsOperator("certname", "node1"))
+        op.add(EqualsOperator("certname", "node1"))
+        optimized = optimize(op)
+        assert isinstance(optimized, BinaryOperator)
+        assert str(optimized) == '["=", "certname", "node1"]'
+
+    def test_or_to_in(self):
+        op = OrOperator()
+        for name in ["a", "b", "a", "c"]:
+            op.add(EqualsOperator("certname", name))
+        op.add(EqualsOperator("environment", "production"))
+        assert json.loads(str(optimize(op))) == [
+            "or",
+            ["in", "certname", ["array", ["a", "b", "c"]]],
+            ["=", "environment", "production"],
+        ]
+
+    def test_or_to_in_only(self):
+        op = OrOperator()
+        op.add(EqualsOperator("certname", "a"))
+        in_op = InOperator("certname")
+        in_op.add_array(["b", "a"])
+        op.add(in_op)
+        optimized = optimize(op)
+        assert isinstance(optimized, InOperator)
+        assert str(optimized) == '["in", "certname", ["array", ["a", "b"]]]'
+
+    def test_or_to_in_skips_fact_paths_and_bools(self):
+        op = OrOperator()
+        op.add(EqualsOperator("facts.os.family", "Debian"))
+        op.add(EqualsOperator("facts.os.family", "RedHat"))
+        op.add(EqualsOperator("deactivated", True))
+        op.add(EqualsOperator("deactivated", False))
+        assert len(optimize(op).json_data()) == 5
+
+    def test_min_in_values(self):
+        op = OrOperator()
+        op.add(EqualsOperator("certname", "a"))
+        op.add(EqualsOperator("certname", "b"))
+        assert optimize(op, min_in_values=3).json_data()[0] == "or"
+
+    def test_fold_not(self):
+        inner = NotOperator()
+        inner.add(EqualsOperator("certname", "a"))
+        op = NotOperator()
+        op.add(inner)
+        assert str(optimize(op)) == '["=", "certname", "a"]'
+
+        op = NotOperator()
+        op.add(NullOperator("deactivated", True))
+        assert str(optimize(op)) == '["null?", "deactivated", false]'
+
+    def test_subqueries(self):
+        inner = AndOperator()
+        inner.add(EqualsOperator("name", "kernel"))
+        inner.add(EqualsOperator("name", "kernel"))
+        ex = ExtractOperator()
+        ex.add_field("certname")
+        ex.add_query(inner)
+        op = InOperator("certname")
+        op.add_query(ex)
+        assert optimize(op).json_data() == [
+            "in",
+            "certname",
+            ["extract", ["certname"], ["=", "name", "kernel"]],
+        ]
+
+        assert optimize_ast(["extract", ["certname"], ["group_by", "a"]]) == [
+            "extract",
+            ["certname"],
+            ["group_by", "a"],
+        ]
+        assert optimize_ast(
+            ["select_facts", ["and", ["=", "name", "a"], ["=", "name", "a"]]]
+        ) == ["select_facts", ["=", "name", "a"]]
+
+    def test_string_query(self):
+        query = '["or", ["=", "certname", "a"], ["=", "certname", "b"]]'
+        assert str(optimize(query)) == '["in", "certname", ["array", ["a", "b"]]]'
+        assert optimize('["extract", ["certname"]]') == '["extract", ["certname"]]'
+
+    def test_bad_query(self):
+        with pytest.raises(APIError):
+            optimize(42)
+
+
+class TestSplitIn:
+    def test_split(self):
+        ast = [
+            "and",
+            ["=", "environment", "production"],
+            ["in", "certname", ["array", ["a", "b", "a", "c", "d", "e"]]],
+        ]
+        assert split_in_ast(ast, 2) == [
+            [
+                "and",
+                ["=", "environment", "production"],
+                ["in", "certname", ["array", ["a", "b"]]],
+            ],
+            [
+                "and",
+                ["=", "environment", "production"],
+                ["in", "certname", ["array", ["c", "d"]]],
+            ],
+            [
+                "and",
+                ["=", "environment", "production"],
+                ["in", "certname", ["array", ["e"]]],
+            ],
+        ]
+        # the original query is left untouched
+        assert len(ast[2][2][1]) == 6
+
+    def test_split_top_level(self):
+        ast = ["in", "certname", ["array", ["a", "b", "c"]]]
+        assert split_in_ast(ast, 2) == [
+            ["in", "certname", ["array", ["a", "b"]]],
+            ["in", "certname", ["array", ["c"]]],
+        ]
+
+    def test_no_split(self):
+        assert split_in_ast(["in", "certname", ["array", ["a", "b"]]], 2) is None
+        # the results of these can't be combined
+        for ast in (
+            ["not", ["in", "certname", ["array", ["a", "b", "c"]]]],
+            ["or", ["=", "a", 1], ["in", "certname", ["array", ["a", "b", "c"]]]],
+        ):
+            assert split_in_ast(ast, 2) is None
@@ -0,0 +1,201 @@
+import pytest
+
+from pypuppetdb.QueryBuilder import (
+    AndOperator,
+    EqualsOperator,
+    ExtractOperator,
+    FromOperator,
+    FunctionOperator,
+    InOperator,
+    NotOperator,
+)
+from pypuppetdb.errors import APIError, PqlSyntaxError
+from pypuppetdb.pql import parse, parse_ast, to_pql
+
+
+class TestParse:
+    def test_simple(self):
+        assert parse_ast('nodes { certname = "node1" }') == [
+            "from",
+            "nodes",
+            ["=", "certname", "node1"],
+        ]
+        assert parse_ast("nodes {}") == ["from", "nodes"]
+        assert parse_ast("inventory[] {}") == ["from", "inventory"]
+
+    def test_projection_and_paging(self):
+        pql = """
+          nodes[certname, report_timestamp] {
+            facts_environment = 'production'
+            order by report_timestamp desc, certname
+            offset 10
+            limit 5
+          }
+        """
+        assert parse_ast(pql) == [
+            "from",
+            "nodes",
+            [
+                "extract",
+                ["certname", "report_timestamp"],
+                ["=", "facts_environment", "production"],
+            ],
+            ["order_by", [["report_timestamp", "desc"], "certname"]],
+            ["limit", 5],
+            ["offset", 10],
+        ]
+
+    def test_functions_and_group_by(self):
+        assert parse_ast(
+            'facts[name, count(), to_string(value, "FM")] { group by name }'
+        ) == [
+            "from",
+            "facts",
+            [
+                "extract",
+                [
+                    "name",
+                    ["function", "count"],
+                    ["function", "to_string", "value", "FM"],
+                ],
+                ["group_by", "name"],
+            ],
+        ]
+
+    def test_operators(self):
+        pql = """
+          reports {
+            (status != "failed" or noop = true) and !(certname ~ "^db")
+            and latest_report? = true and deactivated is not null
+            and path ~> ["networking", ".*"] and metrics >= -1.5
+          }
+        """
+        assert parse_ast(pql)[2] == [
+            "and",
+            ["or", ["not", ["=", "status", "failed"]], ["=", "noop", True]],
+            ["not", ["~", "certname", "^db"]],
+            ["=", "latest_report?", True],
+            ["null?", "deactivated", False],
+            ["~>", "path", ["networking", ".*"]],
+            [">=", "metrics", -1.5],
+        ]
+
+    def test_subqueries(self):
+        pql = """
+          nodes {
+            certname in resources[certname] { type = "Class" }
+            and [certname, facts_environment] in facts[certname, environment] {}
+            and facts { name = "kernel" }
+            and certname in ["a", "b"]
+          }
+        """
+        assert parse_ast(pql)[2] == [
+            "and",
+            [
+                "in",
+                "certname",
+                [
+                    "from",
+                    "resources",
+                    ["extract", ["certname"], ["=", "type", "Class"]],
+                ],
+            ],
+            [
+                "in",
+                ["certname", "facts_environment"],
+                ["from", "facts", ["extract", ["certname", "environment"]]],
+            ],
+            ["subquery", "facts", ["=", "name", "kernel"]],
+            ["in", "certname", ["array", ["a", "b"]]],
+        ]
+
+    @pytest.mark.parametrize(
+        "pql",
+        [
+            "",
+            "nodes {",
+            "nodez {}",
+            "nodes { certname = }",
+            "nodes { certname == 'a' }",
+            "nodes {} nodes",
+            "nodes { group by certname }",
+            "nodes { certname in nodes { a = 1 } }",
+            "nodes { limit -1 }",
+            "facts[foo()] {}",
+            "nodes { certname = $ }",
+        ],
+    )
+    def test_syntax_errors(self, pql):
+        with pytest.raises(PqlSyntaxError):
+            parse_ast(pql)
+
+    def test_error_position(self):
+        with pytest.raises(PqlSyntaxError, match="position 19"):
+            parse_ast('nodes { certname = } "x"')
+
+    def test_parse_from_operator(self):
+        fr = parse('facts[name] { certname = "node1" limit 3 }')
+        assert isinstance(fr, FromOperator)
+        assert fr.limit == 3
+        assert str(fr) == (
+            '["from", "facts", ["extract", ["name"], '
+            '["=", "certname", "node1"]], ["limit", 3]]'
+        )
+        with pytest.raises(APIError):
+            parse("nodes { limit 1 }")
+
+
+class TestToPql:
+    def test_from_operator(self):
+        ex = ExtractOperator()
+        ex.add_field(["certname", FunctionOperator("count")])
+        op = AndOperator()
+        op.add(EqualsOperator("facts_environment", "production"))
+        no = NotOperator()
+        no.add(EqualsOperator("certname", "db1"))
+        op.add(no)
+        ex.add_query(op)
+        ex.add_group_by("certname")
+        fr = FromOperator("nodes")
+        fr.add_query(ex)
+        fr.add_order_by(["certname"])
+        fr.add_limit(10)
+
+        assert to_pql(fr) == (
+            'nodes[certname, count()] { facts_environment = "production" '
+            'and certname != "db1" group by certname order by certname limit 10 }'
+        )
+
+    def test_legacy_subquery(self):
+        ex = ExtractOperator()
+        ex.add_field("certname")
+        ex.add_query('["select_resources", ["=", "type", "Class"]]')
+        op = InOperator("certname")
+        op.add_query(ex)
+        fr = FromOperator("nodes")
+        fr.add_query(op)
+        assert to_pql(fr) == (
+            'nodes { certname in resources[certname] { type = "Class" } }'
+        )
+
+    @pytest.mark.parametrize(
+        "pql",
+        [
+            "nodes {}",
+            'nodes { facts { name = "operatingsystem" and value = "Debian" } }',
+            'reports[certname, hash] { (certname in ["a", "b"] and '
+            'status != "failed") or deactivated is null order by certname desc }',
+            "nodes { [certname, facts_environment] in facts[certname, environment] "
+            '{ name = "x" } }',
+            'events[count(), to_string(timestamp, "YYYY")] '
+            '{ !(noop = true or status = "failed") group by to_string(timestamp, "YYYY") }',
+        ],
+    )
+    def test_roundtrip(self, pql):
+        assert to_pql(parse_ast(pql)) == pql
+
+    def test_unsupported(self):
+        with pytest.raises(APIError):
+            to_pql(EqualsOperator("certname", "a"))
+        with pytest.raises(APIError):
+            to_pql(["from", "nodes", ["bogus", "a"]])
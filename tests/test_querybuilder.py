@@ -1,4 +1,6 @@
 import datetime
+import json
+import timeit
 
 import pytest
 
@@ -16,6 +18,8 @@ from pypuppetdb.QueryBuilder import (
     NotOperator,
     NullOperator,
     OrOperator,
+    Placeholder,
+    PreparedQuery,
     RegexArrayOperator,
     RegexOperator,
     SubqueryOperator,
@@ -735,3 +739,70 @@ class TestFromOperator:
 
         with pytest.raises(APIError):
             fr.add_order_by(o3inv)
+
+
+class TestPreparedQuery:
+    """
+    Test the PreparedQuery object.
+    """
+
+    @staticmethod
+    def build(certname):
+        op = AndOperator()
+        op.add(EqualsOperator("certname", certname))
+        op.add(EqualsOperator("latest_report?", True))
+        return op
+
+    def test_bind(self):
+        prepared = PreparedQuery(self.build(Placeholder("certname")))
+        assert prepared.names == ["certname"]
+        assert (
+            str(prepared)
+            == '["and", ["=", "certname", ?], ["=", "latest_report?", true]]'
+        )
+        assert prepared.bind(certname="node1") == str(self.build("node1"))
+        assert prepared.bind(certname='a "quoted" name') == str(
+            self.build('a "quoted" name')
+        )
+
+    def test_repeated_and_typed_placeholders(self):
+        op = OrOperator()
+        op.add(EqualsOperator("certname", Placeholder("name")))
+        op.add(GreaterOperator("report_timestamp", Placeholder("since")))
+        op.add(EqualsOperator("producer", Placeholder("name")))
+        prepared = PreparedQuery(op)
+        since = datetime.datetime(2016, 6, 1)
+        assert json.loads(prepared.bind(name="n", since=since)) == [
+            "or",
+            ["=", "certname", "n"],
+            [">", "report_timestamp", "2016-06-01 00:00:00"],
+            ["=", "producer", "n"],
+        ]
+
+    def test_in_array_placeholder(self):
+        op = InOperator("certname")
+        op.add_array(Placeholder("names"))
+        prepared = PreparedQuery(op)
+        assert (
+            prepared.bind(names=["a", "b"])
+            == '["in", "certname", ["array", ["a", "b"]]]'
+        )
+
+    def test_bind_errors(self):
+        prepared = PreparedQuery(self.build(Placeholder("certname")))
+        with pytest.raises(APIError):
+            prepared.bind()
+        with pytest.raises(APIError):
+            prepared.bind(certname="a", other="b")
+
+    def test_not_serializable(self):
+        with pytest.raises(TypeError):
+            PreparedQuery(EqualsOperator("certname", object()))
+
+    def test_microbenchmark(self):
+        # binding a prepared query must beat rebuilding and serializing
+        # the operator tree every time
+        prepared = PreparedQuery(self.build(Placeholder("certname")))
+        rebuild = timeit.timeit(lambda: str(self.build("node1")), number=2000)
+        bind = timeit.timeit(lambda: prepared.bind(certname="node1"), number=2000)
+        assert bind < rebuild
@@ -0,0 +1,159 @@
+import json
+
+import httpretty
+import pytest
+
+import pypuppetdb
+from pypuppetdb.QueryBuilder import EqualsOperator
+from pypuppetdb.errors import APIError
+from pypuppetdb.evaluator import filter_rows
+from pypuppetdb.replica import Replica
+
+
+class FakePuppetDB:
+    """Serves factsets and nodes, filtering and paging them like
+    PuppetDB would."""
+
+    def __init__(self):
+        self.factsets = [
+            {
+                "certname": "node1",
+                "environment": "production",
+                "producer_timestamp": "2023-01-01T00:00:00.000Z",
+            },
+            {
+                "certname": "node2",
+                "environment": "staging",
+                "producer_timestamp": "2023-01-02T00:00:00.000Z",
+            },
+        ]
+        self.nodes = [
+            {
+                "certname": "node1",
+                "facts_timestamp": "2023-01-01T00:00:00.000Z",
+                "catalog_timestamp": "2023-01-01T00:00:01.000Z",
+                "report_timestamp": None,
+            },
+        ]
+        self.queries = []
+
+    def respond(self, rows):
+        def respond(request, uri, headers):
+            query = request.querystring.get("query", [None])[0]
+            self.queries.append(query)
+            result = list(filter_rows(query, rows)) if query else list(rows)
+            offset = int(request.querystring["offset"][0])
+            end = offset + int(request.querystring["limit"][0])
+            return [200, headers, json.dumps(result[offset:end])]
+
+        return respond
+
+    def __enter__(self):
+        httpretty.enable()
+        for endpoint in ("factsets", "nodes"):
+            httpretty.register_uri(
+                httpretty.GET,
+                f"http://localhost:8080/pdb/query/v4/{endpoint}",
+                body=self.respond(getattr(self, endpoint)),
+            )
+        return self
+
+    def __exit__(self, *args):
+        httpretty.disable()
+        httpretty.reset()
+
+
+@pytest.fixture
+def replica(tmp_path):
+    api = pypuppetdb.api.API()
+    with Replica(
+        api, str(tmp_path / "replica.db"), endpoints=["factsets", "nodes"], page_size=1
+    ) as replica:
+        yield replica
+
+
+class TestReplica:
+    def test_refresh(self, replica):
+        with FakePuppetDB() as puppetdb:
+            assert replica.refresh() == {"factsets": 2, "nodes": 1}
+            assert puppetdb.queries == [None] * 3 + [None] * 2
+            assert replica.watermark("factsets") == "2023-01-02T00:00:00.000Z"
+            assert replica.watermark("nodes") == "2023-01-01T00:00:01.000Z"
+
+            puppetdb.factsets[0]["environment"] = "staging"
+            puppetdb.factsets[0]["producer_timestamp"] = "2023-01-03T00:00:00.000Z"
+            puppetdb.queries.clear()
+            assert replica.refresh() == {"factsets": 1, "nodes": 0}
+            assert json.loads(puppetdb.queries[0]) == [
+                ">=",
+                "producer_timestamp",
+                "2023-01-01T23:59:00.000Z",
+            ]
+            assert json.loads(puppetdb.queries[-1])[0] == "or"
+
+        assert replica.get("factsets", "node1")["environment"] == "staging"
+        assert replica.watermark("factsets") == "2023-01-03T00:00:00.000Z"
+
+    def test_late_rows(self, replica):
+        with FakePuppetDB() as puppetdb:
+            replica.refresh()
+            # stored after the previous refresh, with the watermark's
+            # timestamp and one from a producer clock that runs behind
+            for certname, timestamp in (
+                ("node3", "2023-01-02T00:00:00.000Z"),
+                ("node4", "2023-01-01T23:59:30.000Z"),
+            ):
+                puppetdb.factsets.append(
+                    {
+                        "certname": certname,
+                        "environment": "production",
+                        "producer_timestamp": timestamp,
+                    }
+                )
+            assert replica.refresh()["factsets"] == 2
+            # only pulled again unchanged
+            assert replica.refresh()["factsets"] == 0
+
+        assert replica.get("factsets", "node4") is not None
+        assert replica.watermark("factsets") == "2023-01-02T00:00:00.000Z"
+
+    def test_full_refresh(self, replica):
+        with FakePuppetDB() as puppetdb:
+            replica.refresh()
+            del puppetdb.factsets[1]
+            replica.refresh()
+            assert replica.get("factsets", "node2") is not None
+            replica.refresh(full=True)
+            assert replica.get("factsets", "node2") is None
+
+    def test_reads(self, replica):
+        with FakePuppetDB():
+            replica.refresh()
+
+        staging = replica.rows("factsets", EqualsOperator("environment", "staging"))
+        assert [row["certname"] for row in staging] == ["node2"]
+        assert [row["certname"] for row in replica.rows("factsets")] == [
+            "node1",
+            "node2",
+        ]
+        assert replica.sql(
+            "SELECT certname FROM factsets "
+            "WHERE json_extract(data, '$.environment') = ?",
+            ("production",),
+        ) == [("node1",)]
+
+    def test_persistent(self, tmp_path):
+        path = str(tmp_path / "replica.db")
+        api = pypuppetdb.api.API()
+        with FakePuppetDB():
+            with Replica(api, path, endpoints=["factsets"]) as replica:
+                replica.refresh()
+        with Replica(api, path, endpoints=["factsets"]) as replica:
+            assert replica.watermark("factsets") == "2023-01-02T00:00:00.000Z"
+            assert len(list(replica.rows("factsets"))) == 2
+
+    def test_bad_endpoint(self, replica):
+        with pytest.raises(APIError):
+            Replica(pypuppetdb.api.API(), ":memory:", endpoints=["reports"])
+        with pytest.raises(APIError):
+            list(replica.rows("inventory"))
@@ -0,0 +1,116 @@
+import math
+import time
+
+import pytest
+
+from pypuppetdb.errors import MetricReadError
+from pypuppetdb.sampler import MetricsSampler, RingBuffer
+
+DEPTH = ("puppetlabs.puppetdb.mq:name=global.depth", "Count")
+PROCESSED = ("puppetlabs.puppetdb.mq:name=global.processed", "Count")
+
+
+class FakeMetricsAPI:
+    """Answers bulk metric reads with a counter that grows by 10 per read."""
+
+    def __init__(self):
+        self.reads = 0
+
+    def metrics(self, metrics):
+        self.reads += 1
+        return {
+            DEPTH[0]: MetricReadError("not found", mbean=DEPTH[0], status=404),
+            PROCESSED[0]: {"Count": self.reads * 10},
+        }
+
+
+def filled(values, start=1000.0, step=10.0):
+    """A sampler with one sample of PROCESSED per value, `step` seconds apart."""
+    sampler = MetricsSampler(FakeMetricsAPI(), [PROCESSED], size=len(values))
+    for i, value in enumerate(values):
+        sampler.timestamps.append(start + i * step)
+        sampler.buffer(*PROCESSED).append(value)
+    return sampler
+
+
+class TestRingBuffer:
+    def test_wraps(self):
+        buffer = RingBuffer(3)
+        for value in range(5):
+            buffer.append(value)
+        assert len(buffer) == 3
+        assert list(buffer) == [2.0, 3.0, 4.0]
+        assert buffer[0] == 2.0
+        assert buffer[-1] == 4.0
+
+    def test_index_error(self):
+        buffer = RingBuffer(3)
+        buffer.append(1)
+        with pytest.raises(IndexError):
+            buffer[1]
+
+    def test_size(self):
+        with pytest.raises(ValueError):
+            RingBuffer(0)
+
+
+class TestMetricsSampler:
+    def test_sample(self):
+        api = FakeMetricsAPI()
+        sampler = MetricsSampler(api, [DEPTH, PROCESSED])
+        sampler.sample()
+        sampler.sample()
+        assert api.reads == 2
+        assert len(sampler.timestamps) == 2
+        assert sampler.last(*PROCESSED) == 20.0
+        # unreadable metrics are kept as NaN
+        assert math.isnan(sampler.buffer(*DEPTH)[-1])
+        assert sampler.last(*DEPTH) is None
+
+    def test_background(self):
+        api = FakeMetricsAPI()
+        sampler = MetricsSampler(api, [PROCESSED], interval=0.01)
+        sampler.start()
+        deadline = time.monotonic() + 5
+        while api.reads < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        sampler.stop()
+        assert len(sampler.timestamps) >= 3
+
+    def test_metrics_must_be_tuples(self):
+        with pytest.raises(ValueError):
+            MetricsSampler(FakeMetricsAPI(), ["test:name=Num"])
+
+    def test_unknown_metric(self):
+        with pytest.raises(KeyError):
+            filled([1, 2]).rate("test:name=Num", "Count")
+
+    def test_delta_and_rate(self):
+        sampler = filled([100, 150, 250, 400])
+        assert sampler.delta(*PROCESSED) == 300
+        assert sampler.rate(*PROCESSED) == 10.0
+        # the last 10 seconds: 250 -> 400
+        assert sampler.delta(*PROCESSED, window=10) == 150
+        assert sampler.rate(*PROCESSED, window=10) == 15.0
+
+    def test_rate_skips_nan(self):
+        sampler = filled([100, math.nan, 300])
+        assert sampler.rate(*PROCESSED) == 10.0
+
+    def test_rate_not_enough_samples(self):
+        assert filled([100]).rate(*PROCESSED) is None
+
+    def test_rate_counter_reset(self):
+        assert filled([100, 5]).rate(*PROCESSED) is None
+
+    def test_percentile(self):
+        sampler = filled([4, 1, 3, 2, 5])
+        assert sampler.percentile(*PROCESSED, 0) == 1
+        assert sampler.percentile(*PROCESSED, 50) == 3
+        assert sampler.percentile(*PROCESSED, 100) == 5
+        assert sampler.percentile(*PROCESSED, 25) == 2
+        assert sampler.percentile(*PROCESSED, 50, window=10) == 3.5
+
+    def test_percentile_range(self):
+        with pytest.raises(ValueError):
+            filled([1]).percentile(*PROCESSED, 101)
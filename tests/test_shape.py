@@ -0,0 +1,56 @@
+from pypuppetdb.QueryBuilder import AndOperator, EqualsOperator, InOperator
+from pypuppetdb.shape import _pql_shape, query_shape
+
+
+def test_ast():
+    query = AndOperator()
+    query.add(EqualsOperator("certname", "node1"))
+    query.add(EqualsOperator("latest_report?", True))
+    assert query_shape(query) == (
+        '["and",["=","certname","?"],["=","latest_report?","?"]]'
+    )
+
+
+def test_same_shape():
+    assert query_shape('["=", "certname", "node1"]') == query_shape(
+        '["=", "certname", "node2"]'
+    )
+    assert query_shape('["in", "certname", ["array", ["a"]]]') == query_shape(
+        '["in", "certname", ["array", ["a", "b", "c"]]]'
+    )
+
+
+def test_subquery():
+    query = InOperator("certname")
+    query.add_query(
+        '["extract", ["certname"], ["select_facts", ["=", "name", "osfamily"]]]'
+    )
+    assert query_shape(query) == (
+        '["in","certname",["extract",["certname"],'
+        '["select_facts",["=","name","?"]]]]'
+    )
+
+
+def test_pql():
+    assert query_shape('nodes[certname] { certname = "node1" limit 5 }', pql=True) == (
+        '["from","nodes",["extract",["certname"],["=","certname","?"]],'
+        '["limit","?"]]'
+    )
+
+
+def test_pql_memoized():
+    _pql_shape.cache_clear()
+    for certname in ("node1", "node2", "node3"):
+        query_shape(f'nodes {{ certname = "{certname}" and x = 1 }}', pql=True)
+    info = _pql_shape.cache_info()
+    assert (info.misses, info.hits) == (1, 2)
+
+
+def test_pql_unparsed():
+    assert query_shape("nodes { certname = 'node1' and x = 12", pql=True) == (
+        "nodes { certname = ? and x = ?"
+    )
+
+
+def test_none():
+    assert query_shape(None) is None
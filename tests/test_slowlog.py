@@ -0,0 +1,132 @@
+import json
+import logging
+
+import httpretty
+import pytest
+
+import pypuppetdb
+from pypuppetdb.hooks import RequestEvent
+from pypuppetdb.slowlog import SlowQueryLog
+
+
+def event(shape, seconds, endpoint="nodes", size=100, error=None):
+    e = RequestEvent("GET", f"http://localhost:8080/pdb/query/v4/{endpoint}", endpoint)
+    e.shape = shape
+    e.ttfb = seconds
+    e.bytes = size
+    e.error = error
+    return e
+
+
+class TestSlowQueryLog:
+    def test_grouped_by_shape(self):
+        slowlog = SlowQueryLog()
+        slowlog(event('["=","certname","?"]', 0.1))
+        slowlog(event('["=","certname","?"]', 0.3, error=ValueError()))
+        slowlog(event('["=","certname","?"]', 0.2, endpoint="facts"))
+        slowlog(event(None, 1))
+        assert len(slowlog) == 3
+
+        stats = slowlog.top(by="count")[0]
+        assert (stats.endpoint, stats.shape) == ("nodes", '["=","certname","?"]')
+        assert stats.count == 2
+        assert stats.errors == 1
+        assert stats.total == pytest.approx(0.4)
+        assert stats.mean == pytest.approx(0.2)
+        assert stats.max == 0.3
+        assert stats.bytes == 200
+        assert stats.histogram.count == 2
+
+    def test_top(self):
+        slowlog = SlowQueryLog()
+        for _ in range(5):
+            slowlog(event("often", 0.05))
+        slowlog(event("slow", 2, size=10))
+        slowlog(event("big", 0.5, size=10**6))
+        assert [s.shape for s in slowlog.top(by="total")] == ["slow", "big", "often"]
+        assert [s.shape for s in slowlog.top(1, by="count")] == ["often"]
+        assert [s.shape for s in slowlog.top(1, by="bytes")] == ["big"]
+        with pytest.raises(ValueError):
+            slowlog.top(by="nothing")
+
+    def test_capacity(self):
+        slowlog = SlowQueryLog(capacity=2)
+        slowlog(event("a", 1))
+        slowlog(event("b", 0.1))
+        slowlog(event("c", 0.5))
+        assert len(slowlog) == 2
+        assert slowlog.dropped == 1
+        assert {s.shape for s in slowlog.top()} == {"a", "c"}
+        # c inherited the count and total of b
+        (c,) = [s for s in slowlog.top() if s.shape == "c"]
+        assert c.count == 2
+        assert c.total == pytest.approx(0.6)
+        assert c.error == pytest.approx(0.1)
+        assert c.inherited == 1
+        # the mean is of the requests of c only
+        assert c.mean == pytest.approx(0.5)
+
+    def test_capacity_recurring_shape(self):
+        slowlog = SlowQueryLog(capacity=3)
+        slowlog(event("heavy1", 10))
+        slowlog(event("heavy2", 10))
+        # a shape that keeps coming back between one-off shapes
+        for i in range(40):
+            slowlog(event("recurring", 0.5))
+            slowlog(event(f"once{i}", 0.01))
+        worst = slowlog.top(1)[0]
+        assert worst.shape == "recurring"
+        assert worst.total >= 20
+        assert worst.total - worst.error <= 20
+
+    def test_commands_ignored(self):
+        slowlog = SlowQueryLog()
+        slowlog(event(None, 1, endpoint="cmd"))
+        assert len(slowlog) == 0
+
+    def test_threshold(self, caplog):
+        slowlog = SlowQueryLog(threshold=1)
+        with caplog.at_level(logging.WARNING, logger="pypuppetdb.slowlog"):
+            slowlog(event("fast", 0.5))
+            slowlog(event("slow", 1.5))
+        assert len(caplog.records) == 1
+        assert "shape slow" in caplog.records[0].getMessage()
+        assert "ttfb 1.500s" in caplog.records[0].getMessage()
+
+    def test_report(self):
+        slowlog = SlowQueryLog()
+        slowlog(event('["=","certname","?"]', 0.25))
+        slowlog(event(None, 0.1))
+        lines = slowlog.report().splitlines()
+        assert len(lines) == 3
+        assert lines[0].split()[:4] == ["count", "errors", "total", "error"]
+        assert lines[1].endswith('nodes ["=","certname","?"]')
+        assert lines[2].endswith("nodes -")
+
+    def test_reset(self):
+        slowlog = SlowQueryLog()
+        slowlog(event("a", 1))
+        slowlog.reset()
+        assert len(slowlog) == 0
+
+    def test_as_hook(self):
+        slowlog = SlowQueryLog()
+        api = pypuppetdb.connect(request_hooks=[slowlog])
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.GET,
+            "http://localhost:8080/pdb/query/v4/fact-names",
+            body=json.dumps(["a", "b"]),
+        )
+        try:
+            api._query("fact-names", query='["=", "name", "a"]')
+            api._query("fact-names", query='["=", "name", "b"]')
+        finally:
+            httpretty.disable()
+            httpretty.reset()
+        (stats,) = slowlog.top()
+        assert stats.endpoint == "fact-names"
+        assert stats.shape == '["=","name","?"]'
+        assert stats.count == 2
+        assert stats.bytes == 2 * len(json.dumps(["a", "b"]))
@@ -0,0 +1,225 @@
+import gzip
+import json
+import os
+import time
+
+import httpretty
+import pytest
+
+import pypuppetdb
+from pypuppetdb.errors import APIError
+from pypuppetdb.spool import CommandSpool
+
+
+class FakePuppetDB:
+    """Accepts commands, or answers with `status` while it is "down", and
+    for the nodes in `down`."""
+
+    def __init__(self):
+        self.received = []
+        self.status = 200
+        self.empty = False
+        self.down = set()
+
+    def respond(self, request, uri, headers):
+        if self.empty:
+            return [200, headers, "null"]
+        body = request.body
+        if request.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        certname = json.loads(body)["certname"]
+        if self.status != 200 or certname in self.down:
+            return [self.status if self.status != 200 else 503, headers, "unavailable"]
+        self.received.append(certname)
+        return [200, headers, json.dumps({"uuid": "1"})]
+
+    def __enter__(self):
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(
+            httpretty.POST, "http://localhost:8080/pdb/cmd/v1", body=self.respond
+        )
+        return self
+
+    def __exit__(self, type, value, trace):
+        httpretty.disable()
+        httpretty.reset()
+
+
+def deactivate(certname):
+    return "deactivate node", {"certname": certname}
+
+
+@pytest.fixture
+def spool_dir(tmp_path):
+    return str(tmp_path / "spool")
+
+
+class TestCommandSpool:
+    def test_drain_in_order(self, api, spool_dir):
+        with FakePuppetDB() as puppetdb, CommandSpool(api, spool_dir) as spool:
+            for i in range(10):
+                spool.submit(*deactivate(f"node{i}"))
+            assert spool.drain() == 10
+            assert spool.backlog() == 0
+        assert puppetdb.received == [f"node{i}" for i in range(10)]
+        assert spool.submitted == spool.delivered == 10
+
+    def test_survives_restart(self, api, spool_dir):
+        with CommandSpool(api, spool_dir) as spool:
+            spool.submit(*deactivate("node1"))
+            spool.submit(*deactivate("node2"))
+        with FakePuppetDB() as puppetdb, CommandSpool(api, spool_dir) as spool:
+            assert spool.drain() == 2
+        assert puppetdb.received == ["node1", "node2"]
+
+        # nothing is sent twice
+        with FakePuppetDB() as puppetdb, CommandSpool(api, spool_dir) as spool:
+            assert spool.drain() == 0
+
+    def test_partial_record(self, api, spool_dir):
+        with CommandSpool(api, spool_dir) as spool:
+            spool.submit(*deactivate("node1"))
+            spool.submit(*deactivate("node2"))
+            path = spool._path(spool._segment)
+        # the process died while writing the second record
+        size = os.path.getsize(path)
+        with open(path, "rb+") as f:
+            f.truncate(size - 5)
+        with FakePuppetDB() as puppetdb, CommandSpool(api, spool_dir) as spool:
+            spool.submit(*deactivate("node3"))
+            spool.drain()
+        assert puppetdb.received == ["node1", "node3"]
+
+    def test_segments(self, api, spool_dir):
+        with FakePuppetDB() as puppetdb, CommandSpool(
+            api, spool_dir, segment_size=100
+        ) as spool:
+            for i in range(5):
+                spool.submit(*deactivate(f"node{i}"))
+            assert len(spool._segments()) == 5
+            spool.drain()
+            # only the segment being written to is left
+            assert spool._segments() == [spool._segment]
+        assert puppetdb.received == [f"node{i}" for i in range(5)]
+
+    def test_one_command_per_node_per_batch(self, api, spool_dir):
+        with CommandSpool(api, spool_dir) as spool:
+            spool.submit(*deactivate("node1"))
+            spool.submit(*deactivate("node2"))
+            spool.submit(*deactivate("node1"))
+            batch = spool._read_batch()
+        assert [encoded.certname for encoded, _, _ in batch] == ["node1", "node2"]
+
+    def test_retry(self, api, spool_dir):
+        with FakePuppetDB() as puppetdb, CommandSpool(
+            api, spool_dir, retry_interval=0.01
+        ) as spool:
+            spool.submit(*deactivate("node1"))
+            puppetdb.status = 503
+            spool.start()
+            time.sleep(0.05)
+            assert puppetdb.received == []
+            puppetdb.status = 200
+            deadline = time.monotonic() + 5
+            while spool.delivered < 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        assert puppetdb.received == ["node1"]
+        assert spool.retries >= 1
+
+    def test_rejected(self, api, spool_dir):
+        with FakePuppetDB() as puppetdb, CommandSpool(api, spool_dir) as spool:
+            spool.submit(*deactivate("node1"))
+            puppetdb.status = 400
+            assert spool.drain(timeout=5) == 1
+        assert spool.rejected == 1
+        assert spool.delivered == 0
+        assert spool.dead == 1
+        [(encoded, error)] = list(spool.dead_letters())
+        assert encoded.certname == "node1"
+        assert "400" in error
+
+    def test_dead_letter_after_attempts(self, api, spool_dir):
+        with FakePuppetDB() as puppetdb, CommandSpool(
+            api, spool_dir, retry_interval=0.01, max_attempts=3
+        ) as spool:
+            spool.submit(*deactivate("node1"))
+            spool.submit(*deactivate("node2"))
+            # an empty response is not PuppetDB being down
+            puppetdb.empty = True
+            assert spool.drain(timeout=5) == 2
+            assert spool.backlog() == 0
+            assert len(httpretty.latest_requests()) >= 6
+        assert spool.dead == 2
+        assert spool.rejected == 0
+        assert [e.certname for e, _ in spool.dead_letters()] == ["node1", "node2"]
+        assert puppetdb.received == []
+
+    def test_partial_failure_not_sent_again(self, api, spool_dir):
+        with FakePuppetDB() as puppetdb:
+            with CommandSpool(api, spool_dir, retry_interval=10) as spool:
+                spool.submit(*deactivate("node1"))
+                spool.submit(*deactivate("node2"))
+                puppetdb.down.add("node1")
+                assert spool.drain(timeout=0) == 1
+            assert puppetdb.received == ["node2"]
+
+            puppetdb.down.clear()
+            with CommandSpool(api, spool_dir) as spool:
+                assert spool.drain(timeout=5) == 1
+                assert spool.backlog() == 0
+        assert puppetdb.received == ["node2", "node1"]
+
+    def test_attempts_survive_restart(self, api, spool_dir):
+        with FakePuppetDB() as puppetdb:
+            puppetdb.empty = True
+            with CommandSpool(api, spool_dir, retry_interval=10) as spool:
+                spool.submit(*deactivate("node1"))
+            for _ in range(2):
+                with CommandSpool(
+                    api, spool_dir, retry_interval=10, max_attempts=3
+                ) as spool:
+                    assert spool.drain(timeout=0) == 0
+            with CommandSpool(
+                api, spool_dir, retry_interval=10, max_attempts=3
+            ) as spool:
+                assert spool.drain(timeout=0) == 1
+                # the third attempt, with the two of earlier runs
+                assert spool.dead == 1
+
+    def test_background_worker(self, api, spool_dir):
+        # httpretty can't serve requests from several threads at once
+        with FakePuppetDB() as puppetdb, CommandSpool(
+            api, spool_dir, concurrency=1
+        ) as spool:
+            spool.start()
+            for i in range(20):
+                spool.submit(*deactivate(f"node{i}"))
+            deadline = time.monotonic() + 5
+            while spool.delivered < 20 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        assert puppetdb.received == [f"node{i}" for i in range(20)]
+
+    def test_drain_timeout(self, api, spool_dir):
+        with FakePuppetDB() as puppetdb, CommandSpool(
+            api, spool_dir, retry_interval=0.01
+        ) as spool:
+            spool.submit(*deactivate("node1"))
+            puppetdb.status = 503
+            assert spool.drain(timeout=0.05) == 0
+            assert spool.backlog() > 0
+
+    def test_compressed(self, spool_dir):
+        api = pypuppetdb.connect(compress_commands=True)
+        payload = {"certname": "node1", "values": {f"fact{i}": i for i in range(200)}}
+        with FakePuppetDB(), CommandSpool(api, spool_dir) as spool:
+            spool.submit("replace facts", payload)
+            assert spool.drain(timeout=5) == 1
+            request = httpretty.last_request()
+        assert request.headers["Content-Encoding"] == "gzip"
+
+    def test_bad_command(self, api, spool_dir):
+        with CommandSpool(api, spool_dir) as spool:
+            with pytest.raises(APIError):
+                spool.submit("incorrect command", {"certname": "node1"})
+            assert spool.submitted == 0
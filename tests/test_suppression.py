@@ -0,0 +1,143 @@
+import json
+from unittest import mock
+
+import httpretty
+import pytest
+import requests
+
+import pypuppetdb
+from pypuppetdb.api.command import EncodedCommand
+from pypuppetdb.suppression import FactsSuppressor, facts_body, facts_digest
+
+
+def facts(timestamp="2023-01-01T00:00:00.000Z", **values):
+    return {
+        "certname": "node1",
+        "environment": "production",
+        "producer_timestamp": timestamp,
+        "producer": "puppet.example.com",
+        "values": values or {"kernel": "Linux"},
+    }
+
+
+@pytest.fixture
+def cmd():
+    received = []
+
+    def respond(request, uri, headers):
+        received.append(json.loads(request.body))
+        return [200, headers, json.dumps({"uuid": "1"})]
+
+    httpretty.reset()
+    httpretty.enable()
+    httpretty.register_uri(
+        httpretty.POST, "http://localhost:8080/pdb/cmd/v1", body=respond
+    )
+    yield received
+    httpretty.disable()
+    httpretty.reset()
+
+
+class TestFactsDigest:
+    def test_ignores_timestamp(self):
+        assert facts_digest(facts("2023-01-01T00:00:00.000Z")) == facts_digest(
+            facts("2023-01-02T00:00:00.000Z")
+        )
+
+    def test_ignores_key_order(self):
+        payload = facts()
+        reordered = dict(reversed(list(payload.items())))
+        assert facts_digest(payload) == facts_digest(reordered)
+
+    def test_values(self):
+        assert facts_digest(facts(kernel="Linux")) != facts_digest(
+            facts(kernel="Darwin")
+        )
+
+    def test_body(self):
+        payload = facts()
+        body, digest = facts_body(payload)
+        assert json.loads(body) == payload
+        assert digest == facts_digest(payload)
+
+        del payload["producer_timestamp"]
+        body, digest = facts_body(payload)
+        assert json.loads(body) == payload
+        assert digest == facts_digest(payload)
+
+
+class TestFactsSuppressor:
+    def test_memory(self):
+        suppressor = FactsSuppressor()
+        assert suppressor.should_send("node1", "a")
+        suppressor.record("node1", "a")
+        assert not suppressor.should_send("node1", "a")
+        assert suppressor.should_send("node1", "b")
+        assert suppressor.checked == 3
+        assert suppressor.suppressed == 1
+        assert suppressor.changed == 2
+
+    def test_keepalive(self):
+        suppressor = FactsSuppressor(keepalive=0)
+        suppressor.record("node1", "a")
+        assert suppressor.should_send("node1", "a")
+        assert suppressor.keepalives == 1
+
+    def test_no_keepalive(self):
+        suppressor = FactsSuppressor(keepalive=None)
+        suppressor.record("node1", "a")
+        assert not suppressor.should_send("node1", "a")
+
+    def test_disk(self, tmp_path):
+        path = str(tmp_path / "facts.db")
+        FactsSuppressor(path).record("node1", "a")
+        # remembered across instances, eg. runs of a fact pusher
+        suppressor = FactsSuppressor(path)
+        assert not suppressor.should_send("node1", "a")
+        suppressor.forget("node1")
+        assert suppressor.should_send("node1", "a")
+
+    def test_forget_all(self):
+        suppressor = FactsSuppressor()
+        suppressor.record("node1", "a")
+        suppressor.record("node2", "a")
+        suppressor.forget()
+        assert suppressor.should_send("node1", "a")
+        assert suppressor.should_send("node2", "a")
+
+
+class TestCommandSuppression:
+    def test_unchanged_facts(self, cmd):
+        suppressor = FactsSuppressor()
+        api = pypuppetdb.connect(facts_suppressor=suppressor)
+        assert api.command("replace facts", facts("2023-01-01T00:00:00.000Z"))
+        assert api.command("replace facts", facts("2023-01-02T00:00:00.000Z")) is None
+        assert api.command("replace facts", facts(kernel="Darwin"))
+        assert len(cmd) == 2
+        assert suppressor.suppressed == 1
+
+    def test_unchanged_facts_are_not_encoded(self, cmd):
+        api = pypuppetdb.connect(facts_suppressor=FactsSuppressor())
+        api.command("replace facts", facts())
+        with mock.patch.object(EncodedCommand, "__init__") as encoded:
+            assert api.command("replace facts", facts()) is None
+        encoded.assert_not_called()
+        assert cmd == [facts()]
+
+    def test_failed_submission_is_not_recorded(self, cmd):
+        suppressor = FactsSuppressor()
+        api = pypuppetdb.connect(facts_suppressor=suppressor)
+        httpretty.register_uri(
+            httpretty.POST, "http://localhost:8080/pdb/cmd/v1", status=503
+        )
+        with pytest.raises(requests.exceptions.HTTPError):
+            api.command("replace facts", facts())
+        assert suppressor.should_send("node1", facts_digest(facts()))
+
+    def test_deactivate_forgets(self, cmd):
+        suppressor = FactsSuppressor()
+        api = pypuppetdb.connect(facts_suppressor=suppressor)
+        api.command("replace facts", facts())
+        api.command("deactivate node", {"certname": "node1"})
+        api.command("replace facts", facts())
+        assert len(cmd) == 3
@@ -42,3 +42,12 @@ class TestJSONToDateTime:
     def test_json_to_datetime_invalid(self):
         with pytest.raises(ValueError):
             pypuppetdb.utils.json_to_datetime("2013-08-0109:57:00.000Z")
+
+
+class TestDateTimeToJSON:
+    """Test the datetime_to_json function."""
+
+    def test_datetime_to_json(self):
+        json_datetime = "2013-08-01T09:57:00.123Z"
+        python_datetime = pypuppetdb.utils.json_to_datetime(json_datetime)
+        assert pypuppetdb.utils.datetime_to_json(python_datetime) == json_datetime